@@ -0,0 +1,453 @@
+"""
+Avaliacao distribuida da funcao objetivo: servidores de avaliacao
+(processos locais ou em outras maquinas) carregam os dados de entrada uma
+unica vez, da planilha ou da sua instancia compilada (instancia.py), com
+o mesmo presolve do algoritmo genetico (presolve.py), e recebem dele
+lotes de genes para avaliar, devolvendo as matrizes de fitness.
+
+    - servidor: executa_servidor_avaliacao(endereco, ...), aguarda a
+      conexao do algoritmo genetico e avalia os lotes recebidos;
+    - cliente: AvaliadorDistribuido(enderecos, ...), com o metodo map
+      compativel com o toolbox do DEAP (toolbox.register("map", ...)).
+
+O transporte e configuravel:
+    - "conexao": multiprocessing.connection (Listener/Client), autenticada
+      com a chave da variavel de ambiente RCA_CHAVE_AVALIACAO (ou do
+      parametro chave). Unico transporte para servidores remotos;
+    - "socket": sockets TCP simples, com mensagens prefixadas pelo tamanho.
+      Sem autenticacao, e por isso restrito a enderecos locais (loopback).
+      As mensagens sao gravadas em JSON e no formato .npy, sem pickle.
+
+O cliente limita o numero de lotes pendentes por servidor (controle de
+fluxo), e reenvia para outro servidor os lotes de um servidor que falhou.
+Caso todos os servidores falhem, os lotes restantes sao avaliados
+localmente.
+
+"""
+import os
+import io
+import json
+import socket
+import struct
+import ipaddress
+import time
+import multiprocessing
+from multiprocessing import connection
+
+import numpy as np
+
+import funcao_objetivo as f_obj
+import presolve
+
+# Definicao de constantes e parametros
+TRANSPORTE_PADRAO = "conexao"  # "conexao" ou "socket"
+# variavel de ambiente com a chave de autenticacao do transporte "conexao".
+# A chave nao e gravada na configuracao, nas metricas nem no checkpoint
+VARIAVEL_CHAVE_AUTENTICACAO = "RCA_CHAVE_AVALIACAO"
+# tamanho maximo de cada parte de uma mensagem do transporte "socket"
+TAMANHO_MAXIMO_CABECALHO = 1 << 10  # bytes
+TAMANHO_MAXIMO_MATRIZ = 1 << 30  # bytes
+TAMANHO_LOTE = 8
+MAX_LOTES_PENDENTES = 2
+# tempo maximo (segundos) sem resposta de um servidor com lotes pendentes.
+# O servidor que nao responde (ex.: travado, sem desconectar) e tratado
+# como falho, e os seus lotes sao reenviados aos demais
+TEMPO_MAXIMO_LOTE = 60.0
+PORTA_INICIAL = 6000
+TEMPO_ESPERA_CONEXAO = 10.0
+
+
+"""
+classe: ConexaoSocket / ServidorSocket
+
+  Objetivo: Transporte por sockets TCP simples, com a mesma interface da
+            multiprocessing.connection (send, recv, close, fileno e
+            accept), para que o cliente e o servidor usem os dois
+            transportes da mesma forma.
+            Cada mensagem e gravada como 2 x 8 bytes com os tamanhos,
+            seguidos de um cabecalho JSON (tipo da mensagem e id do lote)
+            e da matriz numpy da mensagem, no formato .npy. Nenhuma parte
+            e lida com pickle, que executaria codigo recebido pela rede.
+            O transporte nao tem autenticacao, e so aceita enderecos
+            locais.
+"""
+class ConexaoSocket:
+    def __init__(self, sock):
+        self.sock = sock
+
+    def send(self, mensagem):
+        matriz = b""
+        if len(mensagem) > 2:
+            buffer = io.BytesIO()
+            np.save(buffer, np.asarray(mensagem[2]), allow_pickle=False)
+            matriz = buffer.getvalue()
+        cabecalho = json.dumps(list(mensagem[0:2])).encode("utf-8")
+        self.sock.sendall(struct.pack("!QQ", len(cabecalho), len(matriz)) +
+                          cabecalho + matriz)
+
+    def recv(self):
+        tamanho_cabecalho, tamanho_matriz = \
+            struct.unpack("!QQ", self._recebe_bytes(16))
+        if tamanho_cabecalho > TAMANHO_MAXIMO_CABECALHO or \
+                tamanho_matriz > TAMANHO_MAXIMO_MATRIZ:
+            raise OSError("mensagem invalida")
+        try:
+            mensagem = json.loads(self._recebe_bytes(tamanho_cabecalho))
+            if tamanho_matriz > 0:
+                mensagem.append(np.load(
+                    io.BytesIO(self._recebe_bytes(tamanho_matriz)),
+                    allow_pickle=False))
+        except (ValueError, AttributeError) as erro:
+            raise OSError("mensagem invalida: %s" % erro)
+        return tuple(mensagem)
+
+    def _recebe_bytes(self, tamanho):
+        partes = []
+        while tamanho > 0:
+            parte = self.sock.recv(min(tamanho, 1 << 20))
+            if not parte:
+                raise EOFError("conexao encerrada")
+            partes.append(parte)
+            tamanho -= len(parte)
+        return b"".join(partes)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        self.sock.close()
+
+
+class ServidorSocket:
+    def __init__(self, endereco):
+        verifica_endereco_local(endereco)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(endereco)
+        self.sock.listen()
+
+    def accept(self):
+        sock, endereco = self.sock.accept()
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return ConexaoSocket(sock)
+
+    def close(self):
+        self.sock.close()
+
+
+def verifica_endereco_local(endereco):
+    # o transporte "socket" nao tem autenticacao: aceita somente enderecos
+    # de loopback, que nao sao acessiveis por outras maquinas
+    host, porta = endereco
+    try:
+        enderecos = socket.getaddrinfo(host, porta, type=socket.SOCK_STREAM)
+    except socket.gaierror as erro:
+        raise ValueError("endereco invalido %s: %s" % (host, erro))
+    for familia, tipo, protocolo, nome, endereco_ip in enderecos:
+        if not ipaddress.ip_address(endereco_ip[0]).is_loopback:
+            raise ValueError("o transporte \"socket\" nao tem autenticacao "
+                             "e aceita somente enderecos locais (%s). Use o "
+                             "transporte \"conexao\" para servidores "
+                             "remotos" % host)
+    return
+
+
+def chave_autenticacao(chave=None):
+    # chave do transporte "conexao": a informada, ou a da variavel de
+    # ambiente VARIAVEL_CHAVE_AUTENTICACAO
+    if chave is None:
+        chave = os.environ.get(VARIAVEL_CHAVE_AUTENTICACAO)
+    if not chave:
+        raise ValueError("defina a chave de autenticacao da avaliacao "
+                         "distribuida na variavel de ambiente %s"
+                         % VARIAVEL_CHAVE_AUTENTICACAO)
+    if isinstance(chave, str):
+        chave = chave.encode("utf-8")
+    return chave
+
+
+def abre_servidor(transporte, endereco, chave=None):
+    # cria o objeto que aguarda conexoes no transporte escolhido
+    if transporte == "socket":
+        return ServidorSocket(endereco)
+    return connection.Listener(endereco, authkey=chave_autenticacao(chave))
+
+
+def conecta(transporte, endereco, chave=None,
+            tempo_espera=TEMPO_ESPERA_CONEXAO):
+    # conecta ao servidor, aguardando ate tempo_espera segundos para que
+    # o servidor esteja disponivel
+    if transporte == "socket":
+        verifica_endereco_local(endereco)
+    else:
+        chave = chave_autenticacao(chave)
+    limite = time.monotonic() + tempo_espera
+    while True:
+        try:
+            if transporte == "socket":
+                sock = socket.create_connection(endereco)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                return ConexaoSocket(sock)
+            return connection.Client(endereco, authkey=chave)
+        except ConnectionRefusedError:
+            if time.monotonic() > limite:
+                raise
+            time.sleep(0.1)
+
+
+"""
+funcao: executa_servidor_avaliacao(endereco, transporte, chave, planilha,
+                                   aba_projetos, aba_contratos)
+
+  Objetivo: Carrega os dados de entrada uma unica vez e atende as conexoes
+            do algoritmo genetico, avaliando os lotes de genes recebidos.
+
+            Mensagens recebidas:
+              ("avaliar", id_lote, genes): genes e uma matriz numpy com um
+                                           individuo por linha;
+              ("fim",): encerra a conexao atual.
+            Mensagem enviada:
+              ("resultado", id_lote, fitness): matriz numpy com o fitness
+                                               de cada individuo do lote.
+
+  Parametros:
+             endereco: tuple (host, porta) do servidor;
+             transporte: "conexao" ou "socket" (somente enderecos locais);
+             chave: chave de autenticacao do transporte "conexao". None
+                    le a variavel de ambiente VARIAVEL_CHAVE_AUTENTICACAO;
+             planilha, aba_projetos, aba_contratos: planilha de entrada.
+                        Basta existir a instancia compilada da planilha;
+             numero_conexoes: numero de conexoes atendidas antes de
+                              encerrar o servidor. None atende
+                              indefinidamente.
+
+  Retorna:
+"""
+def executa_servidor_avaliacao(endereco, transporte=TRANSPORTE_PADRAO,
+                               chave=None,
+                               planilha="Dados RCA.xlsx",
+                               aba_projetos="projetos a distribuir",
+                               aba_contratos="contratos",
+                               numero_conexoes=None):
+    # usa a instancia compilada da planilha, que pode ser copiada para
+    # os servidores remotos no lugar da planilha. O presolve e o mesmo do
+    # cliente, para que os indices dos contratos nos genes coincidam
+    df_projetos, df_detalhes_projetos, projetos_excluidos, df_contratos, \
+        df_id_contratos, _ = presolve.le_dados_otimizacao(
+            planilha, aba_projetos, aba_contratos)
+    # os servidores nao gravam os individuos validos em disco
+    f_obj.GRAVA_INDIVIDUOS_VALIDOS = False
+
+    servidor = abre_servidor(transporte, endereco, chave)
+    atendidas = 0
+    while numero_conexoes is None or atendidas < numero_conexoes:
+        conexao = servidor.accept()
+        atendidas += 1
+        try:
+            while True:
+                mensagem = conexao.recv()
+                if mensagem[0] == "fim":
+                    break
+                tipo_mensagem, id_lote, genes = mensagem
+                fitness = avalia_lote(genes, df_id_contratos, df_contratos,
+                                      df_projetos)
+                conexao.send(("resultado", id_lote, fitness))
+        except (EOFError, OSError, ValueError):
+            # o cliente encerrou a conexao sem avisar, ou enviou uma
+            # mensagem invalida
+            pass
+        conexao.close()
+
+    servidor.close()
+    return
+
+
+def avalia_lote(genes, df_id_contratos, df_contratos, df_projetos):
+    # avalia com a funcao objetivo cada individuo (linha) da matriz de genes
+    fitness = [f_obj.funcao_objetivo(list(linha), df_id_contratos,
+                                     df_contratos, df_projetos)
+               for linha in genes.tolist()]
+    return np.array(fitness, dtype=np.float64)
+
+
+"""
+classe: AvaliadorDistribuido(enderecos, transporte, chave, tamanho_lote,
+                             max_lotes_pendentes, tempo_maximo_lote)
+
+  Objetivo: Cliente dos servidores de avaliacao. O metodo map substitui o
+            map do toolbox do DEAP:
+
+                avaliador = AvaliadorDistribuido([("localhost", 6000)])
+                toolbox.register("map", avaliador.map)
+
+            Os individuos sao divididos em lotes de tamanho_lote, enviados
+            aos servidores com no maximo max_lotes_pendentes lotes
+            aguardando resposta em cada servidor. Os lotes de um servidor
+            que falhou, ou que ficou tempo_maximo_lote segundos sem
+            responder, sao reenviados aos demais servidores.
+"""
+class AvaliadorDistribuido:
+    def __init__(self, enderecos, transporte=TRANSPORTE_PADRAO,
+                 chave=None, tamanho_lote=TAMANHO_LOTE,
+                 max_lotes_pendentes=MAX_LOTES_PENDENTES,
+                 tempo_maximo_lote=TEMPO_MAXIMO_LOTE):
+        self.tamanho_lote = tamanho_lote
+        self.max_lotes_pendentes = max_lotes_pendentes
+        self.tempo_maximo_lote = tempo_maximo_lote
+        self.conexoes = [conecta(transporte, endereco, chave)
+                         for endereco in enderecos]
+        self.lotes_reenviados = 0
+
+    def map(self, func, individuos):
+        # a funcao de avaliacao e executada nos servidores; func so e usada
+        # localmente caso todos os servidores tenham falhado
+        individuos = list(individuos)
+        if len(individuos) == 0:
+            return []
+
+        genes = np.array([ind[:] for ind in individuos], dtype=np.int32)
+        lotes = [(inicio, genes[inicio:inicio + self.tamanho_lote])
+                 for inicio in range(0, len(genes), self.tamanho_lote)]
+        a_enviar = list(range(len(lotes)))
+        pendentes = {conexao: [] for conexao in self.conexoes}
+        # prazo da proxima resposta de cada servidor com lotes pendentes
+        prazos = {}
+        resultados = [None] * len(lotes)
+        recebidos = 0
+
+        while recebidos < len(lotes):
+            if len(pendentes) == 0:
+                # todos os servidores falharam: avalia localmente
+                for id_lote in a_enviar:
+                    inicio, lote = lotes[id_lote]
+                    resultados[id_lote] = \
+                        [func(ind) for ind in
+                         individuos[inicio:inicio + len(lote)]]
+                    recebidos += 1
+                a_enviar = []
+                break
+
+            # envia lotes aos servidores com capacidade disponivel
+            for conexao in list(pendentes):
+                while len(a_enviar) > 0 and \
+                        len(pendentes[conexao]) < self.max_lotes_pendentes:
+                    id_lote = a_enviar.pop(0)
+                    try:
+                        conexao.send(("avaliar", id_lote, lotes[id_lote][1]))
+                    except (EOFError, OSError):
+                        a_enviar.insert(0, id_lote)
+                        a_enviar = a_enviar + \
+                            self._remove_servidor(conexao, pendentes)
+                        break
+                    pendentes[conexao].append(id_lote)
+                    prazos.setdefault(conexao, time.monotonic() +
+                                      self.tempo_maximo_lote)
+
+            # aguarda a resposta de algum servidor, ate o menor prazo
+            ocupadas = [c for c in pendentes if len(pendentes[c]) > 0]
+            if len(ocupadas) == 0:
+                continue
+            espera = max(0., min(prazos[c] for c in ocupadas) -
+                         time.monotonic())
+            prontas = connection.wait(ocupadas, espera)
+            for conexao in ocupadas:
+                if conexao not in prontas and \
+                        time.monotonic() >= prazos[conexao]:
+                    # servidor sem resposta no prazo: tratado como falho
+                    prazos.pop(conexao, None)
+                    a_enviar = a_enviar + \
+                        self._remove_servidor(conexao, pendentes)
+            for conexao in prontas:
+                try:
+                    tipo_mensagem, id_lote, fitness = conexao.recv()
+                except (EOFError, OSError):
+                    prazos.pop(conexao, None)
+                    a_enviar = a_enviar + \
+                        self._remove_servidor(conexao, pendentes)
+                    continue
+                pendentes[conexao].remove(id_lote)
+                # o prazo recomeca a cada resposta
+                if len(pendentes[conexao]) > 0:
+                    prazos[conexao] = time.monotonic() + \
+                        self.tempo_maximo_lote
+                else:
+                    prazos.pop(conexao, None)
+                if resultados[id_lote] is None:
+                    resultados[id_lote] = [tuple(f) for f in fitness]
+                    recebidos += 1
+
+        self.conexoes = list(pendentes)
+        return [fit for lote in resultados for fit in lote]
+
+    def _remove_servidor(self, conexao, pendentes):
+        # remove o servidor que falhou, e devolve os lotes pendentes nele
+        # para serem reenviados
+        lotes = pendentes.pop(conexao)
+        self.lotes_reenviados += len(lotes)
+        try:
+            conexao.close()
+        except OSError:
+            pass
+        print("Servidor de avaliacao falhou. Lotes reenviados: %i"
+              % len(lotes))
+        return lotes
+
+    def fecha(self):
+        # encerra as conexoes com os servidores
+        for conexao in self.conexoes:
+            try:
+                conexao.send(("fim",))
+                conexao.close()
+            except (EOFError, OSError):
+                pass
+        self.conexoes = []
+
+
+"""
+funcao: inicia_servidores_locais(numero, transporte, porta_inicial, ...)
+
+  Objetivo: Inicia numero servidores de avaliacao em processos locais,
+            nas portas porta_inicial, porta_inicial + 1, ...
+            Simula em uma unica maquina os servidores remotos.
+
+  Retorna:
+          processos: lista dos processos iniciados;
+          enderecos: lista dos enderecos (host, porta) dos servidores.
+"""
+def inicia_servidores_locais(numero, transporte=TRANSPORTE_PADRAO,
+                             porta_inicial=PORTA_INICIAL,
+                             chave=None,
+                             planilha="Dados RCA.xlsx",
+                             aba_projetos="projetos a distribuir",
+                             aba_contratos="contratos"):
+    if transporte != "socket":
+        chave = chave_autenticacao(chave)
+    contexto = multiprocessing.get_context()
+    processos = []
+    enderecos = []
+    for i in range(numero):
+        endereco = ("localhost", porta_inicial + i)
+        p = contexto.Process(target=executa_servidor_avaliacao,
+                             args=(endereco, transporte, chave, planilha,
+                                   aba_projetos, aba_contratos),
+                             daemon=True)
+        p.start()
+        processos.append(p)
+        enderecos.append(endereco)
+    return processos, enderecos
+
+
+def main():
+    # definir rotinas de testes para as funcoes do modulo
+
+    # ### TESTE ### avaliacao com 3 servidores locais
+    # processos, enderecos = inicia_servidores_locais(3)
+    # avaliador = AvaliadorDistribuido(enderecos)
+    # fitnesses = avaliador.map(toolbox.evaluate, pop)
+    # avaliador.fecha()
+    # ### TESTE ###
+    return
+
+
+if __name__ == "__main__":
+    main()
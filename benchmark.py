@@ -0,0 +1,416 @@
+"""
+Benchmark do programa de otimizacao do RCA.
+
+Executa o algoritmo genetico (distribuicao.executa_otimizacao), com semente
+fixa, na planilha de entrada e em instancias sinteticas
+(gerador_instancias.py), cada uma em um processo novo. Para cada instancia
+sao medidos:
+    - avaliacoes por segundo e geracoes por segundo;
+    - tempo ate o primeiro individuo valido (todas as regras atendidas);
+    - tempo ate atingir a performance alvo (a performance final da base
+      gravada, ou a propria performance final);
+    - pico de memoria do processo e performance final.
+
+Os resultados sao gravados em JSON como base de comparacao. No modo de
+comparacao, as metricas piores que a base alem da tolerancia sao
+reportadas como regressoes.
+
+Os micro benchmarks medem o tempo de funcao_objetivo, cruzamento_metodo_1,
+mutacao_metodo_1 e 2, selectthebest, elimina_duplicados e clone para
+diferentes numeros de projetos, e estimam o expoente do crescimento do
+tempo com o numero de projetos (tempo ~ projetos ^ expoente).
+
+Uso:
+    python benchmark.py gravar      grava a base de comparacao
+    python benchmark.py comparar    compara com a base gravada
+    python benchmark.py micro       executa os micro benchmarks
+
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import statistics
+import multiprocessing
+import concurrent.futures
+
+import numpy as np
+
+import distribuicao
+import presolve
+import gerador_instancias
+import cruzamento
+import mutacao
+import selecao
+import funcao_objetivo as f_obj
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+# Definicao de constantes e parametros
+NOME_ARQUIVO_BASE = "benchmark_base.json"
+DIRETORIO_INSTANCIAS = "benchmark_instancias"
+SEMENTE = 1
+NUMERO_GERACOES_BENCHMARK = 20
+TAMANHO_POPULACAO_BENCHMARK = 30
+TEMPO_MAXIMO_BENCHMARK = 600  # segundos por instancia
+TOLERANCIA = 0.10  # 10%
+
+# instancias do benchmark: a planilha de entrada e instancias sinteticas
+INSTANCIAS_BENCHMARK = [
+    {"nome": "dados_rca"},
+    {"nome": "sintetica_1000_15", "projetos": 1000, "contratos": 15},
+    {"nome": "sintetica_5000_30", "projetos": 5000, "contratos": 30},
+]
+
+# micro benchmarks
+TAMANHOS_MICRO = [100, 1000, 10000]  # numero de projetos
+NUMERO_CONTRATOS_MICRO = 15
+REPETICOES_MICRO = 10
+
+# metricas comparadas com a base: True se maior e melhor
+METRICAS_COMPARADAS = {"avaliacoes_por_segundo": True,
+                       "geracoes_por_segundo": True,
+                       "tempo_viavel": False,
+                       "tempo_alvo": False,
+                       "pico_memoria_mb": False,
+                       "performance_final": False}
+
+
+def prepara_instancia(configuracao):
+    # devolve a planilha e as abas da instancia, gerando a instancia
+    # sintetica caso ainda nao exista
+    if "projetos" not in configuracao:
+        return (distribuicao.PLANILHA_DADOS_ENTRADA,
+                distribuicao.NOME_ABA_ENTRADA_VALORES_A_DISTRIBUIR,
+                distribuicao.NOME_ABA_ENTRADA_CONTRATOS)
+
+    planilha = os.path.join(DIRETORIO_INSTANCIAS,
+                            configuracao["nome"] + ".xlsx")
+    if not os.path.exists(planilha):
+        os.makedirs(DIRETORIO_INSTANCIAS, exist_ok=True)
+        df_projetos, df_contratos = gerador_instancias.gera_instancia(
+            configuracao["projetos"], configuracao["contratos"],
+            semente=SEMENTE)
+        gerador_instancias.grava_instancia_sintetica(planilha, df_projetos,
+                                                     df_contratos)
+    return (planilha, gerador_instancias.NOME_ABA_PROJETOS,
+            gerador_instancias.NOME_ABA_CONTRATOS)
+
+
+def pico_memoria_mb():
+    # pico de memoria residente do processo (linux: KB, macos: bytes)
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        pico = pico / 1024
+    return pico / 1024
+
+
+"""
+funcao: executa_instancia(configuracao, semente, numero_geracoes,
+                          tamanho_populacao, tempo_maximo)
+
+  Objetivo: Executa o algoritmo genetico em uma instancia e mede o
+            desempenho. Executada em um processo novo para cada instancia.
+
+  Retorna:
+          dicionario com as metricas da instancia e o historico
+          [(tempo, melhor performance)] de cada geracao.
+"""
+def executa_instancia(configuracao, semente, numero_geracoes,
+                      tamanho_populacao, tempo_maximo):
+    f_obj.GRAVA_INDIVIDUOS_VALIDOS = False
+    planilha, aba_projetos, aba_contratos = prepara_instancia(configuracao)
+    df_projetos, df_detalhes_projetos, projetos_excluidos, df_contratos, \
+        df_id_contratos, _ = presolve.le_dados_otimizacao(
+            planilha, aba_projetos, aba_contratos)
+
+    registro = []
+    inicio = time.perf_counter()
+    pop, historico = distribuicao.executa_otimizacao(
+        df_id_contratos, df_contratos, df_projetos, projetos_excluidos,
+        tamanho_populacao=tamanho_populacao, numero_geracoes=numero_geracoes,
+        tempo_maximo=tempo_maximo, semente=semente, registro=registro)
+    tempo = time.perf_counter() - inicio
+
+    # a populacao inicial tambem e avaliada
+    avaliacoes = tamanho_populacao + sum(r["avaliacoes"] for r in registro)
+    tempo_viavel = next((r["tempo"] for r in registro if r["valido"]), None)
+    return {"projetos": len(df_projetos),
+            "contratos": len(df_id_contratos) - 1,
+            "geracoes": len(registro),
+            "tempo": tempo,
+            "avaliacoes": avaliacoes,
+            "avaliacoes_por_segundo": avaliacoes / tempo,
+            "geracoes_por_segundo": len(registro) / tempo,
+            "tempo_viavel": tempo_viavel,
+            "performance_final": registro[-1]["melhor"] if registro
+            else math.nan,
+            "pico_memoria_mb": pico_memoria_mb(),
+            "historico": [(r["tempo"], r["melhor"]) for r in registro]}
+
+
+def tempo_ate_alvo(historico, alvo):
+    # tempo da primeira geracao com performance igual ou melhor que o alvo
+    return next((tempo for tempo, melhor in historico if melhor <= alvo),
+                None)
+
+
+"""
+funcao: executa_benchmark(instancias, base, semente, numero_geracoes,
+                          tamanho_populacao, tempo_maximo)
+
+  Objetivo: Executa o benchmark em todas as instancias, cada uma em um
+            processo novo (para medir o pico de memoria de cada uma).
+
+  Parametros:
+             instancias: lista de configuracoes (INSTANCIAS_BENCHMARK);
+             base: resultados gravados, para calcular o tempo ate a
+                   performance alvo. None usa a propria performance final.
+
+  Retorna:
+          dicionario {nome da instancia: metricas}
+"""
+def executa_benchmark(instancias=INSTANCIAS_BENCHMARK, base=None,
+                      semente=SEMENTE,
+                      numero_geracoes=NUMERO_GERACOES_BENCHMARK,
+                      tamanho_populacao=TAMANHO_POPULACAO_BENCHMARK,
+                      tempo_maximo=TEMPO_MAXIMO_BENCHMARK):
+    contexto = multiprocessing.get_context("spawn")
+    resultados = {}
+    for configuracao in instancias:
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=1, mp_context=contexto) as executor:
+            resultado = executor.submit(executa_instancia, configuracao,
+                                        semente, numero_geracoes,
+                                        tamanho_populacao,
+                                        tempo_maximo).result()
+
+        alvo = resultado["performance_final"]
+        if base is not None and configuracao["nome"] in base:
+            alvo = base[configuracao["nome"]]["performance_final"]
+        resultado["alvo"] = alvo
+        resultado["tempo_alvo"] = tempo_ate_alvo(resultado["historico"],
+                                                 alvo)
+        resultados[configuracao["nome"]] = resultado
+        print("%-24s concluída em %.1fs" % (configuracao["nome"],
+                                            resultado["tempo"]))
+    return resultados
+
+
+"""
+funcao: compara_resultados(resultados, base, tolerancia)
+
+  Objetivo: Compara as metricas com a base gravada.
+
+  Retorna:
+          lista de textos descrevendo as regressoes (metricas piores que a
+          base alem da tolerancia relativa).
+"""
+def compara_resultados(resultados, base, tolerancia=TOLERANCIA):
+    regressoes = []
+    for nome, resultado in resultados.items():
+        if nome not in base:
+            continue
+        for metrica, maior_melhor in METRICAS_COMPARADAS.items():
+            atual = resultado.get(metrica)
+            anterior = base[nome].get(metrica)
+            if anterior is None:
+                continue
+            if atual is None:
+                regressoes.append("%s %s: não atingido (base %.4g)"
+                                  % (nome, metrica, anterior))
+                continue
+            if maior_melhor:
+                piorou = atual < anterior * (1 - tolerancia)
+            else:
+                piorou = atual > anterior * (1 + tolerancia)
+            if piorou:
+                regressoes.append("%s %s: %.4g (base %.4g, %+.1f%%)"
+                                  % (nome, metrica, atual, anterior,
+                                     100 * (atual / anterior - 1)))
+    return regressoes
+
+
+def imprime_resultados(resultados):
+    print("%-24s %8s %10s %10s %10s %10s %10s %24s" %
+          ("Instância", "Projetos", "Aval./s", "Ger./s", "Viável(s)",
+           "Alvo(s)", "Memória", "Performance"))
+    for nome, r in resultados.items():
+        print("%-24s %8i %10.1f %10.2f %10s %10s %9sM %24s" %
+              (nome, r["projetos"], r["avaliacoes_por_segundo"],
+               r["geracoes_por_segundo"], formata(r["tempo_viavel"]),
+               formata(r["tempo_alvo"]), formata(r["pico_memoria_mb"], 0),
+               '{:,.0f}'.format(r["performance_final"])))
+    return
+
+
+def formata(valor, decimais=1):
+    return "-" if valor is None else "%.*f" % (decimais, valor)
+
+
+"""
+funcao: micro_benchmarks(tamanhos, repeticoes)
+
+  Objetivo: Mede o tempo medio (mediana das repeticoes) de cada funcao do
+            algoritmo genetico para cada numero de projetos. Executada em
+            um processo novo, pois os tipos do DEAP dependem do numero de
+            contratos.
+
+  Retorna:
+          dicionario {funcao: {numero de projetos: segundos}}
+"""
+def micro_benchmarks(tamanhos=TAMANHOS_MICRO, repeticoes=REPETICOES_MICRO):
+    f_obj.GRAVA_INDIVIDUOS_VALIDOS = False
+    random.seed(SEMENTE)
+    tempos = {}
+
+    def mede(nome, tamanho, funcao, argumentos):
+        # argumentos: lista com os argumentos de cada repeticao, preparados
+        # antes da medicao
+        medidas = []
+        for args in argumentos:
+            inicio = time.perf_counter()
+            funcao(*args)
+            medidas.append(time.perf_counter() - inicio)
+        tempos.setdefault(nome, {})[tamanho] = statistics.median(medidas)
+
+    for tamanho in tamanhos:
+        configuracao = {"nome": "sintetica_%i_%i" % (tamanho,
+                                                     NUMERO_CONTRATOS_MICRO),
+                        "projetos": tamanho,
+                        "contratos": NUMERO_CONTRATOS_MICRO}
+        df_projetos, df_detalhes_projetos, projetos_excluidos, df_contratos, \
+            df_id_contratos, _ = presolve.le_dados_otimizacao(
+                *prepara_instancia(configuracao))
+        toolbox, num_contratos = distribuicao.configura_toolbox(
+            df_id_contratos, df_contratos, df_projetos)
+        dados = dict(numero_contratos=num_contratos,
+                     indice_contratos=df_id_contratos,
+                     contratos=df_contratos, projetos=df_projetos)
+
+        pop = toolbox.population(n=2 * repeticoes)
+        for ind in pop:
+            ind.fitness.values = toolbox.evaluate(ind)
+
+        def clones():
+            return [toolbox.clone(ind) for ind in pop[0:repeticoes]]
+
+        mede("funcao_objetivo", tamanho,
+             lambda ind: toolbox.evaluate(ind), [(ind,) for ind in clones()])
+        mede("cruzamento_metodo_1", tamanho,
+             lambda a, b: cruzamento.cruzamento_metodo_1(a, b,
+                                                         toolbox=toolbox,
+                                                         **dados),
+             list(zip(clones(), [toolbox.clone(ind) for ind in
+                                 pop[repeticoes:2 * repeticoes]])))
+        mede("mutacao_metodo_1", tamanho,
+             lambda ind: mutacao.mutacao_metodo_1(ind, toolbox=toolbox,
+                                                  **dados),
+             [(ind,) for ind in clones()])
+        mede("mutacao_metodo_2", tamanho,
+             lambda ind: mutacao.mutacao_metodo_2(ind, toolbox=toolbox,
+                                                  **dados),
+             [(ind,) for ind in clones()])
+        mede("selectthebest", tamanho,
+             lambda individuos: selecao.selectthebest(individuos, repeticoes,
+                                                      **dados),
+             [(pop[:],) for i in range(repeticoes)])
+        mede("elimina_duplicados", tamanho, distribuicao.elimina_duplicados,
+             [(pop + clones(),) for i in range(repeticoes)])
+        mede("clone", tamanho, toolbox.clone,
+             [(ind,) for ind in pop[0:repeticoes]])
+
+    return tempos
+
+
+def expoente_escala(tempos_funcao):
+    # inclinacao da reta log(tempo) x log(numero de projetos)
+    tamanhos = sorted(tempos_funcao)
+    if len(tamanhos) < 2:
+        return None
+    x = np.log([float(t) for t in tamanhos])
+    y = np.log([max(tempos_funcao[t], 1e-9) for t in tamanhos])
+    return float(np.polyfit(x, y, 1)[0])
+
+
+def imprime_micro(tempos):
+    tamanhos = sorted({t for tempos_funcao in tempos.values()
+                       for t in tempos_funcao})
+    print("%-22s" % "Função (ms)" +
+          "".join("%12i" % t for t in tamanhos) + "%10s" % "Expoente")
+    for nome, tempos_funcao in tempos.items():
+        expoente = expoente_escala(tempos_funcao)
+        print("%-22s" % nome +
+              "".join("%12.3f" % (1000 * tempos_funcao[t]) for t in tamanhos)
+              + "%10s" % formata(expoente, 2))
+    return
+
+
+def le_base(nome_arquivo=NOME_ARQUIVO_BASE):
+    if not os.path.exists(nome_arquivo):
+        return None
+    with open(nome_arquivo, encoding="utf-8") as arq:
+        return json.load(arq)
+
+
+def grava_base(resultados, nome_arquivo=NOME_ARQUIVO_BASE):
+    with open(nome_arquivo, "w", encoding="utf-8") as arq:
+        json.dump(resultados, arq, indent=1, default=float)
+    return
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark da otimização do RCA")
+    parser.add_argument("modo", choices=["gravar", "comparar", "micro"])
+    parser.add_argument("--base", default=NOME_ARQUIVO_BASE)
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA)
+    parser.add_argument("--geracoes", type=int,
+                        default=NUMERO_GERACOES_BENCHMARK)
+    parser.add_argument("--populacao", type=int,
+                        default=TAMANHO_POPULACAO_BENCHMARK)
+    parser.add_argument("--instancias", nargs="*",
+                        help="nomes das instâncias (padrão: todas)")
+    args = parser.parse_args()
+
+    if args.modo == "micro":
+        contexto = multiprocessing.get_context("spawn")
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=1, mp_context=contexto) as executor:
+            tempos = executor.submit(micro_benchmarks).result()
+        imprime_micro(tempos)
+        return
+
+    instancias = [c for c in INSTANCIAS_BENCHMARK
+                  if not args.instancias or c["nome"] in args.instancias]
+    base = le_base(args.base) if args.modo == "comparar" else None
+    resultados = executa_benchmark(instancias, base,
+                                   numero_geracoes=args.geracoes,
+                                   tamanho_populacao=args.populacao)
+    imprime_resultados(resultados)
+
+    if args.modo == "gravar":
+        grava_base(resultados, args.base)
+        return
+
+    if base is None:
+        print("Base de comparação não encontrada: " + args.base)
+        sys.exit(2)
+    regressoes = compara_resultados(resultados, base, args.tolerancia)
+    for regressao in regressoes:
+        print("REGRESSÃO " + regressao)
+    if len(regressoes) > 0:
+        sys.exit(1)
+    print("Sem regressões (tolerância %.0f%%)" % (100 * args.tolerancia))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Cache das avaliacoes da funcao objetivo.
+
+Os operadores de cruzamento e mutacao recriam com frequencia individuos ja
+avaliados em geracoes anteriores (que nao estao mais na populacao, e por
+isso nao sao eliminados como duplicados). O cache guarda o fitness dos
+ultimos individuos avaliados, identificados por um hash da alocacao, e
+evita avalia-los novamente.
+
+"""
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+# Definicao de constantes e parametros
+TAMANHO_CACHE = 10000  # numero de individuos guardados
+
+
+class CacheAvaliacao:
+    def __init__(self, tamanho=TAMANHO_CACHE):
+        self.tamanho = tamanho
+        self.fitness = OrderedDict()
+        self.consultas = 0
+        self.acertos = 0
+
+    @staticmethod
+    def chave(individuo):
+        # hash da alocacao do individuo, menor que a tupla dos genes
+        genes = np.asarray(individuo, dtype=np.int32)
+        return hashlib.blake2b(genes.tobytes(), digest_size=16).digest()
+
+    def aplica(self, individuos):
+        # atribui o fitness dos individuos encontrados no cache, e devolve
+        # a lista dos que precisam ser avaliados
+        nao_encontrados = []
+        for ind in individuos:
+            self.consultas += 1
+            chave = self.chave(ind)
+            fitness = self.fitness.get(chave)
+            if fitness is None:
+                nao_encontrados.append(ind)
+            else:
+                self.acertos += 1
+                self.fitness.move_to_end(chave)
+                ind.fitness.values = fitness
+        return nao_encontrados
+
+    def guarda(self, individuos):
+        # guarda o fitness dos individuos avaliados, descartando os usados
+        # ha mais tempo
+        for ind in individuos:
+            self.fitness[self.chave(ind)] = ind.fitness.values
+        while len(self.fitness) > self.tamanho:
+            self.fitness.popitem(last=False)
+
+
+def main():
+    # definir rotinas de testes para as funcoes do modulo
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""
+Analise de sensibilidade das alocacoes a variacoes dos limites dos
+contratos ("Obrigação - PETROBRAS", "Mínimo Externo" e "Máximo Interno").
+
+Um cenario e uma matriz com os 3 limites de cada contrato. Um conjunto
+fixo de alocacoes candidatas (ex.: a populacao do checkpoint) e avaliado
+em todos os cenarios de uma vez: os totais EMPRESA/EXTERNO/INTERNO de cada
+candidato por contrato (a mesma consolidacao de carrega_consolida_individuo)
+sao calculados uma unica vez, e os desvios sao calculados com numpy para
+todos os cenarios x candidatos x contratos.
+
+Opcionalmente, cada cenario e reotimizado por poucas geracoes, em
+paralelo, a partir dos mesmos candidatos (reotimiza_cenarios).
+
+O resultado e uma tabela com, para cada cenario, o melhor candidato, a
+performance, o valor excedente desembolsado (TOTAL acima da obrigacao) e
+o valor que falta alocar para atender as regras de negocio.
+
+"""
+import os
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+
+import distribuicao
+import presolve
+import checkpoint
+import incremental
+import conversao_individuos as conv
+import funcao_objetivo as f_obj
+
+# Definicao de constantes e parametros
+COLUNAS_LIMITES = incremental.COLUNAS_LIMITES
+VARIACOES_PADRAO = [-0.10, -0.05, 0.05, 0.10]
+COLUNAS_PADRAO = ["Obrigação - PETROBRAS", "Mínimo Externo"]
+# cenarios avaliados por bloco, para limitar a memoria dos arrays
+# cenarios x candidatos x contratos
+TAMANHO_BLOCO_CENARIOS = 64
+
+# reotimizacao de cada cenario (reotimiza_cenarios)
+NUMERO_PROCESSOS = os.cpu_count()
+NUMERO_GERACOES_REOTIMIZACAO = 20
+TEMPO_MAXIMO_REOTIMIZACAO = 120  # segundos por cenario
+
+
+"""
+funcao: cria_cenarios(df_contratos, df_id_contratos, variacoes, colunas,
+                      campos, por_campo)
+
+  Objetivo: Monta os cenarios com os limites dos contratos variados
+            percentualmente, a partir dos limites da planilha de entrada.
+            O primeiro cenario e sempre o da planilha ("Base").
+
+  Parametros:
+             df_contratos, df_id_contratos: dados lidos da planilha de
+                                            entrada;
+             variacoes: lista de variacoes relativas (ex.: 0.05 = +5%);
+             colunas: limites variados, entre COLUNAS_LIMITES. Cada coluna
+                      e variada em cenarios separados;
+             campos: "Campo" dos contratos variados. None varia todos;
+             por_campo: True cria cenarios separados para cada campo;
+                        False varia todos os campos juntos.
+
+  Retorna:
+          nomes: lista com o nome de cada cenario;
+          limites: array (cenarios, contratos, 3) com os limites em R$,
+                   na ordem de COLUNAS_LIMITES e dos indices dos contratos.
+"""
+def cria_cenarios(df_contratos, df_id_contratos, variacoes=VARIACOES_PADRAO,
+                  colunas=COLUNAS_PADRAO, campos=None, por_campo=False):
+    todos_campos, limites_base = incremental.limites_contratos(
+        df_contratos, df_id_contratos)
+    todos_campos = list(todos_campos)
+    if campos is None:
+        campos = todos_campos
+    desconhecidos = [c for c in campos if c not in todos_campos]
+    if len(desconhecidos) > 0:
+        raise ValueError("Campos desconhecidos: " + ", ".join(desconhecidos))
+    grupos = [[c] for c in campos] if por_campo else [list(campos)]
+
+    nomes = ["Base"]
+    limites = [limites_base]
+    for coluna in colunas:
+        j = COLUNAS_LIMITES.index(coluna)
+        for grupo in grupos:
+            linhas = [todos_campos.index(c) for c in grupo]
+            for variacao in variacoes:
+                cenario = limites_base.copy()
+                cenario[linhas, j] = np.round(
+                    cenario[linhas, j] * (1 + variacao), 2)
+                rotulo = grupo[0] if len(grupo) == 1 else \
+                    ("todos" if len(grupo) == len(todos_campos) else
+                     "%i campos" % len(grupo))
+                nomes.append("%s %+.0f%% (%s)" % (coluna, variacao * 100,
+                                                  rotulo))
+                limites.append(cenario)
+    return nomes, np.stack(limites)
+
+
+"""
+funcao: avalia_cenarios(genes, limites, df_projetos, df_contratos,
+                        df_id_contratos)
+
+  Objetivo: Avalia todos os candidatos em todos os cenarios, em uma unica
+            passada vetorizada.
+
+  Parametros:
+             genes: array (candidatos, projetos) com as alocacoes;
+             limites: array (cenarios, contratos, 3) em R$ (cria_cenarios);
+             df_projetos, df_contratos, df_id_contratos: dados lidos da
+                                                         planilha de entrada.
+
+  Retorna:
+          dicionario de arrays (cenarios, candidatos), em R$:
+              "performance": soma quadratica dos desvios das regras
+                             ativas, como f_obj.performance;
+              "excedente": soma do TOTAL acima da obrigacao dos contratos;
+              "falta": soma dos desvios negativos das regras ativas.
+"""
+def avalia_cenarios(genes, limites, df_projetos, df_contratos,
+                    df_id_contratos):
+    genes = np.atleast_2d(np.asarray(genes, dtype=np.int64))
+    instancia = incremental.dados_instancia(df_projetos, df_contratos,
+                                            df_id_contratos)
+    num_contratos = len(instancia["campos"])
+    # totais em centavos (candidatos, contratos, classificacao)
+    totais = incremental.totais_contratos(genes, instancia["valores"],
+                                          instancia["classif"],
+                                          num_contratos)
+    total = totais.sum(axis=2)[None, :, :]
+    externo = totais[None, :, :, 1]
+    interno = totais[None, :, :, 2]
+
+    num_cenarios = len(limites)
+    resultado = {nome: np.empty((num_cenarios, len(genes)))
+                 for nome in ["performance", "excedente", "falta"]}
+    for inicio in range(0, num_cenarios, TAMANHO_BLOCO_CENARIOS):
+        bloco = slice(inicio, inicio + TAMANHO_BLOCO_CENARIOS)
+        centavos = np.round(np.asarray(limites[bloco]) * 100).astype(np.int64)
+        ativas = centavos > 0
+        # desvios (cenarios, candidatos, contratos), como em
+        # f_obj.funcao_objetivo_centavos
+        d1 = total - centavos[:, None, :, 0]
+        d2 = externo - centavos[:, None, :, 1]
+        d3 = np.minimum(centavos[:, None, :, 2] - interno, 0)
+        d1 = np.where(ativas[:, None, :, 0], d1, 0).astype(np.float64)
+        d2 = np.where(ativas[:, None, :, 1], d2, 0).astype(np.float64)
+        d3 = np.where(ativas[:, None, :, 2], d3, 0).astype(np.float64)
+
+        resultado["performance"][bloco] = \
+            (d1 * d1 + d2 * d2 + d3 * d3).sum(axis=2) / 1e4
+        resultado["excedente"][bloco] = np.maximum(d1, 0).sum(axis=2) / 100.
+        resultado["falta"][bloco] = -(np.minimum(d1, 0) + np.minimum(d2, 0) +
+                                      d3).sum(axis=2) / 100.
+    return resultado
+
+
+"""
+funcao: tabela_cenarios(nomes, resultado, reotimizado)
+
+  Objetivo: Monta a tabela com o melhor candidato (menor performance) de
+            cada cenario.
+
+  Parametros:
+             nomes: nomes dos cenarios (cria_cenarios);
+             resultado: retornado por avalia_cenarios;
+             reotimizado: opcional, retornado por reotimiza_cenarios.
+
+  Retorna:
+          dataframe com uma linha por cenario.
+"""
+def tabela_cenarios(nomes, resultado, reotimizado=None):
+    melhor = np.argmin(resultado["performance"], axis=1)
+    cenarios = np.arange(len(nomes))
+    tabela = pd.DataFrame({
+        "Cenário": nomes,
+        "Candidato": melhor,
+        "Performance": resultado["performance"][cenarios, melhor],
+        "Excedente (R$)": resultado["excedente"][cenarios, melhor],
+        "Falta (R$)": resultado["falta"][cenarios, melhor],
+        "Menor Excedente (R$)": resultado["excedente"].min(axis=1)})
+    if reotimizado is not None:
+        tabela["Performance Reotimizada"] = reotimizado["performance"]
+        tabela["Excedente Reotimizado (R$)"] = reotimizado["excedente"]
+        tabela["Falta Reotimizada (R$)"] = reotimizado["falta"]
+    return tabela
+
+
+def aplica_limites(df_contratos, df_id_contratos, limites):
+    # copia de df_contratos com os limites do cenario (contratos, 3)
+    num_contratos = len(df_id_contratos) - 1
+    contratos = df_contratos.copy()
+    reais = contratos.sort_values("ID_Contrato").index[0:num_contratos]
+    for j, coluna in enumerate(COLUNAS_LIMITES):
+        contratos[coluna] = contratos[coluna].astype(np.float64)
+        contratos.loc[reais, coluna] = limites[:, j]
+    return contratos
+
+
+def reotimiza_cenario(limites, tamanho_populacao, numero_geracoes,
+                      tempo_maximo, semente):
+    # reotimiza um cenario a partir dos candidatos, e devolve os genes da
+    # populacao final
+    df_id_contratos, df_contratos, df_projetos, projetos_excluidos, genes = \
+        f_obj.dados_processo()
+    contratos = aplica_limites(df_contratos, df_id_contratos, limites)
+    distribuicao.cria_tipos_deap(len(df_id_contratos))
+    pop, historico = distribuicao.executa_otimizacao(
+        df_id_contratos, contratos, df_projetos, projetos_excluidos,
+        tamanho_populacao=tamanho_populacao, numero_geracoes=numero_geracoes,
+        tempo_maximo=tempo_maximo, semente=semente,
+        pop_inicial=conv.monta_individuos(genes, None))
+    return np.asarray([ind[:] for ind in pop], dtype=np.int64)
+
+
+"""
+funcao: reotimiza_cenarios(genes, limites, df_projetos, df_contratos,
+                           df_id_contratos, projetos_excluidos,
+                           tamanho_populacao, numero_geracoes, tempo_maximo,
+                           numero_processos, semente)
+
+  Objetivo: Executa uma reotimizacao curta de cada cenario, em paralelo,
+            com a populacao inicial formada pelos candidatos.
+
+  Parametros:
+             genes, limites: como em avalia_cenarios;
+             dados lidos da planilha de entrada (le_planilha_entrada);
+             tamanho_populacao, numero_geracoes, tempo_maximo: parametros
+                 de cada reotimizacao (distribuicao.executa_otimizacao);
+             numero_processos: numero de cenarios reotimizados ao mesmo
+                               tempo;
+             semente: semente de todas as reotimizacoes.
+
+  Retorna:
+          dicionario com os arrays (cenarios) "genes", "performance",
+          "excedente" e "falta" do melhor individuo de cada cenario.
+"""
+def reotimiza_cenarios(genes, limites, df_projetos, df_contratos,
+                       df_id_contratos, projetos_excluidos,
+                       tamanho_populacao=distribuicao.TAMANHO_POPULACAO,
+                       numero_geracoes=NUMERO_GERACOES_REOTIMIZACAO,
+                       tempo_maximo=TEMPO_MAXIMO_REOTIMIZACAO,
+                       numero_processos=NUMERO_PROCESSOS, semente=0):
+    genes = np.atleast_2d(np.asarray(genes, dtype=np.int64))
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=numero_processos,
+            initializer=f_obj.inicializa_processo,
+            initargs=(df_id_contratos, df_contratos, df_projetos,
+                      projetos_excluidos, genes)) as executor:
+        futuros = [executor.submit(reotimiza_cenario, cenario,
+                                   tamanho_populacao, numero_geracoes,
+                                   tempo_maximo, semente)
+                   for cenario in limites]
+        # o melhor individuo de cada cenario, entre os candidatos e a
+        # populacao final, avaliados somente no seu cenario (a evolucao
+        # nao guarda o melhor individuo)
+        resultado = {nome: [] for nome in
+                     ["genes", "performance", "excedente", "falta"]}
+        for s, futuro in enumerate(futuros):
+            individuos = np.vstack([genes, futuro.result()])
+            avaliacao = avalia_cenarios(individuos, limites[s:s + 1],
+                                        df_projetos, df_contratos,
+                                        df_id_contratos)
+            melhor = np.argmin(avaliacao["performance"][0])
+            resultado["genes"].append(individuos[melhor])
+            for nome in ["performance", "excedente", "falta"]:
+                resultado[nome].append(avaliacao[nome][0, melhor])
+
+    return {nome: np.array(valores) for nome, valores in resultado.items()}
+
+
+def imprime_tabela(tabela):
+    # imprime na tela a tabela dos cenarios
+    colunas_valores = [c for c in tabela.columns
+                       if c not in ("Cenário", "Candidato")]
+    print("%-48s %9s" % ("Cenário", "Candidato") +
+          "".join(" %26s" % c[0:26] for c in colunas_valores))
+    for _, linha in tabela.iterrows():
+        print("%-48s %9i" % (linha["Cenário"][0:48], linha["Candidato"]) +
+              "".join(" %26s" % '{:,.0f}'.format(linha[c])
+                      for c in colunas_valores))
+    return
+
+
+def main():
+    # avalia a populacao do checkpoint nos cenarios padrao
+    df_projetos, df_detalhes_projetos, projetos_excluidos, df_contratos, \
+        df_id_contratos, _ = presolve.le_dados_otimizacao(
+            distribuicao.PLANILHA_DADOS_ENTRADA,
+            distribuicao.NOME_ABA_ENTRADA_VALORES_A_DISTRIBUIR,
+            distribuicao.NOME_ABA_ENTRADA_CONTRATOS,
+            compilada=distribuicao.USA_INSTANCIA_COMPILADA)
+
+    dados_checkpoint = checkpoint.le_checkpoint(
+        distribuicao.NOME_ARQUIVO_CHECKPOINT)
+    if dados_checkpoint is None or \
+            dados_checkpoint["genes"].shape[1] != len(df_projetos):
+        print("Nenhum checkpoint da planilha de entrada: " +
+              distribuicao.NOME_ARQUIVO_CHECKPOINT)
+        return
+    genes = np.vstack([dados_checkpoint["genes"],
+                       dados_checkpoint["melhor_genes"]])
+
+    nomes, limites = cria_cenarios(df_contratos, df_id_contratos)
+    resultado = avalia_cenarios(genes, limites, df_projetos, df_contratos,
+                                df_id_contratos)
+    imprime_tabela(tabela_cenarios(nomes, resultado))
+    return
+
+
+if __name__ == "__main__":
+    main()
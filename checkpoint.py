@@ -0,0 +1,261 @@
+"""
+Checkpoint binario da otimizacao, para continuar a evolucao do ponto em que
+foi interrompida.
+
+O checkpoint e um arquivo .npz (numpy, sem compressao) com:
+    - genes: matriz (individuos X projetos) com a alocacao da populacao;
+    - fitness: matriz (individuos X valores do fitness) com a performance
+      e os desvios ja calculados de cada individuo;
+    - melhor_genes, melhor_fitness: melhor individuo geral;
+    - meta: texto JSON com a versao do formato, o hash da planilha de
+      entrada, a geracao, o estado dos geradores de numeros aleatorios,
+      o numero de registros do historico das estatisticas, as
+      estatisticas dos operadores e, opcionalmente, a configuracao da
+      execucao (linha_comando.py);
+    - instancia_*: opcionalmente, os dados da instancia usados para
+      remapear a populacao quando a planilha de entrada muda (ver
+      incremental.py).
+
+O historico das estatisticas, que cresce a cada geracao, fica fora do
+.npz, no arquivo "<checkpoint>.historico.jsonl" (um registro por linha),
+ao qual cada gravacao somente acrescenta os registros novos. A leitura
+considera somente os registros contados em meta, de modo que linhas
+acrescentadas por uma gravacao interrompida sao ignoradas.
+
+Diferente de Populacao_Final.rca (pickle do HallOfFame do DEAP), pode ser
+lido sem criar antes os tipos do DEAP, e e barato o suficiente para ser
+gravado a cada geracao. O arquivo e gravado em um arquivo temporario e
+renomeado ao final (ver gravador_saida.grava_arquivo_atomico).
+
+Caso o hash da planilha de entrada seja o mesmo, a populacao e restaurada
+com o fitness gravado, sem precisar ser avaliada novamente.
+
+"""
+import os
+import json
+import random
+
+import numpy as np
+from deap import tools
+
+import conversao_individuos as conv
+import gravador_saida
+
+# Definicao de constantes e parametros
+VERSAO_CHECKPOINT = 2
+SUFIXO_HISTORICO = ".historico.jsonl"
+
+# numero de registros ja gravados em cada arquivo de historico por este
+# processo
+_registros_gravados = {}
+
+
+"""
+funcao: grava_checkpoint(nome_arquivo, pop, melhor_individuo, geracao,
+                         hash_instancia, logbook, estatisticas_operadores,
+                         dados_instancia, configuracao)
+
+  Objetivo: Grava o checkpoint da otimizacao.
+
+  Parametros:
+             nome_arquivo: arquivo .npz do checkpoint;
+             pop: populacao atual, com o fitness calculado;
+             melhor_individuo: melhor individuo geral (ou None);
+             geracao: numero da ultima geracao concluida;
+             hash_instancia: hash da planilha de entrada
+                             (instancia.hash_arquivo);
+             logbook: historico das estatisticas (tools.Logbook);
+             estatisticas_operadores: dicionario com as estatisticas de uso
+                                      dos operadores;
+             dados_instancia: dicionario de arrays com os dados da
+                              instancia (incremental.dados_instancia).
+                              None nao grava;
+             configuracao: configuracao resolvida da execucao
+                           (linha_comando.py), gravada em meta. None nao
+                           grava.
+
+  Retorna:
+"""
+def grava_checkpoint(nome_arquivo, pop, melhor_individuo, geracao,
+                     hash_instancia, logbook, estatisticas_operadores,
+                     dados_instancia=None, configuracao=None):
+    genes, fitness = conv.compacta_individuos(pop)
+    if melhor_individuo is not None:
+        melhor_genes, melhor_fitness = \
+            conv.compacta_individuos([melhor_individuo])
+    else:
+        melhor_genes = np.zeros((0, genes.shape[1]), dtype=np.int32)
+        melhor_fitness = np.zeros((0, fitness.shape[1]), dtype=np.float64)
+
+    versao_random, estado_random, gauss_random = random.getstate()
+    nome_np, chave_np, pos_np, tem_gauss_np, gauss_np = np.random.get_state()
+    meta = {"versao": VERSAO_CHECKPOINT,
+            "hash_instancia": hash_instancia,
+            "geracao": geracao,
+            "numero_projetos": int(genes.shape[1]),
+            "random": [versao_random, list(estado_random), gauss_random],
+            "numpy_random": [nome_np, int(pos_np), int(tem_gauss_np),
+                             float(gauss_np)],
+            "registros_historico": grava_historico(nome_arquivo, logbook),
+            "cabecalho_historico": list(logbook.header or []),
+            "operadores": estatisticas_operadores}
+    if configuracao is not None:
+        meta["configuracao"] = configuracao
+    arrays_instancia = {"instancia_" + nome: valores for nome, valores in
+                        (dados_instancia or {}).items()}
+
+    def grava(nome_temporario):
+        with open(nome_temporario, "wb") as arq:
+            np.savez(arq, genes=genes, fitness=fitness,
+                     melhor_genes=melhor_genes,
+                     melhor_fitness=melhor_fitness,
+                     chave_numpy_random=chave_np,
+                     meta=np.array(json.dumps(meta, default=float)),
+                     **arrays_instancia)
+
+    gravador_saida.grava_arquivo_atomico(nome_arquivo, grava)
+    return
+
+
+def grava_historico(nome_arquivo, logbook):
+    # acrescenta ao arquivo do historico somente os registros ainda nao
+    # gravados. Na primeira gravacao do processo o arquivo e regravado
+    # inteiro, descartando registros de execucoes anteriores. Devolve o
+    # numero de registros do historico
+    nome_historico = nome_arquivo + SUFIXO_HISTORICO
+    gravados = _registros_gravados.get(nome_historico)
+    if gravados is None or gravados > len(logbook):
+        def grava(nome_temporario):
+            with open(nome_temporario, "w", encoding="utf-8") as arq:
+                arq.writelines(json.dumps(dict(r), default=float) + "\n"
+                               for r in logbook)
+        gravador_saida.grava_arquivo_atomico(nome_historico, grava)
+    elif gravados < len(logbook):
+        with open(nome_historico, "a", encoding="utf-8") as arq:
+            arq.writelines(json.dumps(dict(r), default=float) + "\n"
+                           for r in logbook[gravados:])
+    _registros_gravados[nome_historico] = len(logbook)
+    return len(logbook)
+
+
+def le_historico(nome_arquivo, numero_registros):
+    # le os numero_registros primeiros registros do arquivo do historico
+    historico = []
+    try:
+        with open(nome_arquivo + SUFIXO_HISTORICO, encoding="utf-8") as arq:
+            for linha in arq:
+                if len(historico) >= numero_registros:
+                    break
+                historico.append(json.loads(linha))
+    except (OSError, ValueError) as erro:
+        print("Histórico do checkpoint inválido: " + str(erro))
+    if len(historico) < numero_registros:
+        print("Histórico do checkpoint incompleto: %i de %i registros" %
+              (len(historico), numero_registros))
+    return historico
+
+
+"""
+funcao: le_checkpoint(nome_arquivo)
+
+  Objetivo: Le o checkpoint gravado por grava_checkpoint.
+
+  Retorna:
+          dicionario com os arrays e os dados do checkpoint ("genes",
+          "fitness", "melhor_genes", "melhor_fitness", "meta",
+          "historico"), ou None caso o arquivo nao exista ou seja de
+          outra versao.
+"""
+def le_checkpoint(nome_arquivo):
+    if not os.path.exists(nome_arquivo):
+        return None
+    try:
+        with np.load(nome_arquivo) as dados:
+            checkpoint = {nome: dados[nome] for nome in dados.files}
+        checkpoint["meta"] = json.loads(str(checkpoint["meta"]))
+    except (OSError, ValueError, KeyError) as erro:
+        print("Checkpoint inválido " + nome_arquivo + ": " + str(erro))
+        return None
+
+    meta = checkpoint["meta"]
+    if meta.get("versao") != VERSAO_CHECKPOINT:
+        print("Checkpoint de outra versão: " + nome_arquivo)
+        return None
+    checkpoint["historico"] = le_historico(nome_arquivo,
+                                           meta["registros_historico"])
+    return checkpoint
+
+
+"""
+funcao: restaura_checkpoint(checkpoint, hash_instancia, numero_projetos)
+
+  Objetivo: Recria a populacao, o melhor individuo, o historico e o estado
+            dos geradores de numeros aleatorios a partir do checkpoint.
+            Caso o hash da planilha de entrada seja diferente, os
+            individuos sao restaurados sem fitness, para serem avaliados
+            novamente.
+
+  Parametros:
+             checkpoint: lido por le_checkpoint;
+             hash_instancia: hash da planilha de entrada atual;
+             numero_projetos: numero de projetos da planilha de entrada
+                              atual.
+
+  Retorna:
+          pop, melhor_individuo (ou None), geracao, logbook e
+          estatisticas_operadores; ou None caso o checkpoint nao seja
+          compativel com a planilha de entrada atual.
+"""
+def restaura_checkpoint(checkpoint, hash_instancia, numero_projetos):
+    meta = checkpoint["meta"]
+    if meta["numero_projetos"] != numero_projetos:
+        print("Checkpoint de outra planilha de entrada, ignorado")
+        return None
+
+    mesma_instancia = meta["hash_instancia"] == hash_instancia
+    if mesma_instancia:
+        pop = conv.monta_individuos(checkpoint["genes"],
+                                     checkpoint["fitness"])
+        melhor = conv.monta_individuos(checkpoint["melhor_genes"],
+                                        checkpoint["melhor_fitness"])
+    else:
+        # a planilha mudou: o fitness gravado nao vale mais
+        print("Planilha de entrada alterada: a população do checkpoint "
+              "será avaliada novamente")
+        pop = conv.monta_individuos(checkpoint["genes"], None)
+        melhor = []
+    melhor_individuo = melhor[0] if len(melhor) > 0 else None
+
+    restaura_aleatorios(checkpoint)
+    return pop, melhor_individuo, meta["geracao"], \
+        restaura_historico(checkpoint), meta["operadores"]
+
+
+def restaura_aleatorios(checkpoint):
+    # restaura o estado dos geradores de numeros aleatorios
+    meta = checkpoint["meta"]
+    versao_random, estado_random, gauss_random = meta["random"]
+    random.setstate((versao_random, tuple(estado_random), gauss_random))
+    nome_np, pos_np, tem_gauss_np, gauss_np = meta["numpy_random"]
+    np.random.set_state((nome_np, checkpoint["chave_numpy_random"], pos_np,
+                         tem_gauss_np, gauss_np))
+    return
+
+
+def restaura_historico(checkpoint):
+    # recria o historico das estatisticas (tools.Logbook)
+    meta = checkpoint["meta"]
+    logbook = tools.Logbook()
+    logbook.header = meta["cabecalho_historico"]
+    for registro in checkpoint["historico"]:
+        logbook.record(**registro)
+    return logbook
+
+
+def main():
+    # definir rotinas de testes para as funcoes do modulo
+    return
+
+
+if __name__ == "__main__":
+    main()
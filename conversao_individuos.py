@@ -0,0 +1,50 @@
+"""
+Conversao de individuos do DEAP para matrizes numpy, e o inverso.
+
+Utilizada para trafegar individuos entre processos (ilhas, portfolio,
+otimizador assincrono, servico) e para grava-los em disco (checkpoint),
+sem serializar objetos do DEAP. O modulo nao depende dos demais modulos
+do programa, e pode ser importado por qualquer um deles sem criar ciclos
+de importacao.
+
+"""
+import numpy as np
+from deap import creator
+
+
+"""
+funcao: compacta_individuos(individuos) / monta_individuos(genes, fitness)
+
+  Objetivo: Converte uma lista de individuos do DEAP em 2 matrizes numpy
+            (genes e fitness), e o inverso. monta_individuos com fitness
+            None cria os individuos sem fitness, para serem avaliados.
+"""
+def compacta_individuos(individuos):
+    genes = np.array([ind[:] for ind in individuos], dtype=np.int32)
+    fitness = np.array([ind.fitness.values for ind in individuos],
+                       dtype=np.float64)
+    return genes, fitness
+
+
+def monta_individuos(genes, fitness):
+    individuos = []
+    for i in range(len(genes)):
+        ind = creator.Individual(genes[i].tolist())
+        if fitness is not None:
+            ind.fitness.values = tuple(fitness[i])
+        individuos.append(ind)
+    return individuos
+
+
+def soma_performance(fitness):
+    # mesma soma de f_obj.performance, sobre o vetor de fitness
+    return float(np.sum(fitness[0:int(len(fitness) / 2)]))
+
+
+def main():
+    # definir rotinas de testes para as funcoes do modulo
+    return
+
+
+if __name__ == "__main__":
+    main()
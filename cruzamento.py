@@ -37,15 +37,22 @@ funcao: tipo(toolbox)
                      
   Parametros:
              toolbox: objeto toolbox do DEAP
+             opcoes_permitidas: lista das opcoes que podem ser sorteadas.
+                                None sorteia entre todas as opcoes.
 
 
  Retorna:
          toolbox: objeto toolbox do DEAP
 """
-def tipo(toolbox, numero_contratos, indice_contratos, contratos, projetos):
+def tipo(toolbox, numero_contratos, indice_contratos, contratos, projetos,
+         opcoes_permitidas=None):
     # seleciona randomicamente uma das opcoes abaixo:
     opcoes = 12  # ### ATENCAO ### maior probabilidade de usar a opcao 7
     i = random.randint(1, opcoes)
+    # restringe as opcoes sorteadas, caso informadas (ex.: [7] usa somente
+    # o metodo customizado)
+    if opcoes_permitidas is not None:
+        i = random.choice(opcoes_permitidas)
     if i == 1:
         toolbox.register("mate", tools.cxOnePoint)
     elif i == 2:
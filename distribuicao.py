@@ -34,6 +34,16 @@ TAMANHO_POPULACAO = 100
 NUMERO_GERACOES_GRAVA_MELHORES_RESULTADOS = 10
 NUMERO_GERACOES_GRAVA_POPULACAO = 10
 NUMERO_GERACOES_GRAVA_HISTORICO = 10
+# o checkpoint de uma execucao interrompida continua ate NUMERO_GERACOES;
+# o de uma execucao concluida continua por mais NUMERO_GERACOES geracoes
+NUMERO_GERACOES_GRAVA_CHECKPOINT = 1
+
+# reotimizacao incremental (ver incremental.py): quando a planilha de
+# entrada muda em relacao ao checkpoint, remapeia a populacao do checkpoint
+# pelo "Número ANP" dos projetos e pelo "Campo" dos contratos, e continua a
+# otimizacao por NUMERO_GERACOES_INCREMENTAL geracoes
+REOTIMIZACAO_INCREMENTAL = True
+NUMERO_GERACOES_INCREMENTAL = 50
 NUMERO_MELHORES_INDIVIDUOS_GUARDADO = 500
 
 # define os valores minimos e maximos de cada probabiliade.
@@ -42,6 +52,48 @@ NUMERO_MELHORES_INDIVIDUOS_GUARDADO = 500
 PROBABILIDADE_CROSSOVER = (0.3, 0.8)
 PROBABILIDADE_MUTACAO = (0.3, 0.8)
 
+# criterio de parada pelo gap de otimalidade: encerra a evolucao quando o
+# gap relativo entre o melhor individuo geral e o limite inferior da
+# performance for menor ou igual a este valor (entre 0 e 1).
+# None desabilita o criterio, executando todas as NUMERO_GERACOES
+GAP_RELATIVO_PARADA = None
+
+# orcamentos da execucao: encerra a evolucao apos este tempo (segundos) ou
+# este numero de avaliacoes das geracoes. None nao limita
+TEMPO_MAXIMO_EXECUCAO = None
+NUMERO_MAXIMO_AVALIACOES = None
+
+# semente dos numeros aleatorios, para repetir uma execucao. None usa uma
+# semente aleatoria. Ao continuar de um checkpoint, vale o estado gravado
+SEMENTE = None
+
+# configuracao resolvida da execucao (ver linha_comando.py), gravada no
+# arquivo de metricas e no checkpoint. None nao grava
+CONFIGURACAO_EXECUCAO = None
+
+# modelo de ilhas: numero de populacoes evoluidas em processos paralelos,
+# com migracao dos melhores individuos (ver ilhas.py).
+# 1 executa o algoritmo genetico com uma unica populacao
+NUMERO_ILHAS = 1
+
+# avaliacao distribuida: enderecos (host, porta) dos servidores de avaliacao
+# (ver avaliacao_distribuida.py). Lista vazia avalia no proprio processo.
+# O transporte "conexao" usa a chave da variavel de ambiente
+# RCA_CHAVE_AVALIACAO; o "socket" nao tem autenticacao e so aceita
+# servidores locais
+SERVIDORES_AVALIACAO = []
+TRANSPORTE_AVALIACAO = "conexao"  # "conexao" ou "socket"
+
+# modo de evolucao (ver estado_estavel.py):
+#   "geracional": populacao substituida a cada geracao;
+#   "estado_estavel": cada individuo avaliado e inserido imediatamente na
+#                     populacao, sem esperar o fim da geracao, com
+#                     NUMERO_GERACOES * TAMANHO_POPULACAO avaliacoes;
+#   "matricial": populacao armazenada em arrays, com os operadores
+#                aplicados a todos os pais de uma vez (ver
+#                populacao_matricial.py)
+MODO_EVOLUCAO = "geracional"
+
 # Definicao do nomes da planilha de entrada de dados,
 # suas abas, nome de colunas criadas em tabelas, etc.
 PLANILHA_DADOS_ENTRADA = "Dados RCA.xlsx"
@@ -54,9 +106,51 @@ NOME_COLUNA_CONTRATO = "Contrato"
 NOME_ARQUIVO_MELHORES_RESULTADOS = "Melhores_Individuos.rca"
 NOME_ARQUIVO_POPULACAO_FINAL = "Populacao_Final.rca"
 NOME_ARQUIVO_HISTORICO = "Historico.rca"
+NOME_ARQUIVO_CHECKPOINT = "Checkpoint.npz"
+# arquivo com as metricas de cada geracao (ver metricas.py), no formato
+# JSONL ou CSV conforme a extensao. None grava somente Historico.rca
+NOME_ARQUIVO_METRICAS = "Metricas.jsonl"
+
+# le os dados de entrada da instancia compilada da planilha (ver
+# instancia.py), que evita ler novamente a planilha excel a cada execucao
+USA_INSTANCIA_COMPILADA = True
+
+# grava a planilha de saida em uma thread separada (ver gravador_saida.py),
+# somente quando o melhor individuo geral melhorar
+GRAVACAO_EM_SEGUNDO_PLANO = True
+
+# nao avalia novamente individuos ja avaliados (ver cache_avaliacao.py)
+USA_CACHE_AVALIACOES = True
+
+# mede o tempo de cada etapa da geracao (ver perfil.py). Caso informado o
+# intervalo (primeira, ultima) de geracoes, executa-as com o cProfile
+PERFIL_ATIVO = True
+PERFIL_GERACOES_CPROFILE = None
+NOME_ARQUIVO_CPROFILE = "Perfil.prof"
+
+# porta do monitoramento por HTTP em localhost (ver monitor.py), ex.: 8765.
+# None nao inicia o monitoramento
+PORTA_MONITOR = None
+
+# interrompe a execucao quando o presolve (ver presolve.py) identifica que
+# nenhuma alocacao atende a todas as regras de negocio. False continua a
+# otimizacao, minimizando os desvios
+ABORTA_INSTANCIA_INVIAVEL = False
+
+# motor de otimizacao:
+#   "genetico": somente o algoritmo genetico;
+#   "tabu": somente a busca tabu (ver tabu.py), a partir do melhor
+#           individuo gravado (NOME_ARQUIVO_MELHOR_INDIVIDUO), ou de uma
+#           alocacao aleatoria;
+#   "genetico_tabu": busca tabu a partir do melhor individuo do algoritmo
+#                    genetico.
+MOTOR_OTIMIZACAO = "genetico"
+NUMERO_ITERACOES_TABU = 2000
+TEMPO_MAXIMO_TABU = None  # segundos. None nao limita
 
 import random
 import math
+import time
 
 # Modulos que tive de adicionar: pandas, openpyxl, xlrd, numpy, deap
 # usados pelo QT para a interface grafica: pyside6, pathlib
@@ -69,36 +163,75 @@ import mutacao
 import cruzamento
 import selecao
 import utilidades as util
+import instancia
 import funcao_objetivo as f_obj
 import funcao_restricao as negocio
+import limite_inferior
+import ilhas
+import avaliacao_distribuida
+import estado_estavel
+import populacao_matricial
+import gravador_saida
+import checkpoint
+import incremental
+import metricas
+import cache_avaliacao
+import perfil as perf
+import monitor
+import presolve
+import tabu
 
-def main():
-    # carrega dados de entrada na planilha, e cria as seguintes variaveis
-    # com os dados dos contratos e projetos:
-    #
-    #     df_projetos: dataframe somente com os campos dos dados dos projetos
-    #                  necessários para a otimizacao:
-    #                  ["Número ANP", "Valor Pago(R$)", "Irá fazer parte do RCA?",
-    #                   "Classif", "CONTRATO PRINC"];
-    #
-    #     df_contratos: dataframe somente com os campos dos dados dos contratos
-    #                   necessários para a otimizacao:
-    #                   ["Campo", "Obrigação - PETROBRAS", "Mínimo Externo",
-    #                    "Mínimo Empresa", "Máximo Interno"]
-    #
-    #     df_detalhes_projetos = dataframe com todos os campos dos dados dos
-    #                            dos projetos, para serem replicados na planilha
-    #                            de saida.
-    #
-    df_projetos, df_detalhes_projetos, projetos_excluidos, df_contratos, \
-    df_id_contratos = util.le_planilha_entrada(PLANILHA_DADOS_ENTRADA,
-                                               NOME_ABA_ENTRADA_VALORES_A_DISTRIBUIR,
-                                               NOME_ABA_ENTRADA_CONTRATOS)
 
+"""
+funcao: cria_tipos_deap(numero_indices_contratos)
+
+  Objetivo: Cria no DEAP as classes "FitnessMin" e "Individual", caso ainda
+            nao tenham sido criadas neste processo. Os processos
+            auxiliares (ilhas, avaliadores) precisam recriar as classes
+            para reconstruir os individuos recebidos.
+
+  Parametros:
+             numero_indices_contratos: numero de linhas da tabela de
+                                       indices dos contratos, incluindo o
+                                       "contrato em branco".
+
+  Retorna:
+"""
+def cria_tipos_deap(numero_indices_contratos):
+    # recria os tipos caso o numero de contratos seja diferente (ex.:
+    # instancias diferentes no mesmo processo, ver servico.py)
+    fit_weights = f_obj.cria_performance(numero_indices_contratos)
+    if hasattr(creator, "FitnessMin") and \
+            creator.FitnessMin.weights != fit_weights:
+        del creator.FitnessMin
+        if hasattr(creator, "Individual"):
+            del creator.Individual
+    if not hasattr(creator, "FitnessMin"):
+        creator.create("FitnessMin", base.Fitness, weights=fit_weights)
+    if not hasattr(creator, "Individual"):
+        creator.create("Individual", list, fitness=creator.FitnessMin)
+    return
+
+
+"""
+funcao: configura_toolbox(df_id_contratos, df_contratos, df_projetos)
+
+  Objetivo: Cria e configura o toolbox do DEAP com o gerador de individuos,
+            a populacao e a funcao objetivo.
+
+  Parametros:
+             df_id_contratos: dataframe com os indices dos contratos;
+             df_contratos: dataframe com os contratos e as restricoes;
+             df_projetos: dataframe com os dados dos projetos.
+
+  Retorna:
+          toolbox: objeto toolbox do DEAP;
+          num_contratos: maior indice de contrato que pode ser alocado
+                         (o "contrato em branco").
+"""
+def configura_toolbox(df_id_contratos, df_contratos, df_projetos):
     # declaracoes e configuracoes do DEAP
-    fit_weights = f_obj.cria_performance(len(df_id_contratos))
-    creator.create("FitnessMin", base.Fitness, weights=fit_weights)
-    creator.create("Individual", list, fitness=creator.FitnessMin)
+    cria_tipos_deap(len(df_id_contratos))
     toolbox = base.Toolbox()
 
     # Definir o gerador de numeros aleatórios de numeros inteiros entre o
@@ -124,6 +257,465 @@ def main():
                      contratos=df_contratos,
                      projetos=df_projetos)
 
+    return toolbox, num_contratos
+
+
+def elimina_duplicados(pop):
+    # elimina individuos duplicados, mantendo a ordem da populacao
+    pop_temp = []
+    apagados = 0
+    for i in pop:
+        if i not in pop_temp:
+            pop_temp.append(i)
+        else:
+            apagados += 1
+    return pop_temp, apagados
+
+
+"""
+funcao: executa_geracao(pop, toolbox, num_contratos, df_id_contratos,
+                        df_contratos, df_projetos, projetos_excluidos,
+                        tamanho_populacao)
+
+  Objetivo: Executa uma geracao do algoritmo genetico sobre a populacao:
+
+               1 - realiza os cruzamentos;
+               2 - realiza as mutacoes;
+               3 - elimina individuos duplicados;
+               4 - repoe os individuos apagados (com novas mutacoes e
+                   cruzamentos);
+               5 - desaloca projetos excluidos do processo
+               6 - avalia os individuos com a funcao objetivo;
+               7 - elimina os individuos que tiveram erro no calculo da
+                   funcao objetivo;
+               8 - seleciona a populacao da proxima geracao;
+
+  Parametros:
+             pop: populacao atual, com a performance calculada;
+             toolbox: objeto toolbox do DEAP (configura_toolbox);
+             demais: dados dos contratos e projetos (le_planilha_entrada)
+                     e o tamanho da populacao;
+             operadores: dicionario opcional com as opcoes permitidas de
+                         "cruzamento" e "mutacao" (ver cruzamento.tipo e
+                         mutacao.tipo). None permite todas as opcoes.
+
+  Retorna:
+          pop: populacao da proxima geracao, ordenada por performance;
+          invalid_ind: lista dos individuos avaliados nesta geracao.
+"""
+def executa_geracao(pop, toolbox, num_contratos, df_id_contratos,
+                    df_contratos, df_projetos, projetos_excluidos,
+                    tamanho_populacao, operadores=None, metricas_geracao=None,
+                    cache=None, perfil=None):
+    if operadores is None:
+        operadores = {}
+    if metricas_geracao is None:
+        metricas_geracao = {}
+    if perfil is None:
+        perfil = perf.Perfil(ativo=False)
+    inicio_geracao = time.perf_counter()
+
+    # embaralha a populacao para aumentar a diversidade nos cruzamentos
+    # as funcoes de selecao ordenam a populacao por performance
+    random.shuffle(pop)
+
+    # 1 - realiza os cruzamentos;
+
+    # seleciona tipo de cruzamento a ser aplicado
+    toolbox = cruzamento.tipo(toolbox, num_contratos, df_id_contratos,
+                              df_contratos, df_projetos,
+                              operadores.get("cruzamento"))
+    perfil.instrumenta(toolbox, "mate", "cruzamento")
+
+    # realiza os cruzamentos em um percentual da populacao
+    mate_list = []
+    prob_mate = random.uniform(PROBABILIDADE_CROSSOVER[0],
+                               PROBABILIDADE_CROSSOVER[1])
+
+    for child_1, child_2 in zip(pop[::2], pop[1::2]):
+        # Cruza 2 individuos com a probabilidade definida
+        # na constante PROBABILIDADE_CROSSOVER
+        # Realiza o cruzamento em um percentual dos individuos,
+        # com a probabilidade definida randomicamente,
+        # entre os limites (minimo e maximo) da
+        # constante PROBABILIDADE_MUTACAO
+        if random.random() < prob_mate:
+            ind_1 = toolbox.clone(child_1)
+            ind_2 = toolbox.clone(child_2)
+            toolbox.mate(child_1, child_2)
+            # Invalida os valores de performance calculados dos novos
+            # individuos gerados. Esta performance sera
+            # posteriormente calculada com a funcao objetivo
+            del child_1.fitness.values
+            del child_2.fitness.values
+            # inclui na lista dos novos individuos criados
+            mate_list.append(ind_1)
+            mate_list.append(ind_2)
+
+    # inclui de volta os individuos que foram cruzados na populacao
+    pop = pop + mate_list
+    perfil.marca("1_cruzamento")
+
+    # 2 - realiza as mutacoes;
+
+    # seleciona tipo de mutacao
+    toolbox = mutacao.tipo(toolbox, numero_contratos=num_contratos,
+                           indice_contratos=df_id_contratos,
+                           contratos=df_contratos,
+                           projetos=df_projetos,
+                           opcoes_permitidas=operadores.get("mutacao"))
+    perfil.instrumenta(toolbox, "mutate", "mutacao")
+
+    # nao considera para a mutacao os novos individuos criados
+    # que nao tiveram ainda sua performance calculdada
+    valid_ind = [ind for ind in pop if ind.fitness.valid]
+    mutant_list = []
+    # Realiza a mutacao em um percentual dos individuos com a
+    # probabilidade definida randomicamente, entre os limites
+    # (minimo e maximo) da constante PROBABILIDADE_MUTACAO
+    prob_mut = random.uniform(PROBABILIDADE_MUTACAO[0],
+                              PROBABILIDADE_MUTACAO[1])
+    for mutant in valid_ind:
+        if random.random() < prob_mut:
+            # a mutacao e aplicada na copia: o individuo original mantem
+            # o fitness ja calculado, e somente o mutante e avaliado
+            ind = toolbox.clone(mutant)
+            toolbox.mutate(ind)
+            # invalida o fitness do novo individuo gerado, para que
+            # sua performance seja calculada posteriormente
+            del ind.fitness.values
+            # inclui na lista dos novos individuos criados
+            mutant_list.append(ind)
+
+    # inclui de volta os individuos que sofreram mutacao na populacao,
+    pop = pop + mutant_list
+    perfil.marca("2_mutacao")
+
+    # 3 - elimina individuos duplicados;
+    pop, apagados = elimina_duplicados(pop)
+    metricas_geracao["duplicados"] = apagados
+    perfil.marca("3_duplicados")
+
+    # print("apagados ", apagados)
+
+    # mantem o tamanho da populacao, evitando que reduza por
+    # motivo de individuos duplicados ou criados com performance
+    # invalida, que foram apagados
+    apagados = max(apagados, tamanho_populacao-len(pop))
+    # print("repor ", apagados)
+
+    # 4 - repoe os individuos apagados (com novas mutacoes e cruzamentos);
+    # criados aleatoriamente por cruzamento e mutacao
+    lista_novos = []
+    repostos = 0
+    # nao considera para a mutacao ou cruzamento os novos individuos
+    # criados que ainda nao tiveram ainda sua performance calculada
+    valid_ind = [ind for ind in pop if ind.fitness.valid]
+    # print("inicio reposicao da populacao")
+    duplicados = 0
+    while len(valid_ind) > 0 and apagados > 0:
+        # seleciona randomicamente criar por mutacao ou cruzamento
+        # Ajusta a probabilidade considerando:
+        #  - cada mutacao gera 1 individuo e cada cruzamento gera 2
+        #  - as probabilidades de mutacao e cruzamento desta geracao
+        if random.random() < (2/3)*(prob_mut/prob_mate):
+            if len(valid_ind) < 1:
+                # sai do loop caso não tenha individuos validos suficiente
+                break
+            # criar por mutacao
+            mutant = random.sample(valid_ind, 1)[0]
+            ind = toolbox.clone(mutant)
+            toolbox.mutate(mutant)
+            # Invalida os valores calculados de fitness para que seja
+            # calculada a performance do novo individuo
+            del mutant.fitness.values
+            # inclui na lista dos novos individuos criados
+            lista_novos.append(ind)
+        else:
+            if len(valid_ind) < 2:
+                # sai do loop caso não tenha individuos validos suficiente
+                break
+            # criar por cruzamento
+            child_1, child_2 = random.sample(valid_ind, 2)
+            ind_1 = toolbox.clone(child_1)
+            ind_2 = toolbox.clone(child_2)
+            toolbox.mate(child_1, child_2)
+            # Invalida os valores calculados de fitness para que seja
+            # calculada a performance do novo individuo
+            del child_1.fitness.values
+            del child_2.fitness.values
+            # inclui na lista de novos individuos criados
+            lista_novos.append(ind_1)
+            lista_novos.append(ind_2)
+
+        # inclui novos individuos criados na populacao, caso nao seja
+        # um individuo duplicado
+        for i in lista_novos:
+            if i not in pop:
+                pop.append(i)
+                repostos += 1
+                apagados -= 1
+            else:
+                duplicados += 1
+        lista_novos = []
+
+        # nao considera para a mutacao ou cruzamento os
+        # novos individuos criados que nao tiveram ainda
+        # sua performance calculdada
+        valid_ind = [ind for ind in pop if ind.fitness.valid]
+
+    # print("criados duplicados ", duplicados)
+    # print("repostos ", repostos)
+    perfil.marca("4_reposicao")
+
+    # 5 - desaloca os projetos fixos como nao alocados (presolve) nos
+    # novos individuos. Os projetos excluidos pela planilha de entrada
+    # ja foram retirados de df_projetos (le_planilha_entrada)
+
+    # um projeto desalocado e representato pela alocacao em um contrato
+    # "vazio", incluido como ultima linha na tabela de indices de contrato
+    id_contrato_projeto_nao_alocado = len(df_id_contratos) - 1
+    invalid_ind = [ind for ind in pop if not ind.fitness.valid]
+    negocio.exclui_projetos(invalid_ind, projetos_excluidos,
+                            id_contrato_projeto_nao_alocado)
+    perfil.marca("5_exclui_projetos")
+
+    # 6 - avalia os novos individuos com a funcao objetivo;
+
+    # Calcular a performance de todos os novos individuos gerados,
+    # que tiveram seus fitness invalidados no cruzamento e mutacao.
+    invalid_ind = [ind for ind in pop if not ind.fitness.valid]
+    # os individuos encontrados no cache nao sao avaliados novamente
+    avaliar = invalid_ind if cache is None else cache.aplica(invalid_ind)
+    fitnesses = toolbox.map(toolbox.evaluate, avaliar)
+    for ind, fit in zip(avaliar, fitnesses):
+        ind.fitness.values = fit
+    if cache is not None:
+        cache.guarda(avaliar)
+    metricas_geracao["avaliacoes"] = len(avaliar)
+    metricas_geracao["cache"] = len(invalid_ind) - len(avaliar)
+    perfil.marca("6_avaliacao")
+
+    # 7 - elimina os individuos que tiveram erro no calculo
+    #     da funcao objetivo;
+
+    # ### ATENCAO ### descobrir porque estao sendo criados para
+    # nao precisar eliminar
+    pop_temp = []
+    performance_invalida = 0
+    for i in pop:
+        if not math.isnan(f_obj.performance(i)):
+            pop_temp.append(i)
+        else:  # Aqui identifica quando um individuo
+               # com performance invalida foi identificado e apagado.
+            performance_invalida += 1
+    pop = pop_temp
+    metricas_geracao["performance_invalida"] = performance_invalida
+    perfil.marca("7_performance_invalida")
+    # print("apagados por performance invalida ", performance_invalida)
+
+    # 8 - seleciona a populacao da proxima geracao;
+
+    # define o tipo de selecao de individuos usado.
+    toolbox = selecao.tipo(toolbox, numero_contratos=num_contratos,
+                           indice_contratos=df_id_contratos,
+                           contratos=df_contratos,
+                           projetos=df_projetos)
+    perfil.instrumenta(toolbox, "select", "selecao")
+
+    # realiza a funcao de selecao definida
+    pop = toolbox.select(pop, tamanho_populacao)
+    perfil.marca("8_selecao")
+    # Clona os individuos da proxima geracao
+    pop = list(map(toolbox.clone, pop))
+    perfil.marca("8_clonagem")
+    metricas_geracao["tempo_geracao"] = time.perf_counter() - inicio_geracao
+
+    return pop, invalid_ind
+
+
+"""
+funcao: executa_otimizacao(df_id_contratos, df_contratos, df_projetos,
+                           projetos_excluidos, tamanho_populacao,
+                           numero_geracoes, tempo_maximo, semente,
+                           operadores, pop_inicial, registro, cancelado,
+                           notifica_melhoria)
+
+  Objetivo: Executa o algoritmo genetico sem gravar arquivos em disco,
+            para ser utilizado por outros programas (ex.: portfolio.py).
+            Encerra apos numero_geracoes geracoes ou tempo_maximo segundos.
+
+  Parametros:
+             df_id_contratos, df_contratos, df_projetos,
+             projetos_excluidos: dados lidos da planilha de entrada;
+             tamanho_populacao: tamanho da populacao;
+             numero_geracoes: numero maximo de geracoes;
+             tempo_maximo: tempo maximo em segundos. None nao limita;
+             semente: semente dos numeros aleatorios. None nao altera;
+             operadores: opcoes permitidas de cruzamento e mutacao
+                         (ver executa_geracao);
+             pop_inicial: lista de individuos para iniciar a populacao.
+                          None cria uma populacao aleatoria;
+             registro: lista em que sao incluidas as metricas de cada
+                       geracao (executa_geracao), a geracao, o tempo, o
+                       melhor resultado e se algum individuo e valido.
+                       None nao registra;
+             cancelado: evento (threading.Event) verificado a cada
+                        geracao, que interrompe a evolucao. None nao
+                        verifica;
+             notifica_melhoria: funcao chamada com (geracao, individuo)
+                                quando o melhor resultado melhora. None
+                                nao notifica.
+
+  Retorna:
+          pop: populacao final, ordenada pela selecao (pela performance
+               ou pelas regras de Deb, ver usa_selecao_viabilidade);
+          historico: lista de tuples (geracao, tempo, performance do
+                     melhor individuo ate a geracao, comparado como na
+                     selecao).
+"""
+def executa_otimizacao(df_id_contratos, df_contratos, df_projetos,
+                       projetos_excluidos, tamanho_populacao=TAMANHO_POPULACAO,
+                       numero_geracoes=NUMERO_GERACOES, tempo_maximo=None,
+                       semente=None, operadores=None, pop_inicial=None,
+                       registro=None, cancelado=None,
+                       notifica_melhoria=None):
+    if semente is not None:
+        random.seed(semente)
+        np.random.seed(semente % (2 ** 32))
+
+    inicio = time.perf_counter()
+    toolbox, num_contratos = configura_toolbox(df_id_contratos, df_contratos,
+                                               df_projetos)
+
+    if pop_inicial is not None:
+        pop = [toolbox.clone(ind) for ind in pop_inicial[0:tamanho_populacao]]
+    else:
+        pop = toolbox.population(n=tamanho_populacao)
+    pop, apagados = elimina_duplicados(pop)
+
+    invalid_ind = [ind for ind in pop if not ind.fitness.valid]
+    fitnesses = toolbox.map(toolbox.evaluate, invalid_ind)
+    for ind, fit in zip(invalid_ind, fitnesses):
+        ind.fitness.values = fit
+    pop = [ind for ind in pop if not math.isnan(f_obj.performance(ind))]
+
+    # o melhor individuo e comparado como na selecao, que devolve a
+    # populacao ordenada
+    viabilidade = selecao.usa_selecao_viabilidade(df_id_contratos,
+                                                  df_contratos, df_projetos)
+    melhor_individuo = None
+    historico = []
+    g = 0
+    while g < numero_geracoes:
+        if tempo_maximo is not None and \
+                time.perf_counter() - inicio > tempo_maximo:
+            break
+        if cancelado is not None and cancelado.is_set():
+            break
+        g = g + 1
+        metricas_geracao = {}
+        pop, invalid_ind = executa_geracao(pop, toolbox, num_contratos,
+                                           df_id_contratos, df_contratos,
+                                           df_projetos, projetos_excluidos,
+                                           tamanho_populacao, operadores,
+                                           metricas_geracao=metricas_geracao)
+        if melhor_individuo is None or \
+                selecao.supera_melhor(pop[0], melhor_individuo, viabilidade):
+            melhor_individuo = toolbox.clone(pop[0])
+            if notifica_melhoria is not None:
+                notifica_melhoria(g, pop[0])
+        melhor = f_obj.performance(melhor_individuo)
+        historico.append((g, time.perf_counter() - inicio, melhor))
+        if registro is not None:
+            metricas_geracao.update(
+                ger=g, tempo=time.perf_counter() - inicio, melhor=melhor,
+                valido=any(f_obj.individuo_valido(ind) for ind in pop))
+            registro.append(metricas_geracao)
+
+    return pop, historico
+
+
+def main():
+    # carrega dados de entrada na planilha, e cria as seguintes variaveis
+    # com os dados dos contratos e projetos:
+    #
+    #     df_projetos: dataframe somente com os campos dos dados dos projetos
+    #                  necessários para a otimizacao:
+    #                  ["Número ANP", "Valor Pago(R$)", "Irá fazer parte do RCA?",
+    #                   "Classif", "CONTRATO PRINC"];
+    #
+    #     df_contratos: dataframe somente com os campos dos dados dos contratos
+    #                   necessários para a otimizacao:
+    #                   ["Campo", "Obrigação - PETROBRAS", "Mínimo Externo",
+    #                    "Mínimo Empresa", "Máximo Interno"]
+    #
+    #     df_detalhes_projetos = dataframe com todos os campos dos dados dos
+    #                            dos projetos, para serem replicados na planilha
+    #                            de saida.
+    #
+    # pre-processamento da instancia (presolve): verifica a viabilidade
+    # agregada, retira os contratos sem regra ativa e fixa como nao
+    # alocados os projetos que nao alteram a performance
+    df_projetos, df_detalhes_projetos, projetos_excluidos, df_contratos, \
+    df_id_contratos, resultado_presolve = presolve.le_dados_otimizacao(
+        PLANILHA_DADOS_ENTRADA, NOME_ABA_ENTRADA_VALORES_A_DISTRIBUIR,
+        NOME_ABA_ENTRADA_CONTRATOS, compilada=USA_INSTANCIA_COMPILADA)
+    presolve.imprime_presolve(resultado_presolve, len(df_projetos))
+    if not resultado_presolve["viavel"] and ABORTA_INSTANCIA_INVIAVEL:
+        print("-- Otimização interrompida: instância inviável --")
+        return
+
+    # calcula o limite inferior da performance, usado para reportar o gap
+    # de otimalidade do melhor individuo a cada geracao
+    limite_performance = limite_inferior.calcula_limite_inferior(df_projetos,
+                                                                 df_contratos)
+    print("Limite inferior da performance = " +
+          '{:,.0f}'.format(limite_performance))
+
+    # modo de ilhas: evolui NUMERO_ILHAS populacoes em processos paralelos
+    if NUMERO_ILHAS > 1:
+        executa_modo_ilhas(df_projetos, df_detalhes_projetos,
+                           projetos_excluidos, df_contratos, df_id_contratos)
+        return
+
+    # modo de estado estavel: avaliacao assincrona em processos paralelos
+    if MODO_EVOLUCAO == "estado_estavel":
+        executa_modo_estado_estavel(df_projetos, df_detalhes_projetos,
+                                    projetos_excluidos, df_contratos,
+                                    df_id_contratos)
+        return
+
+    # populacao em arrays, com os operadores aplicados em lote
+    if MODO_EVOLUCAO == "matricial":
+        executa_modo_matricial(df_projetos, df_detalhes_projetos,
+                               projetos_excluidos, df_contratos,
+                               df_id_contratos)
+        return
+
+    # somente a busca tabu
+    if MOTOR_OTIMIZACAO == "tabu":
+        executa_modo_tabu(df_projetos, df_detalhes_projetos,
+                          projetos_excluidos, df_contratos, df_id_contratos)
+        return
+
+    # declaracoes e configuracoes do DEAP
+    toolbox, num_contratos = configura_toolbox(df_id_contratos, df_contratos,
+                                               df_projetos)
+
+    # avalia os individuos nos servidores de avaliacao, caso configurados
+    avaliador = None
+    if len(SERVIDORES_AVALIACAO) > 0:
+        avaliador = avaliacao_distribuida.AvaliadorDistribuido(
+            SERVIDORES_AVALIACAO, transporte=TRANSPORTE_AVALIACAO)
+        toolbox.register("map", avaliador.map)
+
+    # grava a planilha de saida em segundo plano, caso configurado
+    gravador = None
+    if GRAVACAO_EM_SEGUNDO_PLANO:
+        gravador = gravador_saida.GravadorSaida(PLANILHA_DADOS_SAIDA,
+                                                df_id_contratos, df_contratos,
+                                                df_detalhes_projetos)
 
     # ### TESTE recupera um individuo valido e grava planilha
     # individuo = util.le_individuo_arquivo("Individuos_Validos.rca")
@@ -134,15 +726,42 @@ def main():
     # # #########################################################
 
     # cria a populacao inicial
-
-    # le a ultima populacao salva do arquivo. Caso não encontre,
-    # cria uma nova populacao
-    pop_salva = util.le_populacao(NOME_ARQUIVO_POPULACAO_FINAL)
-    if pop_salva != None:
-        pop = pop_salva.items[0:min(TAMANHO_POPULACAO,
-                                    len(pop_salva.items))]
+    if SEMENTE is not None:
+        random.seed(SEMENTE)
+        np.random.seed(SEMENTE % (2 ** 32))
+
+    # continua a otimizacao do ultimo checkpoint gravado, caso exista
+    hash_instancia = instancia.hash_arquivo(PLANILHA_DADOS_ENTRADA)
+    dados_instancia = incremental.dados_instancia(df_projetos, df_contratos,
+                                                  df_id_contratos)
+    restaurado = None
+    reotimizacao_incremental = False
+    dados_checkpoint = checkpoint.le_checkpoint(NOME_ARQUIVO_CHECKPOINT)
+    if dados_checkpoint is not None and REOTIMIZACAO_INCREMENTAL and \
+            dados_checkpoint["meta"]["hash_instancia"] != hash_instancia:
+        # a planilha mudou: remapeia a populacao para a nova planilha
+        restaurado = incremental.remapeia_checkpoint(dados_checkpoint,
+                                                     df_projetos,
+                                                     df_contratos,
+                                                     df_id_contratos,
+                                                     projetos_excluidos)
+        reotimizacao_incremental = restaurado is not None
+    if dados_checkpoint is not None and restaurado is None:
+        restaurado = checkpoint.restaura_checkpoint(dados_checkpoint,
+                                                    hash_instancia,
+                                                    len(df_projetos))
+
+    if restaurado is not None:
+        pop = restaurado[0]
     else:
-        pop = toolbox.population(n=TAMANHO_POPULACAO)
+        # le a ultima populacao salva do arquivo. Caso não encontre,
+        # cria uma nova populacao
+        pop_salva = util.le_populacao(NOME_ARQUIVO_POPULACAO_FINAL)
+        if pop_salva != None:
+            pop = pop_salva.items[0:min(TAMANHO_POPULACAO,
+                                        len(pop_salva.items))]
+        else:
+            pop = toolbox.population(n=TAMANHO_POPULACAO)
 
     # ##########################################
     # se quiser incluir mais uma populacao salva
@@ -152,14 +771,7 @@ def main():
     # ##########################################
 
     # elimina individuos duplicados
-    pop_temp = []
-    apagados = 0
-    for i in pop:
-        if i not in pop_temp:
-            pop_temp.append(i)
-        else:
-            apagados += 1
-    pop = pop_temp
+    pop, apagados = elimina_duplicados(pop)
 
     # inicializa objeto Hall of Fame do DEAP, para guardar os
     # melhores individuos
@@ -180,14 +792,79 @@ def main():
     stats_hist = tools.Logbook()
     stats_hist.header = "ger", "min", "media", "std", "max"
 
+    # variavel para contar o numero da geracao atual, e a ultima geracao
+    g = 0
+    geracao_final = NUMERO_GERACOES
+    melhor_individuo_geral = None
+    # compara o melhor individuo geral como na selecao
+    viabilidade = selecao.usa_selecao_viabilidade(df_id_contratos,
+                                                  df_contratos, df_projetos)
+    # numero de geracoes em que cada operador foi usado, e em quantas
+    # delas o melhor individuo geral melhorou
+    estatisticas_operadores = {"cruzamento": {}, "mutacao": {}}
+    if restaurado is not None:
+        pop, melhor_individuo_geral, g, stats_hist, \
+            estatisticas_operadores = restaurado
+        if reotimizacao_incremental:
+            geracao_final = g + NUMERO_GERACOES_INCREMENTAL
+            print("Reotimização incremental a partir da geração %i, por "
+                  "mais %i gerações" % (g, NUMERO_GERACOES_INCREMENTAL))
+        elif g < NUMERO_GERACOES:
+            # execucao interrompida: continua ate NUMERO_GERACOES
+            print("Continuando do checkpoint da geração %i até a geração %i"
+                  % (g, NUMERO_GERACOES))
+        else:
+            # execucao ja concluida: continua otimizando a populacao
+            # restaurada por mais NUMERO_GERACOES geracoes
+            geracao_final = g + NUMERO_GERACOES
+            print("Checkpoint da geração %i já concluído: continuando a "
+                  "otimização da população restaurada por mais %i gerações"
+                  % (g, NUMERO_GERACOES))
+
+    # registro das metricas de cada geracao e cache das avaliacoes
+    registro_metricas = None
+    if NOME_ARQUIVO_METRICAS is not None:
+        registro_metricas = metricas.RegistroMetricas(
+            NOME_ARQUIVO_METRICAS,
+            numero_registros=metricas.NUMERO_REGISTROS_DESCARGA,
+            intervalo=metricas.INTERVALO_DESCARGA)
+        if CONFIGURACAO_EXECUCAO is not None:
+            registro_metricas.registra_configuracao(CONFIGURACAO_EXECUCAO)
+    cache = None
+    if USA_CACHE_AVALIACOES:
+        cache = cache_avaliacao.CacheAvaliacao(cache_avaliacao.TAMANHO_CACHE)
+    perfil = perf.Perfil(ativo=PERFIL_ATIVO,
+                         geracoes_cprofile=PERFIL_GERACOES_CPROFILE,
+                         arquivo_cprofile=NOME_ARQUIVO_CPROFILE)
+
+    # monitoramento da otimizacao por HTTP, caso configurado
+    monitoramento = None
+    avaliacoes = 0
+    if PORTA_MONITOR is not None:
+        monitoramento = monitor.MonitorOtimizacao(
+            PORTA_MONITOR, df_id_contratos["Campo"], geracao_final)
+        print("Monitoramento em http://%s:%i/" % (monitor.ENDERECO_MONITOR,
+                                                  PORTA_MONITOR))
+    inicio = time.perf_counter()
+
     # Inicio da evolucao
     print("Inicio")
 
     # Calcular a performance com a funcao objetivo  para
-    # todos os individuos da populacao
-    fitnesses = list(map(toolbox.evaluate, pop))
-    for ind, fit in zip(pop, fitnesses):
+    # todos os individuos da populacao. Os individuos do checkpoint da
+    # mesma planilha de entrada ja tem a performance calculada
+    if restaurado is None:
+        invalid_ind = pop
+    else:
+        invalid_ind = [ind for ind in pop if not ind.fitness.valid]
+    fitnesses = list(toolbox.map(toolbox.evaluate, invalid_ind))
+    for ind, fit in zip(invalid_ind, fitnesses):
         ind.fitness.values = fit
+    if cache is not None:
+        cache.guarda(invalid_ind)
+    if melhor_individuo_geral is not None:
+        performance_melhor_individuo_geral = \
+            f_obj.performance(melhor_individuo_geral)
     # caso nao queira recalcular as populacoes lidas de arquivo, substitui
     # pelo codigo abaixo:
     # Obs,: caso mude a funcao objetivo, precisam ser recalculados.
@@ -196,222 +873,22 @@ def main():
     # for ind, fit in zip(invalid_ind, fitnesses):
     #     ind.fitness.values = fit
 
-    # loop repetido a cada geracao:
-    #
-    # a partir de uma populacao:
-    #    1 - realiza os cruzamentos;
-    #    2 - realiza as mutacoes;
-    #    3 - elimina individuos duplicados;
-    #    4 - repoe os individuos apagados (com novas mutacoes e cruzamentos);
-    #    5 - desaloca projetos excluidos do processo
-    #    6 - avalia os individuos com a funcao objetivo;
-    #    7 - elimina os individuos que tiveram erro no calculo da funcao
-    #        objetivo;
-    #    8 - seleciona a populacao da proxima geracao;
+    # loop repetido a cada geracao (ver executa_geracao)
     # ################
 
-    # variavel para contar o numero da geracao atual
-    g = 0
-    while g < NUMERO_GERACOES:
+    while g < geracao_final:
         # Atualiza a contagem da geracao atual
         g = g + 1
+        perfil.nova_geracao(g)
 
-        # embaralha a populacao para aumentar a diversidade nos cruzamentos
-        # as funcoes de selecao ordenam a populacao por performance
-        random.shuffle(pop)
-
-        # 1 - realiza os cruzamentos;
-
-        # seleciona tipo de cruzamento a ser aplicado
-        toolbox = cruzamento.tipo(toolbox, num_contratos, df_id_contratos,
-                                  df_contratos, df_projetos)
-
-        # realiza os cruzamentos em um percentual da populacao
-        mate_list = []
-        prob_mate = random.uniform(PROBABILIDADE_CROSSOVER[0],
-                                   PROBABILIDADE_CROSSOVER[1])
-
-        for child_1, child_2 in zip(pop[::2], pop[1::2]):
-            # Cruza 2 individuos com a probabilidade definida
-            # na constante PROBABILIDADE_CROSSOVER
-            # Realiza o cruzamento em um percentual dos individuos,
-            # com a probabilidade definida randomicamente,
-            # entre os limites (minimo e maximo) da
-            # constante PROBABILIDADE_MUTACAO
-            if random.random() < prob_mate:
-                ind_1 = toolbox.clone(child_1)
-                ind_2 = toolbox.clone(child_2)
-                toolbox.mate(child_1, child_2)
-                # Invalida os valores de performance calculados dos novos
-                # individuos gerados. Esta performance sera
-                # posteriormente calculada com a funcao objetivo
-                del child_1.fitness.values
-                del child_2.fitness.values
-                # inclui na lista dos novos individuos criados
-                mate_list.append(ind_1)
-                mate_list.append(ind_2)
-
-        # inclui de volta os individuos que foram cruzados na populacao
-        pop = pop + mate_list
-
-        # 2 - realiza as mutacoes;
-
-        # seleciona tipo de mutacao
-        toolbox = mutacao.tipo(toolbox, numero_contratos=num_contratos,
-                               indice_contratos=df_id_contratos,
-                               contratos=df_contratos,
-                               projetos=df_projetos)
-
-        # nao considera para a mutacao os novos individuos criados
-        # que nao tiveram ainda sua performance calculdada
-        valid_ind = [ind for ind in pop if ind.fitness.valid]
-        mutant_list = []
-        # Realiza a mutacao em um percentual dos individuos com a
-        # probabilidade definida randomicamente, entre os limites
-        # (minimo e maximo) da constante PROBABILIDADE_MUTACAO
-        prob_mut = random.uniform(PROBABILIDADE_MUTACAO[0],
-                                  PROBABILIDADE_MUTACAO[1])
-        for mutant in valid_ind:
-            if random.random() < prob_mut:
-                ind = toolbox.clone(mutant)
-                toolbox.mutate(mutant)
-                # invalida o fitness do novo individuo gerado, para que
-                # sua performance seja calculada posteriormente
-                del ind.fitness.values
-                # inclui na lista dos novos individuos criados
-                mutant_list.append(ind)
-
-        # inclui de volta os individuos que sofreram mutacao na populacao,
-        pop = pop + mutant_list
-
-        # 3 - elimina individuos duplicados;
-        pop_temp = []
-        apagados = 0
-        for i in pop:
-            if i not in pop_temp:
-                pop_temp.append(i)
-            else:
-                apagados += 1
-        pop = pop_temp
-
-        # print("apagados ", apagados)
-
-        # mantem o tamanho da populacao, evitando que reduza por
-        # motivo de individuos duplicados ou criados com performance
-        # invalida, que foram apagados
-        apagados = max(apagados, TAMANHO_POPULACAO-len(pop))
-        # print("repor ", apagados)
-
-        # 4 - repoe os individuos apagados (com novas mutacoes e cruzamentos);
-        # criados aleatoriamente por cruzamento e mutacao
-        lista_novos = []
-        repostos = 0
-        # nao considera para a mutacao ou cruzamento os novos individuos
-        # criados que ainda nao tiveram ainda sua performance calculada
-        valid_ind = [ind for ind in pop if ind.fitness.valid]
-        # print("inicio reposicao da populacao")
-        duplicados = 0
-        while len(valid_ind) > 0 and apagados > 0:
-            # seleciona randomicamente criar por mutacao ou cruzamento
-            # Ajusta a probabilidade considerando:
-            #  - cada mutacao gera 1 individuo e cada cruzamento gera 2
-            #  - as probabilidades de mutacao e cruzamento desta geracao
-            if random.random() < (2/3)*(prob_mut/prob_mate):
-                if len(valid_ind) < 1:
-                    # sai do loop caso não tenha individuos validos suficiente
-                    break
-                # criar por mutacao
-                mutant = random.sample(valid_ind, 1)[0]
-                ind = toolbox.clone(mutant)
-                toolbox.mutate(mutant)
-                # Invalida os valores calculados de fitness para que seja
-                # calculada a performance do novo individuo
-                del mutant.fitness.values
-                # inclui na lista dos novos individuos criados
-                lista_novos.append(ind)
-            else:
-                if len(valid_ind) < 2:
-                    # sai do loop caso não tenha individuos validos suficiente
-                    break
-                # criar por cruzamento
-                child_1, child_2 = random.sample(valid_ind, 2)
-                ind_1 = toolbox.clone(child_1)
-                ind_2 = toolbox.clone(child_2)
-                toolbox.mate(child_1, child_2)
-                # Invalida os valores calculados de fitness para que seja
-                # calculada a performance do novo individuo
-                del child_1.fitness.values
-                del child_2.fitness.values
-                # inclui na lista de novos individuos criados
-                lista_novos.append(ind_1)
-                lista_novos.append(ind_2)
-
-            # inclui novos individuos criados na populacao, caso nao seja
-            # um individuo duplicado
-            for i in lista_novos:
-                if i not in pop:
-                    pop.append(i)
-                    repostos += 1
-                    apagados -= 1
-                else:
-                    duplicados += 1
-            lista_novos = []
-
-            # nao considera para a mutacao ou cruzamento os
-            # novos individuos criados que nao tiveram ainda
-            # sua performance calculdada
-            valid_ind = [ind for ind in pop if ind.fitness.valid]
-
-        # print("criados duplicados ", duplicados)
-        # print("repostos ", repostos)
-
-        # 5 - desaloca projetos excluidos do processo para os novos individuos
-
-        # um projeto desalocado e representato pela alocacao em um contrato
-        # "vazio", incluido como ultima linha na tabela de indices de contrato
-        id_contrato_projeto_nao_alocado = len(df_id_contratos)
-        invalid_ind = [ind for ind in pop if not ind.fitness.valid]
-        # ### ATENCAO ### ainda nao implementado
-        negocio.exclui_projetos(invalid_ind, projetos_excluidos,
-                                id_contrato_projeto_nao_alocado)
-
-        # 6 - avalia os novos individuos com a funcao objetivo;
-
-        # Calcular a performance de todos os novos individuos gerados,
-        # que tiveram seus fitness invalidados no cruzamento e mutacao.
-        invalid_ind = [ind for ind in pop if not ind.fitness.valid]
-        fitnesses = map(toolbox.evaluate, invalid_ind)
-        for ind, fit in zip(invalid_ind, fitnesses):
-            ind.fitness.values = fit
-
-        # 7 - elimina os individuos que tiveram erro no calculo
-        #     da funcao objetivo;
-
-        # ### ATENCAO ### descobrir porque estao sendo criados para
-        # nao precisar eliminar
-        pop_temp = []
-        performance_invalida = 0
-        for i in pop:
-            if not math.isnan(f_obj.performance(i)):
-                pop_temp.append(i)
-            else:  # Aqui identifica quando um individuo
-                   # com performance invalida foi identificado e apagado.
-                performance_invalida += 1
-        pop = pop_temp
-        # print("apagados por performance invalida ", performance_invalida)
-
-        # 8 - seleciona a populacao da proxima geracao;
-
-        # define o tipo de selecao de individuos usado.
-        toolbox = selecao.tipo(toolbox, numero_contratos=num_contratos,
-                               indice_contratos=df_id_contratos,
-                               contratos=df_contratos,
-                               projetos=df_projetos)
-
-        # realiza a funcao de selecao definida
-        pop = toolbox.select(pop, TAMANHO_POPULACAO)
-        # Clona os individuos da proxima geracao
-        pop = list(map(toolbox.clone, pop))
+        # executa as etapas 1 a 8 da geracao
+        metricas_geracao = {}
+        pop, invalid_ind = executa_geracao(pop, toolbox, num_contratos,
+                                           df_id_contratos, df_contratos,
+                                           df_projetos, projetos_excluidos,
+                                           TAMANHO_POPULACAO,
+                                           metricas_geracao=metricas_geracao,
+                                           cache=cache, perfil=perfil)
 
         # calcula as estatisticas e guarda no historico
         record = stats.compile(pop)
@@ -421,6 +898,7 @@ def main():
                           max=np.max(record['fit']))
 
         print("Geração %i - Avaliados %i" % (g, len(invalid_ind)))
+        perfil.marca("estatisticas")
 
         # ### ATENCAO ### considera que a funcao de selecao utilizada devolveu
         # a populacao ordenada por performance. So as funcoes de selecao
@@ -432,7 +910,7 @@ def main():
 
         # criar a variavel para guardar o melhor individuo geral
         # na primeira geracao
-        if g == 1:
+        if melhor_individuo_geral is None:
             melhor_individuo_geral = toolbox.clone(melhor_individuo_geracao)
             performance_melhor_individuo_geral = \
                 performance_melhor_individuo_geracao
@@ -444,15 +922,36 @@ def main():
             melhor_individuo_geral = toolbox.clone(melhor_individuo_geracao)
             performance_melhor_individuo_geral = \
                 performance_melhor_individuo_geracao
-        if performance_melhor_individuo_geracao < \
-                performance_melhor_individuo_geral:
+        # com a selecao pela viabilidade, o melhor individuo geral tambem
+        # e comparado pelas regras de Deb
+        melhorou = False
+        if selecao.supera_melhor(melhor_individuo_geracao,
+                                 melhor_individuo_geral, viabilidade):
             melhor_individuo_geral = toolbox.clone(melhor_individuo_geracao)
             performance_melhor_individuo_geral = \
                 performance_melhor_individuo_geracao
+            melhorou = True
 
         hof_melhores_individuos_geral.insert(melhor_individuo_geral)
+        atualiza_estatisticas_operadores(estatisticas_operadores, toolbox,
+                                         melhorou)
+        perfil.marca("melhor_individuo")
+
+        # atualiza o estado informado pelo monitoramento
+        avaliacoes += metricas_geracao["avaliacoes"]
+        if monitoramento is not None:
+            monitoramento.atualiza(g, melhor_individuo_geral,
+                                   stats_hist[-1]["media"], avaliacoes)
         # melhor_individuo_geral = hof_melhores_individuos_geral[0]
 
+        # envia o melhor individuo para a gravacao em segundo plano. So e
+        # gravado caso tenha melhorado. Pelas regras de Deb, o melhor
+        # individuo geral pode ter performance maior que o anterior
+        if gravador is not None:
+            gravador.submete(melhor_individuo_geral,
+                             performance_melhor_individuo_geral,
+                             melhorou=melhorou)
+
         # grava o melhor individuo em arquivo e planilha
         if g >= NUMERO_GERACOES_GRAVA_MELHORES_RESULTADOS and \
                 (g % NUMERO_GERACOES_GRAVA_MELHORES_RESULTADOS) == 1:
@@ -460,10 +959,11 @@ def main():
             util.grava_individuo(NOME_ARQUIVO_MELHORES_RESULTADOS,
                                  melhor_individuo_geral)
             # grava planilha de saida com o melhor resultado ate agora
-            util.grava_planilha_saida(melhor_individuo_geral,
-                                      PLANILHA_DADOS_SAIDA,
-                                      df_id_contratos, df_contratos,
-                                      df_detalhes_projetos)
+            if gravador is None:
+                util.grava_planilha_saida(melhor_individuo_geral,
+                                          PLANILHA_DADOS_SAIDA,
+                                          df_id_contratos, df_contratos,
+                                          df_detalhes_projetos)
 
             # atualiza o hall of fame dos melhores individuos
             # hof_melhores_individuos_geral.update(pop)
@@ -477,11 +977,30 @@ def main():
             util.grava_populacao(NOME_ARQUIVO_POPULACAO_FINAL,
                                  hof_populacao)
 
-        # grava arquivo historico das etatisticas em arquivo
-        if g >= NUMERO_GERACOES_GRAVA_HISTORICO and\
+        perfil.marca("gravacao_arquivos")
+
+        # grava as metricas da geracao, ou o arquivo historico das
+        # etatisticas em arquivo
+        if registro_metricas is not None:
+            registro = stats_hist[-1].copy()
+            registro.update(metricas_geracao)
+            registro["tempos"] = perfil.tempos_etapas()
+            registro["melhor_geral"] = performance_melhor_individuo_geral
+            registro["tempo"] = time.perf_counter() - inicio
+            registro_metricas.registra(registro)
+        elif g >= NUMERO_GERACOES_GRAVA_HISTORICO and\
                 (g % NUMERO_GERACOES_GRAVA_HISTORICO) == 1:
                 util.grava_historico(NOME_ARQUIVO_HISTORICO, stats_hist)
 
+        # grava o checkpoint, para continuar a otimizacao desta geracao
+        if g % NUMERO_GERACOES_GRAVA_CHECKPOINT == 0:
+            checkpoint.grava_checkpoint(NOME_ARQUIVO_CHECKPOINT, pop,
+                                        melhor_individuo_geral, g,
+                                        hash_instancia, stats_hist,
+                                        estatisticas_operadores,
+                                        dados_instancia,
+                                        CONFIGURACAO_EXECUCAO)
+        perfil.marca("gravacao_checkpoint")
 
         # imprime melhores resultados na tela
         print("   Melhor = " +
@@ -491,16 +1010,43 @@ def main():
               "  Desvio = " +
               '{:,.0f}'.format(stats_hist.select('std')[-1]))
 
+        # imprime o gap de otimalidade do melhor individuo geral
+        gap_absoluto, gap_relativo = limite_inferior.gap_otimalidade(
+            performance_melhor_individuo_geral, limite_performance)
+        print("   Gap = " + '{:,.0f}'.format(gap_absoluto) +
+              " (" + '{:.2%}'.format(gap_relativo) + ")")
+
+        # encerra a evolucao caso o gap seja pequeno o suficiente
+        if GAP_RELATIVO_PARADA is not None and \
+                gap_relativo <= GAP_RELATIVO_PARADA:
+            print("Gap de otimalidade atingido na geração %i" % g)
+            break
+
+        # encerra a evolucao ao esgotar o tempo ou as avaliacoes
+        if TEMPO_MAXIMO_EXECUCAO is not None and \
+                time.perf_counter() - inicio >= TEMPO_MAXIMO_EXECUCAO:
+            print("Tempo máximo atingido na geração %i" % g)
+            break
+        if NUMERO_MAXIMO_AVALIACOES is not None and \
+                avaliacoes >= NUMERO_MAXIMO_AVALIACOES:
+            print("Número máximo de avaliações atingido na geração %i" % g)
+            break
+
     # Finaliza o programa, gravando arquivos, planilhas e print na tela
     if g > 0:  # o algoritmo genetico foi executado
         print("-- Final com sucesso  --")
 
         # cria a planilha de saida, e grava o melhor resultado
-        print("Melhor resultado geral =  ",
-              '{:,.0f}'.format(f_obj.performance(melhor_individuo_geral)),
-              util.grava_planilha_saida(melhor_individuo_geral,
-                                        PLANILHA_DADOS_SAIDA, df_id_contratos,
-                                        df_contratos, df_detalhes_projetos))
+        if gravador is None:
+            print("Melhor resultado geral =  ",
+                  '{:,.0f}'.format(f_obj.performance(melhor_individuo_geral)),
+                  util.grava_planilha_saida(melhor_individuo_geral,
+                                            PLANILHA_DADOS_SAIDA,
+                                            df_id_contratos, df_contratos,
+                                            df_detalhes_projetos))
+        else:
+            print("Melhor resultado geral =  ",
+                  '{:,.0f}'.format(f_obj.performance(melhor_individuo_geral)))
 
         # Salva em disco a ultima populacao para permitir continuar
         # a otimizacao posteriormente
@@ -511,6 +1057,184 @@ def main():
         # grava arquivo historico das etatisticas em arquivo
         util.grava_historico(NOME_ARQUIVO_HISTORICO, stats_hist)
 
+        checkpoint.grava_checkpoint(NOME_ARQUIVO_CHECKPOINT, pop,
+                                    melhor_individuo_geral, g,
+                                    hash_instancia, stats_hist,
+                                    estatisticas_operadores,
+                                    dados_instancia,
+                                    CONFIGURACAO_EXECUCAO)
+
+    if registro_metricas is not None:
+        registro_metricas.fecha()
+
+    if monitoramento is not None:
+        monitoramento.fecha()
+
+    # imprime o tempo gasto em cada etapa da geracao
+    perfil.imprime_resumo()
+
+    # aguarda a gravacao pendente da planilha de saida
+    if gravador is not None:
+        gravador.encerra(melhor_individuo_geral)
+        print("Planilha de saída gravada %i vezes" % gravador.gravacoes)
+
+    # encerra as conexoes com os servidores de avaliacao
+    if avaliador is not None:
+        avaliador.fecha()
+
+    # refina o melhor individuo do algoritmo genetico com a busca tabu
+    if MOTOR_OTIMIZACAO == "genetico_tabu" and \
+            melhor_individuo_geral is not None:
+        executa_modo_tabu(df_projetos, df_detalhes_projetos,
+                          projetos_excluidos, df_contratos, df_id_contratos,
+                          melhor_individuo_geral)
+
+
+def atualiza_estatisticas_operadores(estatisticas_operadores, toolbox,
+                                     melhorou):
+    # conta o uso dos operadores de cruzamento e mutacao registrados na
+    # geracao (ver cruzamento.tipo e mutacao.tipo), e as melhorias
+    for tipo, operador in (("cruzamento", toolbox.mate),
+                           ("mutacao", toolbox.mutate)):
+        nome = getattr(operador, "func", operador).__name__
+        usos, melhorias = estatisticas_operadores[tipo].get(nome, (0, 0))
+        estatisticas_operadores[tipo][nome] = (usos + 1,
+                                               melhorias + int(melhorou))
+    return
+
+
+def executa_modo_ilhas(df_projetos, df_detalhes_projetos, projetos_excluidos,
+                       df_contratos, df_id_contratos):
+    # executa o modelo de ilhas e grava os resultados consolidados
+    print("Inicio - %i ilhas" % NUMERO_ILHAS)
+    hof_melhores_individuos_geral, historico = \
+        ilhas.executa_ilhas(df_id_contratos, df_contratos, df_projetos,
+                            projetos_excluidos, numero_ilhas=NUMERO_ILHAS,
+                            numero_geracoes=NUMERO_GERACOES,
+                            tamanho_populacao=TAMANHO_POPULACAO)
+    grava_resultado_hof(hof_melhores_individuos_geral, df_id_contratos,
+                        df_contratos, df_projetos, df_detalhes_projetos)
+    return
+
+
+def executa_modo_estado_estavel(df_projetos, df_detalhes_projetos,
+                                projetos_excluidos, df_contratos,
+                                df_id_contratos):
+    # executa a evolucao em estado estavel e grava os resultados
+    print("Inicio - estado estável")
+    pop, hof_melhores_individuos_geral, estatisticas = \
+        estado_estavel.executa_estado_estavel(
+            df_id_contratos, df_contratos, df_projetos, projetos_excluidos,
+            tamanho_populacao=TAMANHO_POPULACAO,
+            numero_avaliacoes=NUMERO_GERACOES * TAMANHO_POPULACAO,
+            numero_processos=estado_estavel.NUMERO_PROCESSOS)
+    print("Avaliações = %i  Avaliações/s = %.1f  Utilização = %.0f%%"
+          % (estatisticas["avaliacoes"],
+             estatisticas["avaliacoes_por_segundo"],
+             100 * estatisticas["utilizacao"]))
+
+    grava_resultado_hof(hof_melhores_individuos_geral, df_id_contratos,
+                        df_contratos, df_projetos, df_detalhes_projetos)
+    return
+
+
+def executa_modo_matricial(df_projetos, df_detalhes_projetos,
+                           projetos_excluidos, df_contratos, df_id_contratos):
+    # executa o algoritmo genetico com a populacao em arrays e grava os
+    # resultados
+    print("Inicio - população matricial")
+    registro = []
+    pop, historico = populacao_matricial.executa_otimizacao_matricial(
+        df_id_contratos, df_contratos, df_projetos, projetos_excluidos,
+        tamanho_populacao=TAMANHO_POPULACAO, numero_geracoes=NUMERO_GERACOES,
+        tempo_maximo=TEMPO_MAXIMO_EXECUCAO, semente=SEMENTE,
+        registro=registro)
+    if NOME_ARQUIVO_METRICAS is not None:
+        registro_metricas = metricas.RegistroMetricas(
+            NOME_ARQUIVO_METRICAS,
+            numero_registros=metricas.NUMERO_REGISTROS_DESCARGA,
+            intervalo=metricas.INTERVALO_DESCARGA)
+        if CONFIGURACAO_EXECUCAO is not None:
+            registro_metricas.registra_configuracao(CONFIGURACAO_EXECUCAO)
+        for metricas_geracao in registro:
+            registro_metricas.registra(metricas_geracao)
+        registro_metricas.fecha()
+    if len(historico) > 0:
+        geracao, tempo, melhor = historico[-1]
+        print("Gerações = %i  Tempo = %.1f s  Gerações/s = %.1f" %
+              (geracao, tempo, geracao / max(tempo, 1e-9)))
+
+    hof_melhores_individuos_geral = tools.HallOfFame(
+        NUMERO_MELHORES_INDIVIDUOS_GUARDADO)
+    hof_melhores_individuos_geral.update(
+        [ind for ind in pop if ind.fitness.valid])
+    grava_resultado_hof(hof_melhores_individuos_geral, df_id_contratos,
+                        df_contratos, df_projetos, df_detalhes_projetos)
+    return
+
+
+def executa_modo_tabu(df_projetos, df_detalhes_projetos, projetos_excluidos,
+                      df_contratos, df_id_contratos, individuo_inicial=None):
+    # executa a busca tabu e grava o melhor resultado
+    toolbox, num_contratos = configura_toolbox(df_id_contratos, df_contratos,
+                                               df_projetos)
+    if individuo_inicial is None:
+        individuo_inicial = tabu.le_solucao_inicial(
+            util.NOME_ARQUIVO_MELHOR_INDIVIDUO, len(df_projetos))
+    if individuo_inicial is None:
+        print("Inicio - busca tabu a partir de uma alocação aleatória")
+        individuo_inicial = toolbox.individual()
+    else:
+        print("Inicio - busca tabu a partir do melhor indivíduo")
+
+    genes, estatisticas = tabu.busca_tabu(
+        individuo_inicial, df_id_contratos, df_contratos, df_projetos,
+        projetos_excluidos, numero_iteracoes=NUMERO_ITERACOES_TABU,
+        tempo_maximo=TEMPO_MAXIMO_TABU)
+    print("Iterações = %i  Movimentos avaliados = %i  Movimentos/s = %.0f"
+          % (estatisticas["iteracoes"], estatisticas["movimentos_avaliados"],
+             estatisticas["movimentos_por_segundo"]))
+    print("Busca tabu: " + '{:,.0f}'.format(estatisticas["custo_inicial"]) +
+          " -> " + '{:,.0f}'.format(estatisticas["custo_final"]))
+
+    melhor_individuo = creator.Individual(genes)
+    melhor_individuo.fitness.values = toolbox.evaluate(melhor_individuo)
+    hof_melhores_individuos = tools.HallOfFame(1)
+    hof_melhores_individuos.update([melhor_individuo])
+    grava_resultado_hof(hof_melhores_individuos, df_id_contratos,
+                        df_contratos, df_projetos, df_detalhes_projetos)
+    return
+
+
+def grava_resultado_hof(hof_melhores_individuos_geral, df_id_contratos,
+                        df_contratos, df_projetos, df_detalhes_projetos):
+    # grava o melhor individuo do hall of fame na planilha de saida, e os
+    # melhores individuos como populacao final
+    if len(hof_melhores_individuos_geral) == 0:
+        return
+
+    print("-- Final com sucesso  --")
+    # o hall of fame e ordenado pelos valores do fitness, e nao como na
+    # selecao (pela performance ou pelas regras de Deb)
+    viabilidade = selecao.usa_selecao_viabilidade(df_id_contratos,
+                                                  df_contratos, df_projetos)
+    melhor_individuo_geral = selecao.melhor_individuo(
+        hof_melhores_individuos_geral, viabilidade)
+    util.grava_individuo(NOME_ARQUIVO_MELHORES_RESULTADOS,
+                         melhor_individuo_geral)
+    print("Melhor resultado geral =  ",
+          '{:,.0f}'.format(f_obj.performance(melhor_individuo_geral)),
+          util.grava_planilha_saida(melhor_individuo_geral,
+                                    PLANILHA_DADOS_SAIDA, df_id_contratos,
+                                    df_contratos, df_detalhes_projetos))
+
+    # Salva em disco os melhores individuos como a populacao final,
+    # para permitir continuar a otimizacao posteriormente
+    hof_populacao_final = tools.HallOfFame(TAMANHO_POPULACAO)
+    hof_populacao_final.update(hof_melhores_individuos_geral)
+    util.grava_populacao(NOME_ARQUIVO_POPULACAO_FINAL, hof_populacao_final)
+    return
+
 
 if __name__ == "__main__":
     main()
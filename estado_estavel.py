@@ -0,0 +1,256 @@
+"""
+Evolucao em estado estavel (steady-state), assincrona, sem a barreira de
+fim de geracao do algoritmo genetico geracional.
+
+Os individuos sao avaliados em um conjunto de processos. Sempre que um
+processo devolve a performance de um individuo:
+    - o individuo e inserido na populacao, substituindo o pior individuo
+      ("pior") ou o pior de um torneio sorteado ("torneio"), caso seja
+      melhor, comparado como na selecao (pela performance, ou pelas regras
+      de Deb nas instancias viaveis);
+    - um novo individuo e criado imediatamente, com os mesmos operadores
+      de cruzamento e mutacao do algoritmo geracional, e enviado para
+      avaliacao.
+
+Desta forma os processos nao ficam ociosos esperando o individuo mais lento
+de cada geracao. Sao reportadas as avaliacoes por segundo e a utilizacao
+dos processos (tempo avaliando / tempo total).
+
+"""
+import os
+import math
+import random
+import time
+import concurrent.futures
+
+from deap import tools
+
+import distribuicao
+import cruzamento
+import mutacao
+import selecao
+import funcao_objetivo as f_obj
+import funcao_restricao as negocio
+
+# Definicao de constantes e parametros
+NUMERO_PROCESSOS = os.cpu_count()
+SUBSTITUICAO = "pior"  # "pior" ou "torneio"
+TAMANHO_TORNEIO_SUBSTITUICAO = 4
+TAMANHO_TORNEIO_PAIS = 3
+PROBABILIDADE_CROSSOVER = 0.5
+INTERVALO_RELATORIO = 100  # avaliacoes entre cada relatorio na tela
+NUMERO_MELHORES_INDIVIDUOS_GUARDADO = 500
+
+def avalia_genes(genes):
+    # avalia um individuo no processo de avaliacao, devolvendo tambem o
+    # tempo gasto, para o calculo da utilizacao dos processos
+    inicio = time.perf_counter()
+    df_id_contratos, df_contratos, df_projetos = f_obj.dados_processo()
+    fitness = f_obj.funcao_objetivo(genes, df_id_contratos, df_contratos,
+                                    df_projetos)
+    return fitness, time.perf_counter() - inicio
+
+
+"""
+funcao: executa_estado_estavel(df_id_contratos, df_contratos, df_projetos,
+                               projetos_excluidos, tamanho_populacao,
+                               numero_avaliacoes, numero_processos,
+                               substituicao)
+
+  Objetivo: Executa a evolucao em estado estavel, mantendo sempre todos os
+            processos de avaliacao ocupados.
+
+  Parametros:
+             df_id_contratos, df_contratos, df_projetos: dados lidos da
+                                                        planilha de entrada;
+             projetos_excluidos: posicoes dos projetos que ficam sempre
+                                 nao alocados (ex.: fixados pelo presolve);
+             tamanho_populacao: tamanho da populacao mantida;
+             numero_avaliacoes: numero total de avaliacoes da funcao
+                                objetivo (criterio de parada);
+             numero_processos: numero de processos de avaliacao;
+             substituicao: "pior" ou "torneio".
+
+  Retorna:
+          pop: populacao final, ordenada como na selecao;
+          hof: Hall of Fame do DEAP com os melhores individuos;
+          estatisticas: dicionario com "avaliacoes", "tempo",
+                        "avaliacoes_por_segundo" e "utilizacao".
+"""
+def executa_estado_estavel(df_id_contratos, df_contratos, df_projetos,
+                           projetos_excluidos=(),
+                           tamanho_populacao=distribuicao.TAMANHO_POPULACAO,
+                           numero_avaliacoes=distribuicao.NUMERO_GERACOES *
+                           distribuicao.TAMANHO_POPULACAO,
+                           numero_processos=NUMERO_PROCESSOS,
+                           substituicao=SUBSTITUICAO):
+    toolbox, num_contratos = \
+        distribuicao.configura_toolbox(df_id_contratos, df_contratos,
+                                       df_projetos)
+    hof = tools.HallOfFame(NUMERO_MELHORES_INDIVIDUOS_GUARDADO)
+    # os individuos sao comparados como na selecao
+    viabilidade = selecao.usa_selecao_viabilidade(df_id_contratos,
+                                                  df_contratos, df_projetos)
+
+    pop = []
+    # genes dos individuos da populacao e dos que estao sendo avaliados,
+    # para nao criar individuos duplicados
+    genes_existentes = set()
+    pendentes = {}
+    avaliacoes = 0
+    tempo_avaliando = 0.
+    melhor = None
+    inicio = time.perf_counter()
+
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=numero_processos,
+            initializer=f_obj.inicializa_processo,
+            initargs=(df_id_contratos, df_contratos, df_projetos)) as executor:
+
+        def envia(ind):
+            # os projetos excluidos ficam no contrato em branco, como em
+            # distribuicao.executa_geracao
+            negocio.exclui_projetos([ind], projetos_excluidos, num_contratos)
+            chave = tuple(ind)
+            if chave in genes_existentes:
+                return
+            genes_existentes.add(chave)
+            futuro = executor.submit(avalia_genes, ind[:])
+            pendentes[futuro] = ind
+
+        # populacao inicial aleatoria
+        for ind in toolbox.population(n=tamanho_populacao):
+            envia(ind)
+
+        while len(pendentes) > 0:
+            concluidos, nao_concluidos = concurrent.futures.wait(
+                pendentes, return_when=concurrent.futures.FIRST_COMPLETED)
+
+            for futuro in concluidos:
+                ind = pendentes.pop(futuro)
+                fitness, tempo = futuro.result()
+                avaliacoes += 1
+                tempo_avaliando += tempo
+                ind.fitness.values = fitness
+
+                if math.isnan(f_obj.performance(ind)) or \
+                        not insere_individuo(pop, ind, tamanho_populacao,
+                                             substituicao, genes_existentes,
+                                             viabilidade):
+                    genes_existentes.discard(tuple(ind))
+                elif melhor is None or \
+                        selecao.supera_melhor(ind, melhor, viabilidade):
+                    # guarda no hall of fame cada novo melhor individuo
+                    melhor = toolbox.clone(ind)
+                    hof.insert(melhor)
+
+                if avaliacoes % INTERVALO_RELATORIO == 0:
+                    imprime_relatorio(avaliacoes, pop, inicio,
+                                      tempo_avaliando, numero_processos)
+
+                # cria e envia novos individuos enquanto houver avaliacoes
+                # disponiveis, mantendo os processos ocupados. Limita as
+                # tentativas, pois os novos individuos podem ser duplicados
+                tentativas = 0
+                while len(pop) >= 2 and \
+                        avaliacoes + len(pendentes) < numero_avaliacoes and \
+                        len(pendentes) < numero_processos and \
+                        tentativas < 10 * numero_processos:
+                    tentativas += 1
+                    for novo in cria_descendentes(pop, toolbox, num_contratos,
+                                                  df_id_contratos,
+                                                  df_contratos, df_projetos):
+                        envia(novo)
+
+    tempo_total = time.perf_counter() - inicio
+    pop = selecao.ordena_melhores(pop, viabilidade)
+    estatisticas = {"avaliacoes": avaliacoes,
+                    "tempo": tempo_total,
+                    "avaliacoes_por_segundo": avaliacoes / tempo_total,
+                    "utilizacao": tempo_avaliando /
+                                  (tempo_total * numero_processos)}
+
+    return pop, hof, estatisticas
+
+
+def cria_descendentes(pop, toolbox, num_contratos, df_id_contratos,
+                      df_contratos, df_projetos):
+    # cria novos individuos por cruzamento (2 filhos) ou mutacao (1 filho),
+    # com os operadores sorteados como no algoritmo geracional
+    viabilidade = selecao.usa_selecao_viabilidade(df_id_contratos,
+                                                  df_contratos, df_projetos)
+    if random.random() < PROBABILIDADE_CROSSOVER:
+        toolbox = cruzamento.tipo(toolbox, num_contratos, df_id_contratos,
+                                  df_contratos, df_projetos)
+        pai_1, pai_2 = [torneio(pop, TAMANHO_TORNEIO_PAIS, viabilidade)
+                        for i in range(2)]
+        filho_1 = toolbox.clone(pai_1)
+        filho_2 = toolbox.clone(pai_2)
+        toolbox.mate(filho_1, filho_2)
+        del filho_1.fitness.values
+        del filho_2.fitness.values
+        return [filho_1, filho_2]
+
+    toolbox = mutacao.tipo(toolbox, numero_contratos=num_contratos,
+                           indice_contratos=df_id_contratos,
+                           contratos=df_contratos, projetos=df_projetos)
+    mutante = toolbox.clone(torneio(pop, TAMANHO_TORNEIO_PAIS,
+                                    viabilidade))
+    toolbox.mutate(mutante)
+    del mutante.fitness.values
+    return [mutante]
+
+
+def torneio(pop, tamanho, viabilidade):
+    # torneio comparado como na selecao (soma da performance, ou regras de
+    # Deb). O tools.selTournament do DEAP compara os valores do fitness em
+    # ordem lexicografica, ou seja, praticamente so o desvio do primeiro
+    # contrato
+    return selecao.melhor_individuo(random.choices(pop, k=tamanho),
+                                    viabilidade)
+
+
+def insere_individuo(pop, ind, tamanho_populacao, substituicao,
+                     genes_existentes, viabilidade):
+    # insere o individuo avaliado na populacao. Devolve False caso o
+    # individuo tenha sido descartado
+    if len(pop) < tamanho_populacao:
+        pop.append(ind)
+        return True
+
+    if substituicao == "torneio":
+        candidatos = random.sample(range(len(pop)),
+                                   min(TAMANHO_TORNEIO_SUBSTITUICAO,
+                                       len(pop)))
+    else:
+        candidatos = range(len(pop))
+    pior = max(candidatos,
+               key=lambda i: selecao.chave_selecao(pop[i], viabilidade))
+
+    if not selecao.supera_melhor(ind, pop[pior], viabilidade):
+        return False
+
+    genes_existentes.discard(tuple(pop[pior]))
+    pop[pior] = ind
+    return True
+
+
+def imprime_relatorio(avaliacoes, pop, inicio, tempo_avaliando,
+                      numero_processos):
+    # imprime na tela o andamento da evolucao
+    tempo = time.perf_counter() - inicio
+    melhor = min(f_obj.performance(ind) for ind in pop)
+    print("Avaliações %i - Melhor = %s  Avaliações/s = %.1f"
+          "  Utilização = %.0f%%"
+          % (avaliacoes, '{:,.0f}'.format(melhor), avaliacoes / tempo,
+             100 * tempo_avaliando / (tempo * numero_processos)))
+    return
+
+
+def main():
+    # definir rotinas de testes para as funcoes do modulo
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -18,6 +18,33 @@ import funcao_restricao as negocio
 NOME_ARQUIVO_INDIVIDUOS_VALIDOS = "Individuos_Validos.rca"
 FATOR_MUITO_PEQUENO = 1e-12
 
+# grava em arquivo os individuos validos avaliados. Desabilitado nos
+# processos paralelos, para nao competirem pelo mesmo arquivo
+GRAVA_INDIVIDUOS_VALIDOS = True
+
+# calcula a performance com os valores em centavos inteiros, sem o pandas
+# (ver funcao_objetivo_centavos). False usa o calculo original com
+# dataframes (carrega_consolida_individuo)
+AVALIACAO_CENTAVOS = True
+
+# diferenca maxima, em R$, entre os desvios do calculo em centavos e do
+# calculo com dataframes (limites arredondados para centavos)
+TOLERANCIA_CENTAVOS = 0.02
+
+# classificacoes dos projetos, na ordem das colunas consolidadas
+CLASSIFICACOES = ["EMPRESA", "EXTERNO", "INTERNO"]
+
+# valores dos projetos e limites dos contratos convertidos para centavos,
+# calculados uma vez para os dataframes em uso (prepara_centavos)
+_dados_centavos = {}
+
+# regras de negocio ativas do calculo com dataframes, calculadas uma vez
+# para os contratos em uso (funcao_restricao.regras_ativas)
+_regras_ativas = {}
+
+# dados de entrada carregados em cada processo paralelo (inicializa_processo)
+_dados_processo = {}
+
 
 """
 funcao: funcao_objetivo(individuo, indice_contratos, contratos, projetos):
@@ -44,6 +71,16 @@ funcao: funcao_objetivo(individuo, indice_contratos, contratos, projetos):
           
 """
 def funcao_objetivo(individuo, indice_contratos, contratos, projetos):
+    # o calculo em centavos nao aplica negocio.todos_contratos_alocados:
+    # o merge de carrega_consolida_individuo mantem todos os contratos, e
+    # len(df) < len(indice_contratos) nunca ocorre; e alocar_contrato
+    # procura projetos livres no contrato len(indice_contratos), que nao
+    # existe no individuo (o contrato em branco e len - 1). O reparo nao
+    # altera o individuo (verificado em main)
+    if AVALIACAO_CENTAVOS:
+        return funcao_objetivo_centavos(individuo, indice_contratos,
+                                        contratos, projetos)
+
     df = util.carrega_consolida_individuo(individuo,
                                           indice_contratos,
                                           contratos, projetos)
@@ -61,10 +98,15 @@ def funcao_objetivo(individuo, indice_contratos, contratos, projetos):
 
     # inclui no dataframe a avaliacao das regras de negocio para
     # todos os contratos
-    df, valido, regra_ativa = negocio.funcao_restricao(df)
+    if _regras_ativas.get("contratos") is not contratos:
+        _regras_ativas.clear()
+        _regras_ativas.update(contratos=contratos,
+                              regras=negocio.regras_ativas(df))
+    df, valido, regra_ativa = negocio.funcao_restricao(
+        df, _regras_ativas["regras"])
 
     # grava individuo valido em arquivo
-    if valido:
+    if valido and GRAVA_INDIVIDUOS_VALIDOS:
         util.grava_individuo(NOME_ARQUIVO_INDIVIDUOS_VALIDOS,
                              individuo)
 
@@ -97,6 +139,103 @@ def funcao_objetivo(individuo, indice_contratos, contratos, projetos):
     return r  # retorna obrigatoriamente um tuple
 
 
+"""
+funcao: funcao_objetivo_centavos(individuo, indice_contratos, contratos,
+                                 projetos)
+
+  Objetivo: Calcula a mesma performance de funcao_objetivo, com os valores
+            dos projetos e os limites dos contratos em centavos (int64),
+            convertidos uma unica vez (prepara_centavos).
+            Os totais por contrato e classificacao sao somados com
+            np.bincount, e os desvios sao exatos e deterministicos.
+            Os desvios diferem do calculo com dataframes em no maximo
+            TOLERANCIA_CENTAVOS, pelo arredondamento dos limites que nao
+            sao centavos inteiros (verificado em main).
+            Contratos sem nenhum projeto alocado tem total 0 e o desvio
+            de toda a obrigacao, e nao performance invalida (NaN) como no
+            calculo com dataframes, em que o contrato nao tem nenhuma
+            linha no pivot_table.
+
+  Retorna:
+          O valor da performance, no mesmo formato de funcao_objetivo
+          (desvios em R$)
+"""
+def funcao_objetivo_centavos(individuo, indice_contratos, contratos,
+                             projetos):
+    dados = prepara_centavos(indice_contratos, contratos, projetos)
+    num_contratos = dados["numero_contratos"]
+    limites = dados["limites"]
+
+    # totais por contrato (linhas) e classificacao (colunas). As somas
+    # em float64 de centavos inteiros sao exatas ate 2**53 centavos
+    genes = np.asarray(individuo, dtype=np.int64)[dados["posicoes"]]
+    totais = np.bincount(genes * len(CLASSIFICACOES) + dados["classif"],
+                         weights=dados["valores"],
+                         minlength=(num_contratos + 1) * len(CLASSIFICACOES))
+    # retira o contrato em branco, dos projetos nao alocados
+    totais = totais.reshape(-1, len(CLASSIFICACOES))[0:num_contratos]
+    totais = totais.astype(np.int64)
+    externo = totais[:, 1]
+    interno = totais[:, 2]
+
+    # desvios das 3 regras de negocio: (TOTAL - Obrigação),
+    # (EXTERNO - Mínimo Externo) e (Máximo Interno - INTERNO)
+    desvios = np.empty((num_contratos, 3), dtype=np.int64)
+    desvios[:, 0] = totais.sum(axis=1) - limites[:, 0]
+    desvios[:, 1] = externo - limites[:, 1]
+    maximo_interno = limites[:, 2] - interno
+    # os valores positivos do "Critério Máximo Interno" nao sao penalidade
+    desvios[:, 2] = np.minimum(maximo_interno, 0)
+
+    # desconsidera os desvios das regras de negocio NAO ativas
+    desvios[~dados["ativas"]] = 0
+
+    # grava individuo valido em arquivo. Como em funcao_restricao, a linha
+    # do "Total Geral" tambem precisa atender as regras
+    if GRAVA_INDIVIDUOS_VALIDOS and (desvios >= 0).all() and \
+            desvios[:, 0].sum() >= 0 and \
+            externo.sum() >= limites[:, 1].sum() and \
+            maximo_interno.sum() >= 0:
+        util.grava_individuo(NOME_ARQUIVO_INDIVIDUOS_VALIDOS, individuo)
+
+    tab_desvios = desvios / 100.
+    tab_performance = tab_desvios * tab_desvios
+    return salva_performance(tab_performance, tab_desvios)
+
+
+def prepara_centavos(indice_contratos, contratos, projetos):
+    # converte para centavos os valores dos projetos e os limites dos
+    # contratos, uma vez para cada conjunto de dataframes
+    dados = _dados_centavos
+    if dados.get("projetos") is projetos and \
+            dados.get("contratos") is contratos:
+        return dados
+
+    valores = np.nan_to_num(
+        projetos["Valor Pago(R$)"].to_numpy(dtype=np.float64))
+    classif = np.full(len(projetos), -1, dtype=np.int64)
+    for codigo, nome in enumerate(CLASSIFICACOES):
+        classif[(projetos["Classif"] == nome).to_numpy()] = codigo
+    # considera somente os projetos com classificacao conhecida, como na
+    # consolidacao por classificacao (pivot_table)
+    posicoes = np.flatnonzero(classif >= 0)
+
+    # contratos na ordem dos indices, sem o contrato em branco
+    num_contratos = len(indice_contratos) - 1
+    contratos_reais = contratos.sort_values("ID_Contrato")[0:num_contratos]
+    limites = contratos_reais[["Obrigação - PETROBRAS", "Mínimo Externo",
+                               "Máximo Interno"]].to_numpy(dtype=np.float64)
+
+    dados.clear()
+    dados.update(projetos=projetos, contratos=contratos,
+                 numero_contratos=num_contratos, posicoes=posicoes,
+                 valores=np.round(valores[posicoes] * 100),
+                 classif=classif[posicoes],
+                 limites=np.round(limites * 100).astype(np.int64),
+                 ativas=limites > 0)
+    return dados
+
+
 def cria_performance(num_contratos):
     # otimizacao multivariavel da tabela de desvios, calculada na
     # funcao objetivo.
@@ -179,8 +318,125 @@ def tabela_desvios(individuo):
     return tab_desvios
 
 
+"""
+funcao: indicadores_viabilidade(individuos)
+
+  Objetivo: Calcula, para toda a populacao de uma vez, a partir da tabela
+            de desvios do fitness:
+                - violacao: soma dos valores que faltam para atender as
+                  regras de negocio ativas (desvios negativos), em R$.
+                  0 para os individuos validos;
+                - excesso: soma dos valores alocados alem da obrigacao
+                  (desvios positivos do "Critério (TOTAL - Obrigação)");
+                - performance: como em performance(individuo).
+
+  Parametros:
+             individuos: lista de individuos com o fitness calculado.
+
+  Retorna:
+          violacao, excesso, performance: arrays com um valor por
+                                          individuo.
+"""
+def indicadores_viabilidade(individuos):
+    fit = np.array([ind.fitness.values for ind in individuos],
+                   dtype=np.float64).reshape(len(individuos), -1)
+    metade = fit.shape[1] // 2
+    performance = fit[:, 0:metade].sum(axis=1)
+    desvios = fit[:, metade:] / FATOR_MUITO_PEQUENO
+    violacao = -np.minimum(desvios, 0).sum(axis=1)
+    excesso = np.maximum(desvios[:, 0::3], 0).sum(axis=1)
+    return violacao, excesso, performance
+
+
+def supera_viabilidade(individuo_1, individuo_2):
+    # regras de Deb: um individuo valido supera um invalido; entre
+    # validos, vence a menor performance; entre invalidos, a menor violacao
+    violacao, excesso, perf = indicadores_viabilidade([individuo_1,
+                                                       individuo_2])
+    return (violacao[0], perf[0]) < (violacao[1], perf[1])
+
+
+def individuo_valido(individuo):
+    # verifica, pela tabela de desvios do fitness, se o individuo atende a
+    # todas as regras de negocio ativas. As regras nao ativas tem desvio 0,
+    # e o "Critério Máximo Interno" so guarda os desvios negativos.
+    fit = individuo.fitness.values
+    desvios = np.array(fit[int(len(fit) / 2):])
+    return bool((desvios >= 0).all())
+
+
+"""
+funcao: inicializa_processo(*dados) / dados_processo()
+
+  Objetivo: inicializa_processo e o initializer dos pools de processos
+            (estado estavel, portfolio, cenarios): executada uma vez em
+            cada processo, guarda os dados de entrada recebidos e desabilita
+            a gravacao dos individuos validos em disco.
+            dados_processo devolve o tuple de dados guardado no processo.
+"""
+def inicializa_processo(*dados):
+    global GRAVA_INDIVIDUOS_VALIDOS
+    _dados_processo["dados"] = dados
+    GRAVA_INDIVIDUOS_VALIDOS = False
+    return
+
+
+def dados_processo():
+    return _dados_processo["dados"]
+
+
 def main():
     # definir rotinas de testes para as funcoes do modulo
+    import distribuicao
+
+    global GRAVA_INDIVIDUOS_VALIDOS
+
+    # ### TESTE ### calculo em centavos x calculo com dataframes
+    df_projetos, _, _, df_contratos, df_id_contratos = \
+        util.le_planilha_entrada(
+            distribuicao.PLANILHA_DADOS_ENTRADA,
+            distribuicao.NOME_ABA_ENTRADA_VALORES_A_DISTRIBUIR,
+            distribuicao.NOME_ABA_ENTRADA_CONTRATOS)
+    num_contratos = len(df_id_contratos) - 1
+    GRAVA_INDIVIDUOS_VALIDOS = False
+    gerador = np.random.default_rng(0)
+
+    def avalia_dois_calculos(individuo):
+        global AVALIACAO_CENTAVOS
+        AVALIACAO_CENTAVOS = False
+        pandas = funcao_objetivo(individuo, df_id_contratos,
+                                 df_contratos, df_projetos)
+        AVALIACAO_CENTAVOS = True
+        centavos = funcao_objetivo(individuo, df_id_contratos,
+                                   df_contratos, df_projetos)
+        metade = len(centavos) // 2
+        return (np.array(pandas[metade:]) / FATOR_MUITO_PEQUENO,
+                np.array(centavos[metade:]) / FATOR_MUITO_PEQUENO)
+
+    # individuos com todos os contratos alocados: mesmos desvios
+    diferenca = 0.
+    for i in range(20):
+        individuo = list(gerador.integers(0, num_contratos + 1,
+                                          len(df_projetos)))
+        individuo[0:num_contratos] = range(num_contratos)
+        desvios_pandas, desvios_centavos = avalia_dois_calculos(individuo)
+        diferenca = max(diferenca,
+                        np.abs(desvios_pandas - desvios_centavos).max())
+    assert diferenca <= TOLERANCIA_CENTAVOS, diferenca
+    print("diferenca maxima dos desvios (R$):", round(diferenca, 4))
+
+    # contrato 0 sem projetos: o reparo nao altera o individuo, e so o
+    # calculo em centavos tem desvios validos
+    individuo = [num_contratos if c == 0 else c for c in individuo]
+    original = individuo[:]
+    negocio.todos_contratos_alocados(individuo, df_id_contratos)
+    assert individuo == original
+    desvios_pandas, desvios_centavos = avalia_dois_calculos(individuo)
+    assert np.isfinite(desvios_centavos).all()
+    print("contrato sem projetos, desvios NaN no calculo com dataframes:",
+          int(np.isnan(desvios_pandas).sum()))
+    # ### TESTE ###
+
     return
 
 
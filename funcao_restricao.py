@@ -1,5 +1,5 @@
 """
-funcao: funcao_restricao(df):
+funcao: funcao_restricao(df, regra_ativa):
 
   Objetivo: Verifica as restricoes inerentes as regras de negocio e inclui
             no dataframe passado uma coluna identificando quais contratos
@@ -12,6 +12,8 @@ funcao: funcao_restricao(df):
   Parametros:
               df: dataframe com os valores consolidados de um individuo
                   nos contratos para verificacao das regras de negocio. 
+              regra_ativa: regras de negocio ativas, calculadas por
+                           regras_ativas. None calcula a partir de df.
                   
 
   Retorna:
@@ -39,19 +41,15 @@ import random
 # declaracao deconstantes
 NUMERO_MIN_PROJETOS_POR_CONTRATO = 1
 
-def funcao_restricao(df):
+def funcao_restricao(df, regra_ativa=None):
     # identifica se as regras de negocio de cada contrato estao sendo
     # atendidas, bem como o total da obrigacao.
 
-    # verifica quais regras de negocio estao ativas, preenchidas com
-    # algum valor positivo diferente de 0.
-    # cria uma serie para cada uma das 3 regras de negocio, identificando
-    # como:
-    #       True = regra ativa
-    #       False = regra NAO esta ativa
-    r1_ativo = df["Obrigação - PETROBRAS"] > 0
-    r2_ativo = df["Mínimo Externo"] > 0
-    r3_ativo = df["Máximo Interno"] > 0
+    # as regras ativas dependem apenas dos limites dos contratos, e podem
+    # ser calculadas uma unica vez (regras_ativas)
+    if regra_ativa is None:
+        regra_ativa = regras_ativas(df)
+    r1_ativo, r2_ativo, r3_ativo = regra_ativa
 
     # verifica a conformidade quanto ao atendimento das regras de negocio,
     # para cada contrato.
@@ -81,6 +79,20 @@ def funcao_restricao(df):
     return df, individuo_valido, (r1_ativo, r2_ativo, r3_ativo)
 
 
+def regras_ativas(df):
+    # verifica quais regras de negocio estao ativas, preenchidas com
+    # algum valor positivo diferente de 0.
+    # cria uma serie para cada uma das 3 regras de negocio, identificando
+    # como:
+    #       True = regra ativa
+    #       False = regra NAO esta ativa
+    r1_ativo = df["Obrigação - PETROBRAS"] > 0
+    r2_ativo = df["Mínimo Externo"] > 0
+    r3_ativo = df["Máximo Interno"] > 0
+
+    return r1_ativo, r2_ativo, r3_ativo
+
+
 def alocar_contrato(individuo, contrato, numero, indice_contratos):
     # um projeto desalocado e representato pela alocacao em um contrato
     # "vazio", incluido como ultima linha na tabela de indices de contrato
@@ -115,11 +127,12 @@ def todos_contratos_alocados(individuo, indice_contratos):
 
     return
 
-# Exclui da otimizacao os projetos marcados na planilha de entrada
+# Desaloca os projetos nas posicoes informadas. Os projetos marcados na
+# planilha de entrada ja sao retirados do individuo (le_planilha_entrada)
 def exclui_projetos(pop, projetos_excluidos, id_contrato_projeto_nao_alocado):
     if len(projetos_excluidos) > 0:
         for ind in pop:
-            for i in ind:
+            for i in projetos_excluidos:
                 ind[i] = id_contrato_projeto_nao_alocado
 
     return
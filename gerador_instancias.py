@@ -0,0 +1,170 @@
+"""
+Gerador de instancias sinteticas do RCA, para testar o desempenho do
+programa com numeros de projetos e contratos diferentes da planilha real.
+
+As instancias sao gravadas no mesmo formato da planilha de entrada
+(abas "projetos a distribuir" e "contratos", lidas por
+utilidades.le_planilha_entrada) e tambem na forma compilada
+(instancia.compila_instancia).
+
+Parametros configuraveis:
+    - numero de projetos e de contratos;
+    - distribuicao dos valores pagos dos projetos ("lognormal", "pareto"
+      ou "uniforme");
+    - proporcao de projetos EMPRESA, EXTERNO e INTERNO;
+    - folga: valor total dos projetos / soma das obrigacoes dos contratos.
+      Valores proximos de 1 (ou menores) tornam as regras mais dificeis
+      de atender;
+    - fracao do minimo externo sobre a obrigacao de cada contrato, e a
+      fracao de contratos sem maximo interno (todo o valor externo).
+
+"""
+import numpy as np
+import pandas as pd
+import openpyxl
+
+import instancia
+import gravador_saida
+
+# Definicao de constantes e parametros
+NOME_ABA_PROJETOS = "projetos a distribuir"
+NOME_ABA_CONTRATOS = "contratos"
+
+# proporcoes de EMPRESA, EXTERNO e INTERNO da planilha real
+PROPORCAO_CLASSIFICACOES = {"EMPRESA": 0.007, "EXTERNO": 0.44,
+                            "INTERNO": 0.553}
+VALOR_MEDIANO_PROJETO = 400000.  # R$
+FOLGA = 1.08
+FRACAO_MINIMO_EXTERNO = 0.5
+FRACAO_CONTRATOS_SEM_MAXIMO_INTERNO = 0.07
+FRACAO_PARTE_RCA = 0.45  # projetos marcados "Sim"
+
+# instancias gravadas por main(): (numero de projetos, numero de contratos)
+TAMANHOS_PADRAO = [(100, 5), (1000, 15), (10000, 40), (50000, 100)]
+
+
+"""
+funcao: gera_instancia(numero_projetos, numero_contratos, distribuicao,
+                       proporcao_classificacoes, folga,
+                       fracao_minimo_externo,
+                       fracao_contratos_sem_maximo_interno, semente)
+
+  Objetivo: Gera os dados de uma instancia sintetica, com as mesmas
+            colunas da planilha de entrada.
+
+  Retorna:
+          df_projetos: dataframe da aba "projetos a distribuir";
+          df_contratos: dataframe da aba "contratos".
+"""
+def gera_instancia(numero_projetos, numero_contratos,
+                   distribuicao="lognormal",
+                   proporcao_classificacoes=None, folga=FOLGA,
+                   fracao_minimo_externo=FRACAO_MINIMO_EXTERNO,
+                   fracao_contratos_sem_maximo_interno=
+                   FRACAO_CONTRATOS_SEM_MAXIMO_INTERNO,
+                   semente=0):
+    rng = np.random.default_rng(semente)
+    if proporcao_classificacoes is None:
+        proporcao_classificacoes = PROPORCAO_CLASSIFICACOES
+
+    # valores pagos dos projetos
+    if distribuicao == "lognormal":
+        valores = rng.lognormal(np.log(VALOR_MEDIANO_PROJETO), 1.2,
+                                numero_projetos)
+    elif distribuicao == "pareto":
+        valores = VALOR_MEDIANO_PROJETO / 2 * \
+            (1 + rng.pareto(1.5, numero_projetos))
+    elif distribuicao == "uniforme":
+        valores = rng.uniform(0, 2 * VALOR_MEDIANO_PROJETO, numero_projetos)
+    else:
+        raise ValueError("distribuicao desconhecida: " + str(distribuicao))
+    valores = np.round(np.maximum(valores, 0.01), 2)
+
+    # classificacoes dos projetos
+    nomes = list(proporcao_classificacoes)
+    proporcoes = np.array([proporcao_classificacoes[n] for n in nomes],
+                          dtype=float)
+    classif = rng.choice(nomes, numero_projetos,
+                         p=proporcoes / proporcoes.sum())
+    # funcao_objetivo precisa de ao menos um projeto de cada classificacao
+    ausentes = [n for n, p in zip(nomes, proporcoes)
+                if p > 0 and n not in classif]
+    posicoes = rng.choice(numero_projetos, len(ausentes), replace=False)
+    classif[posicoes] = ausentes
+
+    datas = pd.Timestamp(2019, 1, 1) + \
+        pd.to_timedelta(rng.integers(0, 365, numero_projetos), unit="D")
+    df_projetos = pd.DataFrame({
+        "Número ANP": np.arange(1, numero_projetos + 1),
+        "Data da Fatura": datas.strftime("%d/%m/%Y"),
+        "Valor Pago(R$)": valores,
+        "Irá fazer parte do RCA?":
+            np.where(rng.random(numero_projetos) < FRACAO_PARTE_RCA,
+                     "Sim", None),
+        "Justificativa": None,
+        "CONTRATO PRINC": None,
+        "Multi?": "Não",
+        "Classif": classif,
+        "Distribuição ": None})
+
+    # obrigacoes dos contratos: o valor total dos projetos, dividido
+    # pela folga, distribuido com pesos desiguais entre os contratos
+    pesos = rng.lognormal(0, 1, numero_contratos)
+    obrigacao = np.round(valores.sum() / folga * pesos / pesos.sum(), 2)
+    minimo_externo = np.round(obrigacao * fracao_minimo_externo, 2)
+    maximo_interno = np.round(obrigacao - minimo_externo, 2)
+    # contratos sem maximo interno: toda a obrigacao com projetos externos
+    sem_maximo = rng.random(numero_contratos) < \
+        fracao_contratos_sem_maximo_interno
+    minimo_externo[sem_maximo] = obrigacao[sem_maximo]
+    maximo_interno[sem_maximo] = 0.
+
+    df_contratos = pd.DataFrame({
+        "Contrato": 480000000000000 + np.arange(numero_contratos),
+        "Campo": ["CAMPO %0*i" % (len(str(numero_contratos)), i + 1)
+                  for i in range(numero_contratos)],
+        "Obrigação - PETROBRAS": obrigacao,
+        "Mínimo Externo": minimo_externo,
+        "Mínimo Empresa": 0,
+        "Máximo Interno": maximo_interno})
+
+    return df_projetos, df_contratos
+
+
+"""
+funcao: grava_instancia_sintetica(nome_planilha, df_projetos, df_contratos,
+                                  compila)
+
+  Objetivo: Grava a instancia no formato da planilha de entrada e,
+            opcionalmente, na forma compilada.
+
+  Retorna:
+          diretorio da instancia compilada, ou None.
+"""
+def grava_instancia_sintetica(nome_planilha, df_projetos, df_contratos,
+                              compila=True):
+    wb = openpyxl.Workbook(write_only=True)
+    gravador_saida.grava_aba(wb, NOME_ABA_CONTRATOS, df_contratos)
+    gravador_saida.grava_aba(wb, NOME_ABA_PROJETOS, df_projetos)
+    gravador_saida.grava_arquivo_atomico(nome_planilha, wb.save)
+
+    if not compila:
+        return None
+    return instancia.compila_instancia(nome_planilha, NOME_ABA_PROJETOS,
+                                       NOME_ABA_CONTRATOS)
+
+
+def main():
+    # grava as instancias sinteticas padrao
+    for numero_projetos, numero_contratos in TAMANHOS_PADRAO:
+        nome_planilha = "Sintetica_%i_%i.xlsx" % (numero_projetos,
+                                                  numero_contratos)
+        df_projetos, df_contratos = gera_instancia(numero_projetos,
+                                                   numero_contratos)
+        grava_instancia_sintetica(nome_planilha, df_projetos, df_contratos)
+        print(nome_planilha)
+    return
+
+
+if __name__ == "__main__":
+    main()
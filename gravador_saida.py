@@ -0,0 +1,236 @@
+"""
+Gravacao da planilha de saida em segundo plano.
+
+O GravadorSaida executa em uma thread separada do algoritmo genetico:
+    - submete(individuo, performance, melhorou) apenas registra o
+      individuo, caso tenha performance melhor que o ultimo submetido, ou
+      caso o chamador informe que ele melhorou (ex.: pelas regras de Deb,
+      um individuo valido supera um invalido de performance menor), e
+      retorna imediatamente;
+    - se varios individuos forem submetidos enquanto uma gravacao esta em
+      andamento, somente o ultimo (o melhor) e gravado em seguida;
+    - a performance so e registrada como gravada apos a gravacao terminar
+      com sucesso. Caso a gravacao falhe (ex.: planilha aberta no excel),
+      o mesmo individuo e aceito novamente na proxima submissao, e
+      encerra() grava o ultimo individuo de forma sincrona;
+    - a planilha e gravada com o openpyxl em modo somente escrita (memoria
+      constante), em um arquivo temporario que e renomeado ao final, de
+      modo que a planilha de saida nunca fica incompleta.
+
+"""
+import os
+import math
+import pickle
+import tempfile
+import threading
+
+import openpyxl
+
+import utilidades as util
+import funcao_restricao as negocio
+
+# mascara de permissoes do processo, para os arquivos temporarios
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+class GravadorSaida:
+    def __init__(self, nome_planilha, df_id_contratos, df_contratos,
+                 df_detalhes_projetos):
+        self.nome_planilha = nome_planilha
+        self.df_id_contratos = df_id_contratos
+        self.df_contratos = df_contratos
+        self.df_detalhes_projetos = df_detalhes_projetos
+
+        self.condicao = threading.Condition()
+        self.pendente = None
+        self.performance_pendente = math.inf
+        self.performance_gravando = math.inf
+        self.performance_gravada = math.inf
+        # genes da ultima gravacao com sucesso, e do ultimo individuo cuja
+        # gravacao falhou (None caso a ultima gravacao tenha funcionado)
+        self.gravado = None
+        self.falhou = None
+        self.gravando = False
+        self.encerrar = False
+        self.gravacoes = 0
+        self.descartados = 0
+
+        self.thread = threading.Thread(target=self._executa, daemon=True)
+        self.thread.start()
+
+    def submete(self, individuo, performance, melhorou=False):
+        # registra o individuo para ser gravado, caso seja melhor que o
+        # pendente, o que esta sendo gravado e o ultimo gravado com
+        # sucesso, ou caso melhorou seja True. O individuo cuja gravacao
+        # falhou tambem e aceito novamente. Devolve True caso tenha sido
+        # registrado
+        if math.isnan(performance):
+            return False
+        genes = list(individuo)
+        with self.condicao:
+            if not melhorou and genes != self.falhou and \
+                    performance >= min(self.performance_pendente,
+                                       self.performance_gravando,
+                                       self.performance_gravada):
+                return False
+            if genes == self.pendente:
+                return False
+            if self.pendente is not None:
+                # substitui o individuo que ainda nao foi gravado
+                self.descartados += 1
+            self.pendente = genes
+            self.performance_pendente = performance
+            self.condicao.notify()
+        return True
+
+    def aguarda(self):
+        # aguarda a gravacao do ultimo individuo submetido
+        with self.condicao:
+            while self.pendente is not None or self.gravando:
+                self.condicao.wait()
+
+    def encerra(self, individuo_final=None):
+        # grava o individuo pendente e encerra a thread. Em seguida grava,
+        # de forma sincrona, individuo_final caso ainda nao tenha sido
+        # gravado, ou o ultimo individuo cuja gravacao falhou
+        with self.condicao:
+            self.encerrar = True
+            self.condicao.notify()
+        self.thread.join()
+
+        if individuo_final is None:
+            individuo_final = self.falhou
+        if individuo_final is not None and \
+                list(individuo_final) != self.gravado:
+            individuo_final = list(individuo_final)
+            gravou = self._grava(individuo_final)
+            with self.condicao:
+                self._registra(individuo_final, gravou)
+
+    def _executa(self):
+        while True:
+            with self.condicao:
+                while self.pendente is None and not self.encerrar:
+                    self.condicao.wait()
+                if self.pendente is None:
+                    return
+                individuo = self.pendente
+                performance = self.performance_pendente
+                self.pendente = None
+                self.performance_pendente = math.inf
+                self.performance_gravando = performance
+                self.gravando = True
+
+            gravou = self._grava(individuo)
+            with self.condicao:
+                self._registra(individuo, gravou)
+                if gravou:
+                    # o ultimo individuo gravado, que pode ter performance
+                    # maior que o anterior (submete com melhorou)
+                    self.performance_gravada = performance
+                self.performance_gravando = math.inf
+                self.gravando = False
+                self.condicao.notify_all()
+
+    def _grava(self, individuo):
+        # grava a planilha do individuo, fora da trava. Qualquer erro e
+        # informado sem interromper a thread. Devolve True em caso de
+        # sucesso
+        try:
+            grava_planilha_saida_atomica(individuo, self.nome_planilha,
+                                         self.df_id_contratos,
+                                         self.df_contratos,
+                                         self.df_detalhes_projetos)
+        except Exception as erro:
+            # ex.: planilha aberta no excel. Tenta na proxima submissao
+            print("Erro gravando planilha de saida: %s: %s" %
+                  (type(erro).__name__, erro))
+            return False
+        return True
+
+    def _registra(self, individuo, gravou):
+        # registra o resultado da gravacao. Chamada com self.condicao
+        # adquirida, pois submete le gravado e falhou
+        if gravou:
+            self.gravacoes += 1
+            self.gravado = individuo
+            self.falhou = None
+        else:
+            self.falhou = individuo
+
+
+"""
+funcao: grava_planilha_saida_atomica(individuo, nome_planilha,
+                                     df_id_contratos, df_contratos,
+                                     df_projetos)
+
+  Objetivo: Grava a mesma planilha de utilidades.grava_planilha_saida,
+            com o openpyxl em modo somente escrita, em um arquivo
+            temporario renomeado ao final.
+
+  Retorna:
+"""
+def grava_planilha_saida_atomica(individuo, nome_planilha, df_id_contratos,
+                                 df_contratos, df_projetos):
+    if hasattr(df_projetos, "materializa"):
+        df_projetos = df_projetos.materializa()
+
+    # carrega o individuo e consolida os valores relevantes
+    df = util.carrega_consolida_individuo(individuo, df_id_contratos,
+                                          df_contratos, df_projetos)
+    df, valido, regra_ativa = negocio.funcao_restricao(df)
+    df = df.rename(columns={"EXTERNO": "Total Externo",
+                            "EMPRESA": "Total Empresa",
+                            "INTERNO": "Total Interno"})
+    df = df.drop(columns="ID_Contrato")
+
+    wb = openpyxl.Workbook(write_only=True)
+    grava_aba(wb, util.NOME_ABA_CONTRATOS_PLANILHA_SAIDA, df)
+    grava_aba(wb, util.NOME_ABA_PROJETOS_PLANILHA_SAIDA, df_projetos)
+    grava_arquivo_atomico(nome_planilha, wb.save)
+
+    # grava em arquivo o individuo
+    grava_arquivo_atomico(util.NOME_ARQUIVO_MELHOR_INDIVIDUO,
+                          lambda nome: grava_pickle(nome, individuo))
+    return
+
+
+def grava_aba(wb, nome_aba, df):
+    # grava um dataframe em uma aba, linha a linha
+    ws = wb.create_sheet(nome_aba)
+    ws.append([str(c) for c in df.columns])
+    for linha in df.itertuples(index=False):
+        ws.append([None if isinstance(v, float) and math.isnan(v) else v
+                   for v in linha])
+    return
+
+
+def grava_pickle(nome_arquivo, obj):
+    with open(nome_arquivo, "wb") as arq:
+        pickle.dump(obj, arq)
+
+
+def grava_arquivo_atomico(nome_arquivo, grava):
+    # grava em um arquivo temporario no mesmo diretorio, e renomeia
+    diretorio = os.path.dirname(os.path.abspath(nome_arquivo))
+    arq, temporario = tempfile.mkstemp(prefix=".tmp-", dir=diretorio)
+    os.close(arq)
+    # mesmas permissoes de um arquivo criado normalmente
+    os.chmod(temporario, 0o666 & ~_UMASK)
+    try:
+        grava(temporario)
+        os.replace(temporario, nome_arquivo)
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+    return
+
+
+def main():
+    # definir rotinas de testes para as funcoes do modulo
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+Modelo de ilhas do algoritmo genetico: evolui varias populacoes em
+processos paralelos, com migracao periodica dos melhores individuos entre
+as ilhas.
+
+Cada ilha executa as mesmas etapas de distribuicao.executa_geracao, com
+uma semente propria. A cada INTERVALO_MIGRACAO geracoes, cada ilha envia
+os seus NUMERO_MIGRANTES melhores individuos para outra ilha, segundo a
+topologia de migracao:
+    - "anel": a ilha i envia para a ilha i + 1;
+    - "aleatoria": a ilha i envia para uma outra ilha sorteada.
+
+Os migrantes sao enviados como vetores numpy (genes e fitness), e nao como
+objetos do DEAP. O processo principal recebe os melhores individuos de
+todas as ilhas e consolida o hall of fame geral.
+
+"""
+import random
+import time
+import queue
+import multiprocessing
+
+import numpy as np
+from deap import tools
+
+import distribuicao
+import presolve
+import selecao
+import funcao_objetivo as f_obj
+import conversao_individuos as conv
+
+# Definicao de constantes e parametros
+NUMERO_ILHAS = 4
+INTERVALO_MIGRACAO = 10
+NUMERO_MIGRANTES = 2
+TOPOLOGIA_MIGRACAO = "anel"  # "anel" ou "aleatoria"
+NUMERO_MELHORES_INDIVIDUOS_GUARDADO = 500
+
+# tempo maximo (segundos) aguardando mensagens das ilhas antes de
+# verificar se os processos ainda estao ativos
+TEMPO_ESPERA_MENSAGEM = 1.0
+
+
+"""
+funcao: executa_ilhas(df_id_contratos, df_contratos, df_projetos,
+                      projetos_excluidos, numero_ilhas, numero_geracoes,
+                      tamanho_populacao, intervalo_migracao,
+                      numero_migrantes, topologia, semente, alvo)
+
+  Objetivo: Executa o algoritmo genetico no modelo de ilhas, com uma
+            populacao por processo, e consolida os melhores individuos de
+            todas as ilhas.
+
+  Parametros:
+             df_id_contratos, df_contratos, df_projetos,
+             projetos_excluidos: dados lidos da planilha de entrada
+                                 (le_planilha_entrada);
+             numero_ilhas: numero de processos/populacoes;
+             numero_geracoes: numero de geracoes de cada ilha;
+             tamanho_populacao: tamanho da populacao de cada ilha;
+             intervalo_migracao: de quantas em quantas geracoes migra;
+             numero_migrantes: quantos individuos cada ilha envia;
+             topologia: "anel" ou "aleatoria";
+             semente: semente base; a ilha i usa semente + i;
+             alvo: performance alvo. Quando alguma ilha atinge o alvo,
+                   todas as ilhas sao encerradas. None desabilita.
+
+  Retorna:
+          hof: Hall of Fame do DEAP com os melhores individuos de todas
+               as ilhas;
+          historico: lista de tuples (tempo, ilha, geracao, performance)
+                     com o melhor individuo de cada ilha a cada geracao.
+"""
+def executa_ilhas(df_id_contratos, df_contratos, df_projetos,
+                  projetos_excluidos, numero_ilhas=NUMERO_ILHAS,
+                  numero_geracoes=distribuicao.NUMERO_GERACOES,
+                  tamanho_populacao=distribuicao.TAMANHO_POPULACAO,
+                  intervalo_migracao=INTERVALO_MIGRACAO,
+                  numero_migrantes=NUMERO_MIGRANTES,
+                  topologia=TOPOLOGIA_MIGRACAO, semente=None, alvo=None):
+    if semente is None:
+        semente = random.randrange(2 ** 31)
+
+    contexto = multiprocessing.get_context()
+    filas_migracao = [contexto.Queue() for i in range(numero_ilhas)]
+    fila_resultados = contexto.Queue()
+    evento_parada = contexto.Event()
+
+    processos = []
+    for i in range(numero_ilhas):
+        p = contexto.Process(target=executa_ilha,
+                             args=(i, numero_ilhas, df_id_contratos,
+                                   df_contratos, df_projetos,
+                                   projetos_excluidos, numero_geracoes,
+                                   tamanho_populacao, intervalo_migracao,
+                                   numero_migrantes, topologia,
+                                   semente + i, filas_migracao,
+                                   fila_resultados, evento_parada),
+                             daemon=True)
+        p.start()
+        processos.append(p)
+
+    # consolida no processo principal os melhores individuos das ilhas
+    distribuicao.cria_tipos_deap(len(df_id_contratos))
+    hof = tools.HallOfFame(NUMERO_MELHORES_INDIVIDUOS_GUARDADO)
+    historico = []
+    inicio = time.perf_counter()
+    ilhas_ativas = numero_ilhas
+    while ilhas_ativas > 0:
+        try:
+            mensagem = fila_resultados.get(timeout=TEMPO_ESPERA_MENSAGEM)
+        except queue.Empty:
+            # encerra caso todos os processos tenham terminado sem avisar
+            if not any(p.is_alive() for p in processos):
+                break
+            continue
+
+        tipo_mensagem, ilha, geracao, genes, fitness = mensagem
+        if tipo_mensagem == "fim":
+            ilhas_ativas -= 1
+        if genes is not None:
+            # update descarta os repetidos e limita o tamanho do hall of
+            # fame, pois os mesmos melhores sao reenviados a cada migracao
+            hof.update(conv.monta_individuos(genes, fitness))
+        if fitness is not None and len(fitness) > 0:
+            performance = conv.soma_performance(fitness[0])
+            historico.append((time.perf_counter() - inicio, ilha,
+                              geracao, performance))
+            if alvo is not None and performance <= alvo:
+                evento_parada.set()
+
+    for p in processos:
+        p.join()
+
+    return hof, historico
+
+
+"""
+funcao: executa_ilha(...)
+
+  Objetivo: Funcao executada em cada processo: evolui uma populacao com as
+            etapas de distribuicao.executa_geracao, recebendo e enviando
+            migrantes a cada intervalo_migracao geracoes.
+
+  Retorna:
+"""
+def executa_ilha(ilha, numero_ilhas, df_id_contratos, df_contratos,
+                 df_projetos, projetos_excluidos, numero_geracoes,
+                 tamanho_populacao, intervalo_migracao, numero_migrantes,
+                 topologia, semente, filas_migracao, fila_resultados,
+                 evento_parada):
+    random.seed(semente)
+    np.random.seed(semente % (2 ** 32))
+
+    # os processos das ilhas nao gravam os individuos validos em disco,
+    # para nao competir pelo mesmo arquivo
+    f_obj.GRAVA_INDIVIDUOS_VALIDOS = False
+
+    toolbox, num_contratos = \
+        distribuicao.configura_toolbox(df_id_contratos, df_contratos,
+                                       df_projetos)
+    viabilidade = selecao.usa_selecao_viabilidade(df_id_contratos,
+                                                  df_contratos, df_projetos)
+
+    pop = toolbox.population(n=tamanho_populacao)
+    pop, apagados = distribuicao.elimina_duplicados(pop)
+    fitnesses = list(map(toolbox.evaluate, pop))
+    for ind, fit in zip(pop, fitnesses):
+        ind.fitness.values = fit
+
+    g = 0
+    while g < numero_geracoes and not evento_parada.is_set():
+        g = g + 1
+        pop, invalid_ind = \
+            distribuicao.executa_geracao(pop, toolbox, num_contratos,
+                                         df_id_contratos, df_contratos,
+                                         df_projetos, projetos_excluidos,
+                                         tamanho_populacao)
+
+        # recebe os migrantes enviados por outras ilhas
+        pop = recebe_migrantes(pop, filas_migracao[ilha], tamanho_populacao,
+                               viabilidade)
+
+        # a populacao volta ordenada pela selecao
+        genes_melhor, fitness_melhor = conv.compacta_individuos(pop[0:1])
+
+        if numero_ilhas > 1 and g % intervalo_migracao == 0:
+            destino = destino_migracao(ilha, numero_ilhas, topologia)
+            genes, fitness = conv.compacta_individuos(pop[0:numero_migrantes])
+            filas_migracao[destino].put((genes, fitness))
+            # envia tambem para o processo principal, para o hall of fame
+            fila_resultados.put(("melhores", ilha, g, genes, fitness))
+        else:
+            fila_resultados.put(("progresso", ilha, g, None,
+                                 fitness_melhor))
+
+    genes, fitness = conv.compacta_individuos(pop)
+    fila_resultados.put(("fim", ilha, g, genes, fitness))
+    return
+
+
+def destino_migracao(ilha, numero_ilhas, topologia):
+    # identifica a ilha que recebe os migrantes desta ilha
+    if topologia == "aleatoria":
+        outras = [i for i in range(numero_ilhas) if i != ilha]
+        return random.choice(outras)
+    return (ilha + 1) % numero_ilhas
+
+
+def recebe_migrantes(pop, fila, tamanho_populacao, viabilidade):
+    # substitui os piores individuos da populacao pelos migrantes
+    # recebidos, descartando os que ja existem na populacao. A populacao
+    # continua ordenada como na selecao
+    migrantes = []
+    while True:
+        try:
+            genes, fitness = fila.get_nowait()
+        except queue.Empty:
+            break
+        migrantes = migrantes + conv.monta_individuos(genes, fitness)
+
+    novos = [ind for ind in migrantes if ind not in pop]
+    if len(novos) > 0:
+        pop = pop[0:max(0, tamanho_populacao - len(novos))] + novos
+        pop = selecao.ordena_melhores(pop, viabilidade)
+    return pop
+
+
+"""
+funcao: compara_tempo_alvo(alvo, numero_ilhas, numero_geracoes,
+                           tamanho_populacao, semente)
+
+  Objetivo: Benchmark do modelo de ilhas: mede o tempo ate atingir a
+            performance alvo com uma unica ilha e com numero_ilhas ilhas,
+            com a mesma populacao por ilha e o mesmo numero de geracoes.
+
+  Retorna:
+          dicionario {numero de ilhas: tempo ate o alvo em segundos,
+                      ou None caso o alvo nao tenha sido atingido}
+"""
+def compara_tempo_alvo(alvo, numero_ilhas=NUMERO_ILHAS,
+                       numero_geracoes=distribuicao.NUMERO_GERACOES,
+                       tamanho_populacao=distribuicao.TAMANHO_POPULACAO,
+                       semente=0):
+    df_projetos, df_detalhes_projetos, projetos_excluidos, df_contratos, \
+        df_id_contratos, _ = presolve.le_dados_otimizacao(
+            distribuicao.PLANILHA_DADOS_ENTRADA,
+            distribuicao.NOME_ABA_ENTRADA_VALORES_A_DISTRIBUIR,
+            distribuicao.NOME_ABA_ENTRADA_CONTRATOS,
+            compilada=distribuicao.USA_INSTANCIA_COMPILADA)
+
+    resultado = {}
+    for n in (1, numero_ilhas):
+        inicio = time.perf_counter()
+        hof, historico = executa_ilhas(df_id_contratos, df_contratos,
+                                       df_projetos, projetos_excluidos,
+                                       numero_ilhas=n,
+                                       numero_geracoes=numero_geracoes,
+                                       tamanho_populacao=tamanho_populacao,
+                                       semente=semente, alvo=alvo)
+        tempos = [t for t, ilha, g, perf in historico if perf <= alvo]
+        resultado[n] = min(tempos) if len(tempos) > 0 else None
+        print("Ilhas = %i  Tempo total = %.1fs  Tempo ate o alvo = %s" %
+              (n, time.perf_counter() - inicio,
+               "%.1fs" % resultado[n] if resultado[n] is not None
+               else "nao atingido"))
+
+    return resultado
+
+
+def main():
+    # benchmark do tempo ate o alvo: 1 ilha X NUMERO_ILHAS ilhas
+    # compara_tempo_alvo(alvo=2.0e17, numero_geracoes=50)
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+Reotimizacao incremental, quando a planilha de entrada muda pouco em
+relacao ao ultimo checkpoint (ex.: alguns projetos incluidos, retirados ou
+com o valor alterado, ou a obrigacao de um contrato alterada).
+
+O checkpoint grava tambem os dados da instancia (dados_instancia): os
+"Número ANP", valores e classificacoes dos projetos, e os "Campo" e
+limites dos contratos. Com a nova planilha de entrada:
+    - os contratos sao associados pelo "Campo". Os projetos alocados em
+      contratos que nao existem mais ficam nao alocados;
+    - os projetos sao associados pelo "Número ANP" (e pela ordem, caso o
+      mesmo numero apareca mais de uma vez), e cada individuo e remapeado
+      para a nova ordem dos projetos;
+    - os projetos novos sao alocados de forma gulosa, do maior para o
+      menor valor, no contrato que menos aumenta a performance de cada
+      individuo (tabu.custo_contratos);
+    - somente os individuos cujos totais por contrato, ou os limites dos
+      contratos, mudaram sao avaliados novamente. Os demais mantem o
+      fitness gravado.
+
+"""
+import numpy as np
+import pandas as pd
+
+import funcao_objetivo as f_obj
+import checkpoint
+import conversao_individuos as conv
+import tabu
+
+# Definicao de constantes e parametros
+COLUNAS_LIMITES = ["Obrigação - PETROBRAS", "Mínimo Externo", "Máximo Interno"]
+PREFIXO_CHECKPOINT = "instancia_"
+
+
+"""
+funcao: dados_instancia(df_projetos, df_contratos, df_id_contratos)
+
+  Objetivo: Monta os dados da instancia gravados no checkpoint, usados
+            para remapear a populacao.
+
+  Retorna:
+          dicionario de arrays: "numero_anp", "valores", "classif",
+          "campos" e "limites".
+"""
+def dados_instancia(df_projetos, df_contratos, df_id_contratos):
+    campos, limites = limites_contratos(df_contratos, df_id_contratos)
+    return {"numero_anp": df_projetos["Número ANP"].astype(str).to_numpy(
+                dtype=str),
+            "valores": np.nan_to_num(df_projetos["Valor Pago(R$)"].to_numpy(
+                dtype=np.float64)),
+            "classif": df_projetos["Classif"].fillna("").astype(str)
+                .to_numpy(dtype=str),
+            "campos": campos,
+            "limites": limites}
+
+
+def limites_contratos(df_contratos, df_id_contratos):
+    # "Campo" e limites (R$) dos contratos, na ordem dos indices e sem o
+    # contrato em branco
+    num_contratos = len(df_id_contratos) - 1
+    contratos = df_contratos.sort_values("ID_Contrato")[0:num_contratos]
+    return contratos["Campo"].astype(str).to_numpy(dtype=str), \
+        contratos[COLUNAS_LIMITES].to_numpy(dtype=np.float64)
+
+
+"""
+funcao: remapeia_checkpoint(dados_checkpoint, df_projetos, df_contratos,
+                            df_id_contratos, projetos_excluidos)
+
+  Objetivo: Remapeia a populacao do checkpoint para a nova planilha de
+            entrada.
+
+  Parametros:
+             dados_checkpoint: lido por checkpoint.le_checkpoint;
+             df_projetos, df_contratos, df_id_contratos,
+             projetos_excluidos: dados da nova planilha de entrada.
+
+  Retorna:
+          pop, melhor_individuo (None), geracao, logbook e
+          estatisticas_operadores, como checkpoint.restaura_checkpoint;
+          ou None caso o checkpoint nao tenha os dados da instancia.
+          Os individuos alterados ficam sem fitness, para serem avaliados.
+"""
+def remapeia_checkpoint(dados_checkpoint, df_projetos, df_contratos,
+                        df_id_contratos, projetos_excluidos):
+    antigo = {nome[len(PREFIXO_CHECKPOINT):]: valores
+              for nome, valores in dados_checkpoint.items()
+              if nome.startswith(PREFIXO_CHECKPOINT)}
+    if len(antigo) == 0:
+        return None
+    novo = dados_instancia(df_projetos, df_contratos, df_id_contratos)
+
+    # o melhor individuo e incluido na populacao, e o melhor individuo
+    # geral e escolhido novamente a partir dela
+    genes = np.vstack([dados_checkpoint["genes"],
+                       dados_checkpoint["melhor_genes"]]).astype(np.int64)
+    fitness = np.vstack([dados_checkpoint["fitness"],
+                         dados_checkpoint["melhor_fitness"]])
+
+    # contratos: indice antigo -> indice novo, pelo "Campo". O contrato em
+    # branco e os contratos retirados vao para o novo contrato em branco
+    num_antigos = len(antigo["campos"])
+    num_novos = len(novo["campos"])
+    indice_novo = {campo: i for i, campo in enumerate(novo["campos"])}
+    mapa_contratos = np.full(num_antigos + 1, num_novos, dtype=np.int64)
+    for i, campo in enumerate(antigo["campos"]):
+        mapa_contratos[i] = indice_novo.get(campo, num_novos)
+
+    # projetos: posicao antiga de cada projeto novo (-1 se novo)
+    posicao_antiga = associa_projetos(antigo["numero_anp"],
+                                      novo["numero_anp"])
+    existentes = posicao_antiga >= 0
+    novos_genes = np.full((len(genes), len(posicao_antiga)), num_novos,
+                          dtype=np.int64)
+    novos_genes[:, existentes] = \
+        mapa_contratos[genes[:, posicao_antiga[existentes]]]
+
+    # aloca os projetos novos, de forma gulosa
+    incluidos = np.flatnonzero(~existentes)
+    incluidos = np.setdiff1d(incluidos, np.asarray(projetos_excluidos,
+                                                   dtype=np.int64))
+    dados = f_obj.prepara_centavos(df_id_contratos, df_contratos, df_projetos)
+    aloca_gulosamente(novos_genes, incluidos, dados)
+    novos_genes[:, np.asarray(projetos_excluidos, dtype=np.int64)] = num_novos
+
+    # mantem o fitness dos individuos com os mesmos totais por contrato e
+    # os mesmos limites dos contratos
+    mesmos_contratos = num_antigos == num_novos and \
+        (antigo["campos"] == novo["campos"]).all() and \
+        np.array_equal(antigo["limites"], novo["limites"])
+    inalterado = np.zeros(len(genes), dtype=bool)
+    if mesmos_contratos:
+        totais_antigos = totais_contratos(genes, antigo["valores"],
+                                          antigo["classif"], num_antigos)
+        totais_novos = totais_contratos(novos_genes, novo["valores"],
+                                        novo["classif"], num_novos)
+        inalterado = (totais_antigos == totais_novos).all(axis=(1, 2))
+
+    pop = conv.monta_individuos(novos_genes, None)
+    for ind, fit, manter in zip(pop, fitness, inalterado):
+        if manter:
+            ind.fitness.values = tuple(fit)
+
+    # valores comparados em centavos, como na avaliacao
+    revalorizados = existentes.copy()
+    revalorizados[existentes] = \
+        (np.round(antigo["valores"][posicao_antiga[existentes]] * 100) !=
+         np.round(novo["valores"][existentes] * 100)) | \
+        (antigo["classif"][posicao_antiga[existentes]] !=
+         novo["classif"][existentes])
+    print("Reotimização incremental: %i projetos incluídos, %i retirados, "
+          "%i alterados; %i contratos incluídos, %i retirados, "
+          "%i com limites alterados; %i de %i indivíduos avaliados "
+          "novamente" %
+          (np.count_nonzero(~existentes),
+           len(antigo["numero_anp"]) - np.count_nonzero(existentes),
+           np.count_nonzero(revalorizados),
+           np.count_nonzero(~np.isin(novo["campos"], antigo["campos"])),
+           np.count_nonzero(~np.isin(antigo["campos"], novo["campos"])),
+           contratos_alterados(antigo, novo),
+           np.count_nonzero(~inalterado), len(pop)))
+
+    checkpoint.restaura_aleatorios(dados_checkpoint)
+    meta = dados_checkpoint["meta"]
+    return pop, None, meta["geracao"], \
+        checkpoint.restaura_historico(dados_checkpoint), meta["operadores"]
+
+
+def associa_projetos(numero_anp_antigo, numero_anp_novo):
+    # posicao antiga de cada projeto novo, pelo "Número ANP" e pela ordem
+    # de ocorrencia do numero, ou -1 para os projetos novos
+    antigo = pd.DataFrame({"anp": numero_anp_antigo,
+                           "posicao": np.arange(len(numero_anp_antigo))})
+    antigo["ocorrencia"] = antigo.groupby("anp").cumcount()
+    novo = pd.DataFrame({"anp": numero_anp_novo})
+    novo["ocorrencia"] = novo.groupby("anp").cumcount()
+    novo = novo.merge(antigo, on=["anp", "ocorrencia"], how="left")
+    return novo["posicao"].fillna(-1).to_numpy(dtype=np.int64)
+
+
+def totais_contratos(genes, valores, classif, num_contratos):
+    # totais em centavos por individuo, contrato e classificacao
+    num_classif = len(f_obj.CLASSIFICACOES)
+    codigos = np.full(len(classif), -1, dtype=np.int64)
+    for codigo, nome in enumerate(f_obj.CLASSIFICACOES):
+        codigos[classif == nome] = codigo
+    validos = codigos >= 0
+    centavos = np.round(valores[validos] * 100)
+    chaves = genes[:, validos] * num_classif + codigos[validos]
+    chaves = chaves + np.arange(len(genes))[:, None] * \
+        (num_contratos + 1) * num_classif
+    totais = np.bincount(chaves.ravel(),
+                         weights=np.broadcast_to(centavos, chaves.shape)
+                         .ravel(),
+                         minlength=len(genes) * (num_contratos + 1) *
+                         num_classif)
+    totais = totais.reshape(len(genes), num_contratos + 1, num_classif)
+    # o contrato em branco nao e comparado
+    return totais[:, 0:num_contratos].astype(np.int64)
+
+
+def aloca_gulosamente(genes, incluidos, dados):
+    # aloca os projetos incluidos, do maior para o menor valor, no
+    # contrato que menos aumenta o custo de cada individuo
+    num_contratos = dados["numero_contratos"]
+    num_classif = len(f_obj.CLASSIFICACOES)
+    limites, ativas = tabu.limites_com_contrato_em_branco(dados)
+    posicao = {p: i for i, p in enumerate(dados["posicoes"])}
+    incluidos = [p for p in incluidos if p in posicao]
+    if len(incluidos) == 0:
+        return
+
+    # totais dos individuos sem os projetos incluidos
+    num_individuos = len(genes)
+    posicoes = dados["posicoes"]
+    valores = dados["valores"].astype(np.int64)
+    classif = dados["classif"]
+    totais = np.zeros((num_individuos, num_contratos + 1, num_classif),
+                      dtype=np.int64)
+    fora = ~np.isin(posicoes, incluidos)
+    for i in range(num_individuos):
+        np.add.at(totais[i], (genes[i, posicoes[fora]], classif[fora]),
+                  valores[fora])
+
+    todos_contratos = np.arange(num_contratos + 1)
+    custos = tabu.custo_contratos(totais, todos_contratos[None, :],
+                                  limites, ativas)
+    individuos = np.arange(num_individuos)
+    for p in sorted(incluidos, key=lambda p: -valores[posicao[p]]):
+        k = classif[posicao[p]]
+        vetor = np.zeros(num_classif, dtype=np.int64)
+        vetor[k] = valores[posicao[p]]
+        novos_custos = tabu.custo_contratos(totais + vetor,
+                                            todos_contratos[None, :],
+                                            limites, ativas)
+        destino = np.argmin(novos_custos - custos, axis=1)
+        genes[:, p] = destino
+        totais[individuos, destino] += vetor
+        custos[individuos, destino] = novos_custos[individuos, destino]
+    return
+
+
+def contratos_alterados(antigo, novo):
+    # numero de contratos mantidos com algum limite alterado
+    limites_antigos = dict(zip(antigo["campos"], map(tuple, antigo["limites"])))
+    return sum(1 for campo, limites in zip(novo["campos"],
+                                           map(tuple, novo["limites"]))
+               if campo in limites_antigos and
+               limites_antigos[campo] != limites)
+
+
+def main():
+    # definir rotinas de testes para as funcoes do modulo
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,440 @@
+"""
+Instancia compilada: cache binario dos dados da planilha de entrada, para
+que as execucoes seguintes (e os processos paralelos) nao precisem ler
+novamente a planilha excel.
+
+Na primeira leitura da planilha e gravado um diretorio
+"<planilha>.instancia" com:
+    - vetores numpy (.npy) com os valores, classificacoes, numeros ANP e
+      marcacao "Irá fazer parte do RCA?" dos projetos, e os limites das
+      regras de negocio dos contratos;
+    - "instancia.json" com a versao do formato, os nomes dos campos, o
+      hash (sha256) e a data de alteracao da planilha;
+    - "detalhes.pkl" com todos os campos dos projetos, utilizados somente
+      na gravacao da planilha de saida. Gravado somente na primeira vez em
+      que a planilha de saida e gravada (DetalhesProjetos).
+
+A planilha e lida em modo somente leitura do openpyxl, linha a linha,
+carregando apenas as colunas necessarias diretamente em vetores numpy
+(le_planilha_streaming), sem montar os dataframes com todas as colunas.
+
+Nas leituras seguintes os vetores sao abertos com memory-map. A instancia
+compilada e recompilada quando o conteudo da planilha muda (a data de
+alteracao e verificada primeiro, e o hash so e recalculado caso ela mude).
+
+"""
+import os
+import time
+import json
+import tracemalloc
+import shutil
+import hashlib
+import tempfile
+
+import numpy as np
+import pandas as pd
+import openpyxl
+
+import utilidades as util
+
+# Definicao de constantes e parametros
+VERSAO_INSTANCIA = 1
+SUFIXO_INSTANCIA_COMPILADA = ".instancia"
+NOME_ARQUIVO_META = "instancia.json"
+NOME_ARQUIVO_DETALHES = "detalhes.pkl"
+
+# classificacoes dos projetos, na ordem dos codigos gravados
+CLASSIFICACOES = ["EMPRESA", "EXTERNO", "INTERNO"]
+
+# colunas dos dataframes de projetos e contratos (le_planilha_entrada)
+COLUNAS_PROJETOS = ["Número ANP", "Valor Pago(R$)",
+                    "Irá fazer parte do RCA?", "Classif", "CONTRATO PRINC"]
+COLUNAS_LIMITES = ["Obrigação - PETROBRAS", "Mínimo Externo",
+                   "Mínimo Empresa", "Máximo Interno"]
+
+# codigos da coluna "Irá fazer parte do RCA?"
+PARTE_RCA_VAZIO = -1
+PARTE_RCA_NAO = 0
+PARTE_RCA_SIM = 1
+
+# vetores gravados na instancia compilada
+VETORES_INSTANCIA = ["valores", "classif", "parte_rca", "numero_anp",
+                     "limites"]
+
+# numero de linhas lidas por bloco na leitura da planilha
+TAMANHO_BLOCO_LEITURA = 4096
+
+
+"""
+funcao: le_planilha_streaming(planilha, aba_projetos, aba_contratos)
+
+  Objetivo: Le a planilha de entrada no modo somente leitura do openpyxl,
+            linha a linha, carregando apenas as colunas necessarias
+            diretamente em vetores numpy. Os demais campos dos projetos
+            nao sao carregados (ver DetalhesProjetos).
+
+  Retorna:
+          instancia: dicionario com os mesmos vetores e metadados da
+                     instancia compilada (le_instancia_compilada), sem
+                     "hash" e "data_alteracao".
+"""
+def le_planilha_streaming(planilha, aba_projetos, aba_contratos):
+    wb = openpyxl.load_workbook(planilha, read_only=True, data_only=True)
+    try:
+        colunas = le_colunas_aba(wb[aba_projetos], COLUNAS_PROJETOS[0:4])
+        colunas_contratos = le_colunas_aba(wb[aba_contratos],
+                                           ["Campo"] + COLUNAS_LIMITES)
+    finally:
+        wb.close()
+
+    numero_anp, valores, parte_rca, classif = colunas
+
+    # codigos das classificacoes e da coluna "Irá fazer parte do RCA?"
+    codigos_classif = np.full(len(classif), -1, dtype=np.int8)
+    for codigo, nome in enumerate(CLASSIFICACOES):
+        codigos_classif[classif == nome] = codigo
+    codigos_parte_rca = np.full(len(parte_rca), PARTE_RCA_VAZIO,
+                                dtype=np.int8)
+    codigos_parte_rca[(parte_rca == "Sim") | (parte_rca == True)] = \
+        PARTE_RCA_SIM
+    codigos_parte_rca[util.marca_projetos_excluidos(parte_rca)] = \
+        PARTE_RCA_NAO
+
+    # numeros ANP inteiros, ou texto caso a planilha use outro formato
+    try:
+        numero_anp = numero_anp.astype(np.int64)
+    except (TypeError, ValueError):
+        numero_anp = numero_anp.astype(str)
+
+    campos = colunas_contratos[0]
+    limites = np.column_stack([converte_numerico(c)
+                               for c in colunas_contratos[1:]])
+
+    return {"valores": converte_numerico(valores),
+            "classif": codigos_classif,
+            "parte_rca": codigos_parte_rca,
+            "numero_anp": numero_anp,
+            "limites": limites,
+            "diretorio": None,
+            "meta": {"versao": VERSAO_INSTANCIA,
+                     "planilha": os.path.basename(planilha),
+                     "abas": [aba_projetos, aba_contratos],
+                     "campos": [str(c) for c in campos],
+                     "classificacoes": CLASSIFICACOES,
+                     "numero_projetos": len(valores)}}
+
+
+def le_colunas_aba(ws, nomes_colunas):
+    # le somente as colunas indicadas de uma aba, em blocos de linhas,
+    # devolvendo um vetor numpy (object) por coluna
+    linhas = ws.iter_rows(values_only=True)
+    cabecalho = [str(c).strip() if c is not None else ""
+                 for c in next(linhas)]
+    indices = [cabecalho.index(nome) for nome in nomes_colunas]
+
+    blocos = [[] for i in indices]
+    bloco = []
+    for linha in linhas:
+        valores = [linha[i] if i < len(linha) else None for i in indices]
+        # ignora as linhas vazias
+        if all(v is None for v in valores):
+            continue
+        bloco.append(valores)
+        if len(bloco) == TAMANHO_BLOCO_LEITURA:
+            acumula_bloco(blocos, bloco)
+            bloco = []
+    acumula_bloco(blocos, bloco)
+
+    return [np.concatenate(b) if len(b) > 0 else np.empty(0, dtype=object)
+            for b in blocos]
+
+
+def acumula_bloco(blocos, bloco):
+    # transpoe um bloco de linhas em vetores por coluna
+    if len(bloco) == 0:
+        return
+    matriz = np.array(bloco, dtype=object)
+    for j in range(len(blocos)):
+        blocos[j].append(matriz[:, j])
+
+
+def converte_numerico(coluna):
+    # converte uma coluna lida da planilha em float64, com 0 nas celulas
+    # vazias
+    vetor = np.array([v if v is not None else 0 for v in coluna],
+                     dtype=np.float64)
+    return vetor
+
+
+"""
+classe: DetalhesProjetos(planilha, aba_projetos, diretorio)
+
+  Objetivo: Carga tardia do dataframe com todos os campos dos projetos
+            (df_detalhes_projetos), que so e necessario na gravacao da
+            planilha de saida. O metodo materializa() le a aba de projetos
+            completa na primeira chamada, e grava uma copia na instancia
+            compilada para as proximas execucoes.
+"""
+class DetalhesProjetos:
+    def __init__(self, planilha, aba_projetos, diretorio=None):
+        self.planilha = planilha
+        self.aba_projetos = aba_projetos
+        self.diretorio = diretorio
+        self.df = None
+
+    def materializa(self):
+        if self.df is not None:
+            return self.df
+
+        nome_detalhes = None
+        if self.diretorio is not None:
+            nome_detalhes = os.path.join(self.diretorio,
+                                         NOME_ARQUIVO_DETALHES)
+        if nome_detalhes is not None and os.path.isfile(nome_detalhes):
+            self.df = pd.read_pickle(nome_detalhes)
+        else:
+            self.df = pd.read_excel(self.planilha,
+                                    sheet_name=self.aba_projetos, header=0)
+            if nome_detalhes is not None:
+                self.df.to_pickle(nome_detalhes)
+        return self.df
+
+    def __len__(self):
+        return len(self.materializa())
+
+
+def nome_instancia_compilada(planilha):
+    # diretorio da instancia compilada de uma planilha
+    return planilha + SUFIXO_INSTANCIA_COMPILADA
+
+
+def hash_arquivo(nome_arquivo):
+    # hash sha256 do conteudo de um arquivo
+    h = hashlib.sha256()
+    with open(nome_arquivo, "rb") as arq:
+        for bloco in iter(lambda: arq.read(1 << 20), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+"""
+funcao: compila_instancia(planilha, aba_projetos, aba_contratos)
+
+  Objetivo: Le a planilha de entrada e grava a instancia compilada.
+            A gravacao e feita em um diretorio temporario, renomeado ao
+            final, para que uma gravacao interrompida nao deixe uma
+            instancia incompleta.
+
+  Retorna:
+          nome do diretorio da instancia compilada.
+"""
+def compila_instancia(planilha, aba_projetos, aba_contratos):
+    instancia = le_planilha_streaming(planilha, aba_projetos, aba_contratos)
+    meta = instancia["meta"]
+    meta["hash"] = hash_arquivo(planilha)
+    meta["data_alteracao"] = os.path.getmtime(planilha)
+    vetores = {nome: instancia[nome] for nome in VETORES_INSTANCIA}
+
+    destino = nome_instancia_compilada(planilha)
+    grava_instancia(destino, vetores, meta)
+    return destino
+
+
+def grava_instancia(destino, vetores, meta):
+    # grava os vetores e os metadados da instancia em um diretorio
+    # temporario, e renomeia para o diretorio destino
+    diretorio = os.path.dirname(os.path.abspath(destino))
+    temporario = tempfile.mkdtemp(prefix=".instancia-", dir=diretorio)
+    for nome, vetor in vetores.items():
+        np.save(os.path.join(temporario, nome + ".npy"), vetor)
+    with open(os.path.join(temporario, NOME_ARQUIVO_META), "w",
+              encoding="utf-8") as arq:
+        json.dump(meta, arq, ensure_ascii=False, indent=1)
+
+    if os.path.isdir(destino):
+        shutil.rmtree(destino, ignore_errors=True)
+    try:
+        os.replace(temporario, destino)
+    except OSError:
+        # outro processo gravou a mesma instancia ao mesmo tempo
+        shutil.rmtree(temporario, ignore_errors=True)
+    return
+
+
+"""
+funcao: le_instancia_compilada(destino)
+
+  Objetivo: Le a instancia compilada, abrindo os vetores com memory-map.
+
+  Retorna:
+          instancia: dicionario com os vetores ("valores", "classif",
+                     "parte_rca", "numero_anp", "limites"), os metadados
+                     ("meta") e o diretorio ("diretorio").
+                     None caso a instancia nao exista.
+"""
+def le_instancia_compilada(destino):
+    nome_meta = os.path.join(destino, NOME_ARQUIVO_META)
+    if not os.path.isfile(nome_meta):
+        return None
+    with open(nome_meta, encoding="utf-8") as arq:
+        meta = json.load(arq)
+    if meta.get("versao") != VERSAO_INSTANCIA:
+        return None
+
+    instancia = {"meta": meta, "diretorio": destino}
+    for nome in VETORES_INSTANCIA:
+        instancia[nome] = np.load(os.path.join(destino, nome + ".npy"),
+                                  mmap_mode="r")
+    return instancia
+
+
+def instancia_atualizada(instancia, planilha, aba_projetos, aba_contratos):
+    # verifica se a instancia compilada corresponde a planilha atual
+    meta = instancia["meta"]
+    if meta["abas"] != [aba_projetos, aba_contratos]:
+        return False
+    if not os.path.isfile(planilha):
+        # planilha indisponivel (ex.: servidor remoto): usa a instancia
+        return True
+    if os.path.getmtime(planilha) == meta["data_alteracao"]:
+        return True
+    # a data mudou: compara o conteudo pelo hash
+    if hash_arquivo(planilha) != meta["hash"]:
+        return False
+    meta["data_alteracao"] = os.path.getmtime(planilha)
+    with open(os.path.join(instancia["diretorio"], NOME_ARQUIVO_META), "w",
+              encoding="utf-8") as arq:
+        json.dump(meta, arq, ensure_ascii=False, indent=1)
+    return True
+
+
+"""
+funcao: carrega_instancia(planilha, aba_projetos, aba_contratos)
+
+  Objetivo: Le a instancia compilada da planilha, compilando novamente
+            caso nao exista ou esteja desatualizada.
+
+  Retorna:
+          instancia: dicionario da instancia (le_instancia_compilada).
+"""
+def carrega_instancia(planilha, aba_projetos, aba_contratos):
+    destino = nome_instancia_compilada(planilha)
+    instancia = le_instancia_compilada(destino)
+    if instancia is None or \
+            not instancia_atualizada(instancia, planilha, aba_projetos,
+                                     aba_contratos):
+        compila_instancia(planilha, aba_projetos, aba_contratos)
+        instancia = le_instancia_compilada(destino)
+    return instancia
+
+
+"""
+funcao: dataframes_instancia(instancia)
+
+  Objetivo: Monta, a partir da instancia compilada, os mesmos dataframes
+            devolvidos por utilidades.le_planilha_entrada.
+
+  Retorna:
+          df_projetos, df_detalhes_projetos, projetos_excluidos,
+          df_contratos, df_id_contratos
+"""
+def dataframes_instancia(instancia):
+    meta = instancia["meta"]
+
+    classif = np.array(meta["classificacoes"] + [None],
+                       dtype=object)[np.asarray(instancia["classif"])]
+    parte_rca = np.array(["Não", "Sim", np.nan],
+                         dtype=object)[np.asarray(instancia["parte_rca"])]
+    df_projetos = pd.DataFrame({
+        "Número ANP": np.asarray(instancia["numero_anp"]),
+        "Valor Pago(R$)": np.asarray(instancia["valores"]),
+        "Irá fazer parte do RCA?": parte_rca,
+        "Classif": classif,
+        "CONTRATO PRINC": np.nan}, columns=COLUNAS_PROJETOS)
+
+    # projetos marcados para nao entrar na distribuicao: retirados do
+    # dataframe dos projetos, como em le_planilha_entrada
+    excluidos = np.asarray(instancia["parte_rca"]) == PARTE_RCA_NAO
+    df_projetos = df_projetos[~excluidos].reset_index(drop=True)
+    projetos_excluidos = []
+
+    limites = np.asarray(instancia["limites"])
+    num_contratos = len(meta["campos"])
+    df_contratos = pd.DataFrame(limites, columns=COLUNAS_LIMITES)
+    df_contratos.insert(0, "Campo", meta["campos"])
+    df_contratos.insert(0, "ID_Contrato", range(num_contratos))
+
+    # inclui o contrato em branco, para ser utilizado quando
+    # o projeto NAO for alocado
+    contrato_em_branco = pd.DataFrame({"ID_Contrato": num_contratos,
+                                       "Campo": "",
+                                       "Obrigação - PETROBRAS": 0.,
+                                       "Mínimo Externo": 0.,
+                                       "Mínimo Empresa": 0.,
+                                       "Máximo Interno": 0.},
+                                      index=[num_contratos])
+    df_contratos = pd.concat([df_contratos, contrato_em_branco])
+    df_id_contratos = df_contratos[["ID_Contrato", "Campo"]].copy()
+
+    # os detalhes dos projetos so sao lidos na gravacao da planilha de saida
+    meta = instancia["meta"]
+    planilha = meta["planilha"]
+    if instancia["diretorio"] is not None:
+        planilha = os.path.join(os.path.dirname(instancia["diretorio"]),
+                                planilha)
+    df_detalhes_projetos = DetalhesProjetos(planilha, meta["abas"][0],
+                                            instancia["diretorio"])
+
+    return df_projetos, df_detalhes_projetos, projetos_excluidos, \
+        df_contratos, df_id_contratos
+
+
+"""
+funcao: le_planilha_entrada_compilada(planilha, aba_projetos, aba_contratos)
+
+  Objetivo: Substitui utilidades.le_planilha_entrada, lendo os dados da
+            instancia compilada da planilha.
+
+  Retorna:
+          os mesmos dataframes de utilidades.le_planilha_entrada.
+"""
+def le_planilha_entrada_compilada(planilha, aba_projetos, aba_contratos):
+    instancia = carrega_instancia(planilha, aba_projetos, aba_contratos)
+    return dataframes_instancia(instancia)
+
+
+"""
+funcao: compara_carregadores(planilha, aba_projetos, aba_contratos)
+
+  Objetivo: Mede o tempo e o pico de memoria da leitura da planilha com
+            utilidades.le_planilha_entrada (pandas) e com
+            le_planilha_streaming (openpyxl somente leitura).
+
+  Retorna:
+          dicionario {nome do carregador: (tempo em segundos,
+                                           pico de memoria em bytes)}
+"""
+def compara_carregadores(planilha, aba_projetos, aba_contratos):
+    carregadores = {"pandas": util.le_planilha_entrada,
+                    "streaming": le_planilha_streaming}
+    resultado = {}
+    for nome, carregador in carregadores.items():
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        carregador(planilha, aba_projetos, aba_contratos)
+        tempo = time.perf_counter() - inicio
+        atual, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        resultado[nome] = (tempo, pico)
+        print("%-10s Tempo = %.3fs  Pico de memória = %.1f MB"
+              % (nome, tempo, pico / 2 ** 20))
+    return resultado
+
+
+def main():
+    # definir rotinas de testes para as funcoes do modulo
+    return
+
+
+if __name__ == "__main__":
+    main()
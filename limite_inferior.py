@@ -0,0 +1,130 @@
+"""
+Calculo de um limite inferior para a performance (soma quadratica dos
+desvios) de qualquer alocacao dos projetos nos contratos, e do gap de
+otimalidade entre o melhor individuo encontrado e este limite.
+
+O limite e obtido por argumentos agregados de capacidade por
+classificacao de projeto ("EMPRESA", "EXTERNO", "INTERNO"):
+
+    - r1 (TOTAL - Obrigação): a soma dos valores de todos os projetos e
+      a capacidade maxima para cobrir as obrigacoes ativas. O que faltar
+      e um deficit que nenhuma alocacao consegue evitar;
+    - r2 (Mínimo Externo): idem, considerando somente os projetos
+      "EXTERNO" contra a soma dos minimos externos ativos;
+    - r1 + r3 (Máximo Interno): nos contratos com obrigacao e maximo
+      interno ativos, a parcela (Obrigação - Máximo Interno) so pode ser
+      coberta por projetos "EXTERNO" ou "EMPRESA" sem violar o maximo
+      interno. O que faltar vira deficit na obrigacao ou excesso interno.
+
+    Um deficit agregado D distribuido em n contratos tem soma quadratica
+    minima D^2 / n (desigualdade de Cauchy-Schwarz), que e o limite
+    inferior de cada parcela da performance.
+
+"""
+import math
+
+# Definicao de constantes e parametros
+COLUNA_VALOR = "Valor Pago(R$)"
+COLUNA_CLASSIFICACAO = "Classif"
+
+
+"""
+funcao: calcula_limite_inferior(df_projetos, df_contratos)
+
+  Objetivo: Calcula um limite inferior para a performance de qualquer
+            individuo, a partir apenas dos dados lidos da planilha de
+            entrada (le_planilha_entrada).
+
+  Parametros:
+             df_projetos: dataframe com os dados dos projetos;
+             df_contratos: dataframe com os contratos e as restricoes
+                           das regras de negocio.
+
+  Retorna:
+          limite: valor do limite inferior da performance (>= 0).
+"""
+def calcula_limite_inferior(df_projetos, df_contratos):
+    valores = df_projetos[COLUNA_VALOR].fillna(0)
+    classif = df_projetos[COLUNA_CLASSIFICACAO]
+
+    # capacidade total e por classificacao dos projetos
+    valor_total = valores[valores > 0].sum()
+    valor_externo = valores[(classif == "EXTERNO") & (valores > 0)].sum()
+    valor_empresa = valores[(classif == "EMPRESA") & (valores > 0)].sum()
+
+    obrigacao = df_contratos["Obrigação - PETROBRAS"]
+    minimo_externo = df_contratos["Mínimo Externo"]
+    maximo_interno = df_contratos["Máximo Interno"]
+
+    # regras de negocio ativas, como em funcao_restricao
+    r1_ativo = obrigacao > 0
+    r2_ativo = minimo_externo > 0
+    r3_ativo = maximo_interno > 0
+
+    # r1: deficit agregado da obrigacao total
+    limite_r1 = limite_deficit(obrigacao[r1_ativo].sum() - valor_total,
+                               r1_ativo.sum())
+
+    # r2: deficit agregado do minimo externo
+    limite_r2 = limite_deficit(minimo_externo[r2_ativo].sum() - valor_externo,
+                               r2_ativo.sum())
+
+    # r1 + r3: parcela da obrigacao que nao pode ser coberta por projetos
+    # "INTERNO". Cada contrato contribui com 2 desvios (obrigacao e maximo
+    # interno), por isso o deficit e distribuido em 2 * n parcelas.
+    r13_ativo = r1_ativo & r3_ativo
+    parcela_nao_interna = (obrigacao - maximo_interno)[r13_ativo]
+    parcela_nao_interna = parcela_nao_interna[parcela_nao_interna > 0].sum()
+    limite_r13 = limite_deficit(parcela_nao_interna -
+                                (valor_externo + valor_empresa),
+                                2 * r13_ativo.sum())
+
+    # as parcelas r1 e r3 nao sao independentes do argumento r1 + r3,
+    # por isso usa o maior dos dois limites validos
+    limite = max(limite_r1, limite_r13) + limite_r2
+
+    return float(limite)
+
+
+def limite_deficit(deficit, numero_contratos):
+    # soma quadratica minima de um deficit agregado distribuido
+    # em numero_contratos parcelas
+    if deficit <= 0 or numero_contratos == 0:
+        return 0.
+    return deficit * deficit / numero_contratos
+
+
+"""
+funcao: gap_otimalidade(performance, limite)
+
+  Objetivo: Calcula o gap entre a performance de um individuo e o limite
+            inferior da performance.
+
+  Parametros:
+             performance: performance do individuo (f_obj.performance);
+             limite: limite inferior (calcula_limite_inferior).
+
+  Retorna:
+          (gap_absoluto, gap_relativo): o gap relativo e calculado sobre
+                                        a performance, entre 0 e 1.
+"""
+def gap_otimalidade(performance, limite):
+    if math.isnan(performance):
+        return math.nan, math.nan
+
+    gap_absoluto = max(0., performance - limite)
+    if performance > 0:
+        gap_relativo = gap_absoluto / performance
+    else:
+        gap_relativo = 0.
+
+    return gap_absoluto, gap_relativo
+
+
+def main():
+    # definir rotinas de testes para as funcoes do modulo
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+Execucao do programa pela linha de comando, sem editar as constantes dos
+modulos (ex.: TAMANHO_POPULACAO em distribuicao.py).
+
+Cada opcao altera uma constante de um modulo do programa, antes de
+executar distribuicao.main(). As opcoes podem ser lidas tambem de um
+arquivo de configuracao JSON (--configuracao), com os mesmos nomes das
+opcoes (ex.: {"populacao": 5000, "geracoes": 1000}). A ordem de
+prioridade e: opcoes da linha de comando, arquivo de configuracao e
+valores das constantes dos modulos.
+
+A configuracao resolvida (todas as opcoes, com os valores usados) e
+gravada no arquivo de metricas e no checkpoint da execucao
+(distribuicao.CONFIGURACAO_EXECUCAO).
+
+Exemplos:
+    python linha_comando.py --populacao 5000 --geracoes 1000
+    python linha_comando.py --configuracao execucao.json --semente 7
+    python linha_comando.py --configuracao execucao.json --mostra-configuracao
+
+"""
+import sys
+import json
+import argparse
+
+import distribuicao
+import funcao_objetivo as f_obj
+import cache_avaliacao
+import estado_estavel
+import metricas
+import utilidades as util
+
+# Definicao de constantes e parametros
+BOOLEANO = {"action": argparse.BooleanOptionalAction}
+INTEIRO = {"type": int}
+REAL = {"type": float}
+INTERVALO = {"type": float, "nargs": 2, "metavar": ("MIN", "MAX")}
+
+# opcoes da linha de comando: (nome, modulo, constante, parametros do
+# argparse, ajuda)
+OPCOES = [
+    # arquivos de entrada e saida
+    ("planilha", distribuicao, "PLANILHA_DADOS_ENTRADA", {},
+     "planilha de entrada"),
+    ("aba_projetos", distribuicao, "NOME_ABA_ENTRADA_VALORES_A_DISTRIBUIR",
+     {}, "aba dos projetos na planilha de entrada"),
+    ("aba_contratos", distribuicao, "NOME_ABA_ENTRADA_CONTRATOS", {},
+     "aba dos contratos na planilha de entrada"),
+    ("planilha_saida", distribuicao, "PLANILHA_DADOS_SAIDA", {},
+     "planilha de saida"),
+    ("arquivo_checkpoint", distribuicao, "NOME_ARQUIVO_CHECKPOINT", {},
+     "checkpoint da otimizacao"),
+    ("arquivo_metricas", distribuicao, "NOME_ARQUIVO_METRICAS", {},
+     "metricas de cada geracao (.jsonl ou .csv); vazio nao grava"),
+    ("arquivo_populacao", distribuicao, "NOME_ARQUIVO_POPULACAO_FINAL", {},
+     "populacao final"),
+    ("arquivo_historico", distribuicao, "NOME_ARQUIVO_HISTORICO", {},
+     "historico das estatisticas"),
+    ("arquivo_melhores", distribuicao, "NOME_ARQUIVO_MELHORES_RESULTADOS",
+     {}, "melhores individuos"),
+    ("arquivo_melhor_individuo", util, "NOME_ARQUIVO_MELHOR_INDIVIDUO", {},
+     "melhor individuo"),
+    ("instancia_compilada", distribuicao, "USA_INSTANCIA_COMPILADA",
+     BOOLEANO, "le a instancia compilada da planilha"),
+
+    # algoritmo genetico
+    ("populacao", distribuicao, "TAMANHO_POPULACAO", INTEIRO,
+     "tamanho da populacao"),
+    ("geracoes", distribuicao, "NUMERO_GERACOES", INTEIRO,
+     "numero de geracoes"),
+    ("probabilidade_cruzamento", distribuicao, "PROBABILIDADE_CROSSOVER",
+     INTERVALO, "intervalo da probabilidade de cruzamento"),
+    ("probabilidade_mutacao", distribuicao, "PROBABILIDADE_MUTACAO",
+     INTERVALO, "intervalo da probabilidade de mutacao"),
+    ("melhores_guardados", distribuicao,
+     "NUMERO_MELHORES_INDIVIDUOS_GUARDADO", INTEIRO,
+     "numero de melhores individuos guardados"),
+    ("modo_evolucao", distribuicao, "MODO_EVOLUCAO",
+     {"choices": ["geracional", "estado_estavel", "matricial"]},
+     "modo de evolucao"),
+    ("motor", distribuicao, "MOTOR_OTIMIZACAO",
+     {"choices": ["genetico", "tabu", "genetico_tabu"]},
+     "motor de otimizacao"),
+    ("iteracoes_tabu", distribuicao, "NUMERO_ITERACOES_TABU", INTEIRO,
+     "iteracoes da busca tabu"),
+    ("tempo_maximo_tabu", distribuicao, "TEMPO_MAXIMO_TABU", REAL,
+     "tempo maximo da busca tabu (segundos)"),
+    ("incremental", distribuicao, "REOTIMIZACAO_INCREMENTAL", BOOLEANO,
+     "reotimizacao incremental quando a planilha muda"),
+    ("geracoes_incremental", distribuicao, "NUMERO_GERACOES_INCREMENTAL",
+     INTEIRO, "geracoes da reotimizacao incremental"),
+    ("aborta_inviavel", distribuicao, "ABORTA_INSTANCIA_INVIAVEL", BOOLEANO,
+     "interrompe quando o presolve identifica uma instancia inviavel"),
+    ("semente", distribuicao, "SEMENTE", INTEIRO,
+     "semente dos numeros aleatorios"),
+
+    # orcamentos e criterios de parada
+    ("tempo_maximo", distribuicao, "TEMPO_MAXIMO_EXECUCAO", REAL,
+     "tempo maximo da evolucao (segundos)"),
+    ("avaliacoes_maximas", distribuicao, "NUMERO_MAXIMO_AVALIACOES",
+     INTEIRO, "numero maximo de avaliacoes"),
+    ("gap_parada", distribuicao, "GAP_RELATIVO_PARADA", REAL,
+     "gap de otimalidade relativo de parada"),
+
+    # avaliacao e processos
+    ("avaliacao", f_obj, "AVALIACAO_CENTAVOS",
+     {"choices": ["centavos", "pandas"]}, "calculo da funcao objetivo"),
+    ("servidores", distribuicao, "SERVIDORES_AVALIACAO",
+     {"nargs": "*", "metavar": "HOST:PORTA"},
+     "servidores de avaliacao distribuida"),
+    ("transporte", distribuicao, "TRANSPORTE_AVALIACAO",
+     {"choices": ["conexao", "socket"]},
+     "transporte da avaliacao distribuida"),
+    ("ilhas", distribuicao, "NUMERO_ILHAS", INTEIRO,
+     "numero de ilhas (processos) do modelo de ilhas"),
+    ("processos", estado_estavel, "NUMERO_PROCESSOS", INTEIRO,
+     "processos de avaliacao do estado estavel"),
+    ("cache", distribuicao, "USA_CACHE_AVALIACOES", BOOLEANO,
+     "nao avalia novamente individuos ja avaliados"),
+    ("tamanho_cache", cache_avaliacao, "TAMANHO_CACHE", INTEIRO,
+     "individuos guardados no cache de avaliacoes"),
+
+    # gravacao e saida
+    ("intervalo_checkpoint", distribuicao,
+     "NUMERO_GERACOES_GRAVA_CHECKPOINT", INTEIRO,
+     "geracoes entre as gravacoes do checkpoint"),
+    ("intervalo_melhores", distribuicao,
+     "NUMERO_GERACOES_GRAVA_MELHORES_RESULTADOS", INTEIRO,
+     "geracoes entre as gravacoes dos melhores resultados"),
+    ("intervalo_populacao", distribuicao, "NUMERO_GERACOES_GRAVA_POPULACAO",
+     INTEIRO, "geracoes entre as gravacoes da populacao"),
+    ("intervalo_historico", distribuicao, "NUMERO_GERACOES_GRAVA_HISTORICO",
+     INTEIRO, "geracoes entre as gravacoes do historico"),
+    ("gravacao_segundo_plano", distribuicao, "GRAVACAO_EM_SEGUNDO_PLANO",
+     BOOLEANO, "grava a planilha de saida em segundo plano"),
+    ("registros_metricas", metricas, "NUMERO_REGISTROS_DESCARGA", INTEIRO,
+     "registros acumulados antes de gravar as metricas"),
+    ("intervalo_metricas", metricas, "INTERVALO_DESCARGA", REAL,
+     "segundos entre as gravacoes das metricas"),
+    ("grava_individuos_validos", f_obj, "GRAVA_INDIVIDUOS_VALIDOS", BOOLEANO,
+     "grava os individuos validos avaliados"),
+    ("perfil", distribuicao, "PERFIL_ATIVO", BOOLEANO,
+     "mede o tempo de cada etapa da geracao"),
+    ("porta_monitor", distribuicao, "PORTA_MONITOR", INTEIRO,
+     "porta do monitoramento por HTTP"),
+]
+
+# opcoes com valores diferentes dos valores das constantes:
+# nome: (constante -> opcao, opcao -> constante)
+CONVERSOES = {
+    "avaliacao": (lambda c: "centavos" if c else "pandas",
+                  lambda v: v == "centavos"),
+    "servidores": (lambda c: ["%s:%i" % tuple(s) for s in c],
+                   lambda v: [(s.rsplit(":", 1)[0], int(s.rsplit(":", 1)[1]))
+                              for s in v]),
+    "arquivo_metricas": (lambda c: "" if c is None else c,
+                         lambda v: v if v else None),
+    "probabilidade_cruzamento": (list, tuple),
+    "probabilidade_mutacao": (list, tuple),
+}
+
+
+"""
+funcao: cria_parser()
+
+  Objetivo: Cria o interpretador dos argumentos da linha de comando, com
+            uma opcao para cada item de OPCOES.
+
+  Retorna:
+          argparse.ArgumentParser
+"""
+def cria_parser():
+    parser = argparse.ArgumentParser(
+        description="Otimizacao do RCA (distribuicao dos projetos nos "
+                    "contratos)",
+        argument_default=argparse.SUPPRESS)
+    parser.add_argument("--configuracao", metavar="ARQUIVO",
+                        help="arquivo de configuracao JSON")
+    parser.add_argument("--mostra-configuracao", action="store_true",
+                        help="mostra a configuracao resolvida e encerra")
+    for nome, modulo, constante, parametros, ajuda in OPCOES:
+        parser.add_argument("--" + nome.replace("_", "-"), dest=nome,
+                            help="%s (%s.%s)" % (ajuda, modulo.__name__,
+                                                 constante),
+                            **parametros)
+    return parser
+
+
+"""
+funcao: resolve_configuracao(argumentos)
+
+  Objetivo: Combina os valores das constantes, do arquivo de configuracao
+            e da linha de comando.
+
+  Parametros:
+             argumentos: lista de argumentos. None usa sys.argv.
+
+  Retorna:
+          configuracao: dicionario {opcao: valor} com todas as opcoes;
+          mostra: True caso --mostra-configuracao tenha sido informado.
+"""
+def resolve_configuracao(argumentos=None):
+    parser = cria_parser()
+    args = vars(parser.parse_args(argumentos))
+
+    configuracao = {}
+    for nome, modulo, constante, parametros, ajuda in OPCOES:
+        valor = getattr(modulo, constante)
+        if nome in CONVERSOES:
+            valor = CONVERSOES[nome][0](valor)
+        configuracao[nome] = valor
+
+    if "configuracao" in args:
+        configuracao.update(le_arquivo_configuracao(args["configuracao"],
+                                                    parser))
+    configuracao.update({nome: valor for nome, valor in args.items()
+                         if nome in configuracao})
+    return configuracao, args.get("mostra_configuracao", False)
+
+
+def le_arquivo_configuracao(nome_arquivo, parser):
+    # le e valida o arquivo de configuracao JSON
+    try:
+        with open(nome_arquivo, encoding="utf-8") as arq:
+            dados = json.load(arq)
+    except (OSError, ValueError) as erro:
+        parser.error("arquivo de configuracao %s: %s" % (nome_arquivo, erro))
+    if not isinstance(dados, dict):
+        parser.error("arquivo de configuracao %s: esperado um objeto JSON"
+                     % nome_arquivo)
+
+    opcoes = {nome: parametros
+              for nome, modulo, constante, parametros, ajuda in OPCOES}
+    configuracao = {}
+    for chave, valor in dados.items():
+        nome = chave.replace("-", "_")
+        if nome not in opcoes:
+            parser.error("opcao desconhecida no arquivo de configuracao: " +
+                         chave)
+        parametros = opcoes[nome]
+        # as opcoes BOOLEANO nao tem "type": somente true ou false
+        if parametros is BOOLEANO and not isinstance(valor, bool):
+            parser.error("valor invalido para %s: %r (esperado true ou "
+                         "false)" % (chave, valor))
+        if valor is not None and "type" in parametros:
+            try:
+                if "nargs" in parametros:
+                    valor = [parametros["type"](v) for v in valor]
+                else:
+                    valor = parametros["type"](valor)
+            except (TypeError, ValueError):
+                parser.error("valor invalido para %s: %r" % (chave, valor))
+        if "choices" in parametros and valor not in parametros["choices"]:
+            parser.error("valor invalido para %s: %r (opcoes: %s)" %
+                         (chave, valor, ", ".join(parametros["choices"])))
+        configuracao[nome] = valor
+    return configuracao
+
+
+"""
+funcao: aplica_configuracao(configuracao)
+
+  Objetivo: Altera as constantes dos modulos com os valores da
+            configuracao, e guarda a configuracao para ser gravada nas
+            metricas e no checkpoint.
+
+  Retorna:
+"""
+def aplica_configuracao(configuracao):
+    for nome, modulo, constante, parametros, ajuda in OPCOES:
+        valor = configuracao[nome]
+        if nome in CONVERSOES:
+            valor = CONVERSOES[nome][1](valor)
+        setattr(modulo, constante, valor)
+    distribuicao.CONFIGURACAO_EXECUCAO = dict(configuracao)
+    return
+
+
+def main(argumentos=None):
+    configuracao, mostra = resolve_configuracao(argumentos)
+    if mostra:
+        json.dump(configuracao, sys.stdout, ensure_ascii=False, indent=1)
+        print()
+        return
+    aplica_configuracao(configuracao)
+    distribuicao.main()
+    return
+
+
+if __name__ == "__main__":
+    main()
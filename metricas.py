@@ -0,0 +1,119 @@
+"""
+Registro continuo das metricas de cada geracao do algoritmo genetico.
+
+Cada geracao acrescenta um registro ao final do arquivo de metricas, em
+formato JSONL (um objeto JSON por linha) ou CSV, conforme a extensao do
+arquivo. Diferente de Historico.rca (pickle do Logbook do DEAP, regravado
+por inteiro), o arquivo pode ser acompanhado durante a execucao
+(ex.: tail -f Metricas.jsonl) ou lido por qualquer ferramenta.
+
+A configuracao da execucao (linha_comando.py), quando informada, e gravada
+como uma linha {"configuracao": ...} antes das geracoes (ver
+registra_configuracao).
+
+Valores nao finitos (NaN, infinito), que nao existem em JSON, sao gravados
+como null (JSONL) ou vazios (CSV).
+
+As gravacoes sao acumuladas em memoria e descarregadas no arquivo a cada
+NUMERO_REGISTROS_DESCARGA registros ou INTERVALO_DESCARGA segundos.
+
+"""
+import os
+import csv
+import json
+import math
+import time
+import numbers
+
+# Definicao de constantes e parametros
+NUMERO_REGISTROS_DESCARGA = 10
+INTERVALO_DESCARGA = 5  # segundos
+
+
+class RegistroMetricas:
+    def __init__(self, nome_arquivo, numero_registros=NUMERO_REGISTROS_DESCARGA,
+                 intervalo=INTERVALO_DESCARGA):
+        self.nome_arquivo = nome_arquivo
+        self.formato = "csv" if nome_arquivo.lower().endswith(".csv") \
+            else "jsonl"
+        self.numero_registros = numero_registros
+        self.intervalo = intervalo
+        self.pendentes = []
+        self.ultima_descarga = time.monotonic()
+        self.campos = None
+        # continua um arquivo csv existente com o mesmo cabecalho
+        if self.formato == "csv" and os.path.exists(nome_arquivo) and \
+                os.path.getsize(nome_arquivo) > 0:
+            with open(nome_arquivo, newline="", encoding="utf-8") as arq:
+                self.campos = next(csv.reader(arq))
+        self.arquivo = open(nome_arquivo, "a", newline="", encoding="utf-8")
+
+    def registra(self, registro):
+        # acrescenta o registro de uma geracao
+        self.pendentes.append(achata(registro))
+        if len(self.pendentes) >= self.numero_registros or \
+                time.monotonic() - self.ultima_descarga >= self.intervalo:
+            self.descarrega()
+
+    def registra_configuracao(self, configuracao):
+        # grava a configuracao da execucao: uma linha {"configuracao": ...}
+        # no arquivo JSONL, ou um arquivo "<nome>.configuracao.json" ao
+        # lado do arquivo CSV, que tem um unico cabecalho
+        if self.formato == "csv":
+            with open(self.nome_arquivo + ".configuracao.json", "w",
+                      encoding="utf-8") as arq:
+                json.dump(configuracao, arq, ensure_ascii=False, indent=1,
+                          default=str)
+        else:
+            self.descarrega()
+            self.arquivo.write(json.dumps({"configuracao": configuracao},
+                                          ensure_ascii=False, default=str)
+                               + "\n")
+            self.arquivo.flush()
+
+    def descarrega(self):
+        # grava os registros pendentes no arquivo
+        if len(self.pendentes) > 0:
+            if self.formato == "csv":
+                if self.campos is None:
+                    self.campos = list(self.pendentes[0])
+                    csv.writer(self.arquivo).writerow(self.campos)
+                escritor = csv.DictWriter(self.arquivo, self.campos,
+                                          extrasaction="ignore")
+                escritor.writerows(self.pendentes)
+            else:
+                self.arquivo.writelines(json.dumps(r, default=float,
+                                                   allow_nan=False) + "\n"
+                                        for r in self.pendentes)
+            self.arquivo.flush()
+            self.pendentes = []
+        self.ultima_descarga = time.monotonic()
+
+    def fecha(self):
+        self.descarrega()
+        self.arquivo.close()
+
+
+def achata(registro, prefixo=""):
+    # transforma dicionarios internos em campos "<chave>_<subchave>",
+    # para o formato csv, e os valores nao finitos em None
+    plano = {}
+    for chave, valor in registro.items():
+        if isinstance(valor, dict):
+            plano.update(achata(valor, prefixo + chave + "_"))
+        elif isinstance(valor, numbers.Real) and \
+                not isinstance(valor, numbers.Integral) and \
+                not math.isfinite(valor):
+            plano[prefixo + chave] = None
+        else:
+            plano[prefixo + chave] = valor
+    return plano
+
+
+def main():
+    # definir rotinas de testes para as funcoes do modulo
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Monitoramento da otimizacao durante a execucao, por HTTP.
+
+O MonitorOtimizacao executa um servidor HTTP local em uma thread separada.
+O algoritmo genetico apenas atualiza, a cada geracao, as referencias para
+os valores atuais (atualiza); todos os calculos sao feitos somente quando
+o endereco e consultado:
+    - /metrics: formato texto do Prometheus;
+    - / ou /status: JSON.
+
+São informados a geracao atual, a melhor performance e a media da
+populacao, as avaliacoes por segundo, se o melhor individuo atende a todas
+as regras de negocio (funcao_objetivo.individuo_valido), os desvios de
+cada contrato e a previsao de termino.
+
+"""
+import json
+import math
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import funcao_objetivo as f_obj
+
+# Definicao de constantes e parametros
+ENDERECO_MONITOR = "127.0.0.1"  # somente acesso local
+NOMES_DESVIOS = ["obrigacao", "minimo_externo", "maximo_interno"]
+
+
+class MonitorOtimizacao:
+    def __init__(self, porta, nomes_contratos, numero_geracoes,
+                 endereco=ENDERECO_MONITOR):
+        self.nomes_contratos = list(nomes_contratos)
+        self.numero_geracoes = numero_geracoes
+        self.inicio = time.perf_counter()
+        self.geracao_inicial = None
+        self.estado = {"geracao": 0, "melhor_individuo": None,
+                       "media": math.nan, "avaliacoes": 0,
+                       "tempo": 0.}
+
+        monitor = self
+
+        class Requisicao(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/metrics"):
+                    corpo = monitor.texto_prometheus()
+                    tipo = "text/plain; version=0.0.4; charset=utf-8"
+                elif self.path in ("/", "/status"):
+                    corpo = json.dumps(monitor.resumo(), default=float,
+                                       ensure_ascii=False)
+                    tipo = "application/json; charset=utf-8"
+                else:
+                    self.send_error(404)
+                    return
+                dados = corpo.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", tipo)
+                self.send_header("Content-Length", str(len(dados)))
+                self.end_headers()
+                self.wfile.write(dados)
+
+            def log_message(self, formato, *args):
+                # nao imprime as requisicoes na tela
+                return
+
+        self.servidor = ThreadingHTTPServer((endereco, porta), Requisicao)
+        self.servidor.daemon_threads = True
+        self.thread = threading.Thread(target=self.servidor.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+
+    def atualiza(self, geracao, melhor_individuo, media, avaliacoes):
+        # chamada a cada geracao: somente substitui o estado atual
+        if self.geracao_inicial is None:
+            self.geracao_inicial = geracao - 1
+        self.estado = {"geracao": geracao,
+                       "melhor_individuo": melhor_individuo,
+                       "media": media, "avaliacoes": avaliacoes,
+                       "tempo": time.perf_counter() - self.inicio}
+
+    def resumo(self):
+        # calcula os valores informados a partir do estado atual
+        estado = self.estado
+        geracao = estado["geracao"]
+        tempo = estado["tempo"]
+        melhor = estado["melhor_individuo"]
+
+        geracoes_executadas = geracao - (self.geracao_inicial or 0)
+        previsao = None
+        if geracoes_executadas > 0:
+            previsao = (tempo / geracoes_executadas) * \
+                max(self.numero_geracoes - geracao, 0)
+
+        resumo = {"geracao": geracao,
+                  "numero_geracoes": self.numero_geracoes,
+                  "tempo": tempo,
+                  "avaliacoes": estado["avaliacoes"],
+                  "avaliacoes_por_segundo":
+                      estado["avaliacoes"] / tempo if tempo > 0 else 0.,
+                  "previsao_termino": previsao,
+                  "media": estado["media"],
+                  "melhor": None, "valido": None, "contratos": []}
+
+        if melhor is not None:
+            resumo["melhor"] = f_obj.performance(melhor)
+            resumo["valido"] = f_obj.individuo_valido(melhor)
+            desvios = f_obj.tabela_desvios(melhor).values
+            for nome, linha in zip(self.nomes_contratos, desvios):
+                contrato = {"contrato": nome}
+                contrato.update(zip(NOMES_DESVIOS, linha.tolist()))
+                resumo["contratos"].append(contrato)
+        return resumo
+
+    def texto_prometheus(self):
+        # formato de exposicao em texto do Prometheus
+        resumo = self.resumo()
+        linhas = []
+        # cada metrica tem uma unica linha TYPE, mesmo com varias amostras
+        tipos_gravados = set()
+
+        def metrica(nome, valor, tipo="gauge", rotulos=""):
+            if valor is None:
+                return
+            if nome not in tipos_gravados:
+                tipos_gravados.add(nome)
+                linhas.append("# TYPE rca_" + nome + " " + tipo)
+            linhas.append("rca_%s%s %r" % (nome, rotulos, float(valor)))
+
+        metrica("geracao", resumo["geracao"])
+        metrica("tempo_segundos", resumo["tempo"])
+        metrica("avaliacoes_total", resumo["avaliacoes"], "counter")
+        metrica("avaliacoes_por_segundo", resumo["avaliacoes_por_segundo"])
+        metrica("previsao_termino_segundos", resumo["previsao_termino"])
+        metrica("performance_media", resumo["media"])
+        metrica("performance_melhor", resumo["melhor"])
+        metrica("melhor_valido", resumo["valido"])
+        for contrato in resumo["contratos"]:
+            # escapes dos valores de rotulos do formato do Prometheus
+            nome = contrato["contrato"].replace("\\", "\\\\") \
+                .replace('"', '\\"').replace("\n", "\\n")
+            for desvio in NOMES_DESVIOS:
+                metrica("desvio", contrato[desvio],
+                        rotulos='{contrato="%s",regra="%s"}' % (nome, desvio))
+        return "\n".join(linhas) + "\n"
+
+    def fecha(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+
+def main():
+    # definir rotinas de testes para as funcoes do modulo
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -39,6 +39,8 @@ funcao: tipo(toolbox)
                     
   Parametros:
              toolbox: objeto toolbox do DEAP
+             opcoes_permitidas: lista das opcoes que podem ser sorteadas.
+                                None sorteia entre todas as opcoes.
 
 
   Retorna:
@@ -46,10 +48,15 @@ funcao: tipo(toolbox)
 """
 
 
-def tipo(toolbox, numero_contratos, indice_contratos, contratos, projetos):
+def tipo(toolbox, numero_contratos, indice_contratos, contratos, projetos,
+         opcoes_permitidas=None):
     # seleciona randomicamente uma das opcoes abaixo:
     opcoes = 7  # ### ATENCAO ### probabilidades diferentes nas opcoes
     i = random.randint(1, opcoes)
+    # restringe as opcoes sorteadas, caso informadas (ex.: [4, 6] usa
+    # somente os metodos customizados)
+    if opcoes_permitidas is not None:
+        i = random.choice(opcoes_permitidas)
     if i == 1:
         toolbox.register("mutate", tools.mutShuffleIndexes,
                          indpb=random.uniform(PROB_MUTACAO_DEAP[0],
@@ -0,0 +1,264 @@
+"""
+Interface assincrona (asyncio) do algoritmo genetico, para executar a
+otimizacao dentro de outros programas (ex.: ferramentas de agendamento),
+sem as constantes e os arquivos de distribuicao.main().
+
+Cada otimizacao (OtimizadorAssincrono) e executada em um processo de um
+conjunto de processos (PoolOtimizacao), com distribuicao.executa_otimizacao.
+Os processos sao compartilhados: varias otimizacoes, de instancias
+diferentes, executam ao mesmo tempo, cada uma em um processo, sem
+bloquear o loop de eventos nem umas as outras. Cada processo tem os seus
+proprios tipos do DEAP e dados da funcao objetivo, e as instancias podem
+ter numeros de contratos diferentes.
+
+O progresso e enviado por uma fila do processo da otimizacao e lido como
+um iterador assincrono:
+
+    async with PoolOtimizacao() as pool:
+        otimizador = pool.otimizador(df_id_contratos, df_contratos,
+                                     df_projetos, projetos_excluidos,
+                                     numero_geracoes=100, tempo_maximo=60)
+        async for evento in otimizador:
+            ...  # {"tipo": "geracao", ...} ou {"tipo": "melhoria", ...}
+        resultado = await otimizador.resultado()
+
+Eventos:
+    "geracao": metricas de cada geracao (ver executa_otimizacao), com
+               "geracao", "tempo", "melhor" e "valido";
+    "melhoria": "geracao", "performance" e "genes" de cada novo melhor
+                individuo.
+
+A otimizacao e interrompida ao final da geracao atual por cancela(), pelo
+cancelamento da tarefa que le os eventos, ou pelo tempo maximo, e
+devolve o melhor resultado ate o momento.
+
+"""
+import os
+import queue
+import asyncio
+import multiprocessing
+import concurrent.futures
+
+import numpy as np
+
+import distribuicao
+import presolve
+import selecao
+import funcao_objetivo as f_obj
+import conversao_individuos as conv
+
+# Definicao de constantes e parametros
+NUMERO_PROCESSOS = os.cpu_count()
+# tempo maximo de espera de cada leitura da fila de eventos. Define a
+# rapidez com que o fim de um processo interrompido e percebido
+TEMPO_ESPERA_EVENTO = 0.2  # segundos
+
+
+# conjunto de processos compartilhado pelas otimizacoes
+class PoolOtimizacao:
+    def __init__(self, numero_processos=NUMERO_PROCESSOS):
+        self.gerenciador = multiprocessing.Manager()
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=numero_processos)
+
+    def otimizador(self, df_id_contratos, df_contratos, df_projetos,
+                   projetos_excluidos, **parametros):
+        # cria uma otimizacao executada neste conjunto de processos
+        return OtimizadorAssincrono(self, df_id_contratos, df_contratos,
+                                    df_projetos, projetos_excluidos,
+                                    **parametros)
+
+    def fecha(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.gerenciador.shutdown()
+        return
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *excecao):
+        await asyncio.get_running_loop().run_in_executor(None, self.fecha)
+        return False
+
+
+# uma otimizacao executada em PoolOtimizacao. Os parametros sao os de
+# distribuicao.executa_otimizacao; pop_inicial e um array (ou lista) de
+# alocacoes para iniciar a populacao
+class OtimizadorAssincrono:
+    def __init__(self, pool, df_id_contratos, df_contratos, df_projetos,
+                 projetos_excluidos,
+                 tamanho_populacao=distribuicao.TAMANHO_POPULACAO,
+                 numero_geracoes=distribuicao.NUMERO_GERACOES,
+                 tempo_maximo=None, semente=None, operadores=None,
+                 pop_inicial=None):
+        self.fila = pool.gerenciador.Queue()
+        self.cancelado = pool.gerenciador.Event()
+        if pop_inicial is not None:
+            pop_inicial = np.asarray(pop_inicial, dtype=np.int32)
+        parametros = {"tamanho_populacao": tamanho_populacao,
+                      "numero_geracoes": numero_geracoes,
+                      "tempo_maximo": tempo_maximo, "semente": semente,
+                      "operadores": operadores}
+        self.futuro = pool.executor.submit(
+            executa_otimizacao_processo,
+            (df_id_contratos, df_contratos, df_projetos, projetos_excluidos),
+            parametros, pop_inicial, self.fila, self.cancelado)
+        self.terminou = False
+
+    def cancela(self):
+        # interrompe a otimizacao ao final da geracao atual
+        self.cancelado.set()
+        self.futuro.cancel()  # caso ainda nao tenha iniciado
+        return
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        loop = asyncio.get_running_loop()
+        while not self.terminou:
+            try:
+                evento = await loop.run_in_executor(
+                    None, le_evento, self.fila, TEMPO_ESPERA_EVENTO)
+            except asyncio.CancelledError:
+                # a tarefa que le os eventos foi cancelada
+                self.cancela()
+                raise
+            if evento is not None:
+                if evento["tipo"] == "fim":
+                    self.terminou = True
+                    break
+                return evento
+            if self.futuro.done() and self.fila.empty():
+                # o processo terminou sem enviar o fim (erro ou
+                # cancelado antes de iniciar)
+                self.terminou = True
+        raise StopAsyncIteration
+
+    async def resultado(self):
+        # aguarda o fim da otimizacao, e devolve um dicionario com "genes"
+        # e "performance" do melhor individuo, "populacao" (genes da
+        # populacao final), "historico" (ver executa_otimizacao) e
+        # "cancelado". Levanta a excecao da otimizacao, caso tenha ocorrido
+        try:
+            genes, fitness, historico = \
+                await asyncio.wrap_future(self.futuro)
+        except asyncio.CancelledError:
+            if not self.futuro.cancelled():
+                self.cancela()
+                raise
+            # cancelada antes de iniciar
+            genes, fitness, historico = None, None, []
+        if genes is None or len(genes) == 0:
+            return {"genes": None, "performance": None, "populacao": genes,
+                    "historico": historico,
+                    "cancelado": self.cancelado.is_set()}
+        # a populacao final vem ordenada como na selecao
+        # (executa_otimizacao_processo)
+        performances = [conv.soma_performance(f) for f in fitness]
+        melhor = next((i for i, p in enumerate(performances)
+                       if not np.isnan(p)), 0)
+        return {"genes": genes[melhor].tolist(),
+                "performance": performances[melhor],
+                "populacao": genes,
+                "historico": historico,
+                "cancelado": self.cancelado.is_set()}
+
+
+def le_evento(fila, tempo_espera):
+    # le o proximo evento da fila, ou None apos o tempo de espera
+    try:
+        return fila.get(timeout=tempo_espera)
+    except queue.Empty:
+        return None
+
+
+# registro das metricas de executa_otimizacao, enviadas pela fila de
+# eventos
+class RegistroFila:
+    def __init__(self, fila):
+        self.fila = fila
+
+    def append(self, metricas):
+        evento = {"tipo": "geracao", "geracao": metricas.get("ger")}
+        evento.update(metricas)
+        self.fila.put(evento)
+        return
+
+    def notifica_melhoria(self, geracao, individuo):
+        self.fila.put({"tipo": "melhoria", "geracao": geracao,
+                       "performance": f_obj.performance(individuo),
+                       "genes": individuo[:]})
+        return
+
+
+def executa_otimizacao_processo(dados, parametros, pop_inicial, fila,
+                                cancelado):
+    # executada em um processo de PoolOtimizacao. Devolve a populacao final
+    # compactada (genes e fitness) e o historico
+    df_id_contratos, df_contratos, df_projetos, projetos_excluidos = dados
+    try:
+        # os processos nao gravam os individuos validos em disco
+        f_obj.GRAVA_INDIVIDUOS_VALIDOS = False
+        distribuicao.cria_tipos_deap(len(df_id_contratos))
+        if pop_inicial is not None:
+            pop_inicial = conv.monta_individuos(pop_inicial, None)
+        registro = RegistroFila(fila)
+        pop, historico = distribuicao.executa_otimizacao(
+            df_id_contratos, df_contratos, df_projetos, projetos_excluidos,
+            pop_inicial=pop_inicial, registro=registro, cancelado=cancelado,
+            notifica_melhoria=registro.notifica_melhoria, **parametros)
+        viabilidade = selecao.usa_selecao_viabilidade(
+            df_id_contratos, df_contratos, df_projetos)
+        pop = selecao.ordena_melhores(pop, viabilidade)
+        genes, fitness = conv.compacta_individuos(pop)
+    finally:
+        fila.put({"tipo": "fim"})
+    return genes, fitness, historico
+
+
+async def executa_exemplo(numero_geracoes):
+    # duas otimizacoes simultaneas da planilha de entrada, com sementes
+    # diferentes; a segunda e cancelada apos 3 melhorias
+    df_projetos, df_detalhes_projetos, projetos_excluidos, df_contratos, \
+        df_id_contratos, _ = presolve.le_dados_otimizacao(
+            distribuicao.PLANILHA_DADOS_ENTRADA,
+            distribuicao.NOME_ABA_ENTRADA_VALORES_A_DISTRIBUIR,
+            distribuicao.NOME_ABA_ENTRADA_CONTRATOS,
+            compilada=distribuicao.USA_INSTANCIA_COMPILADA)
+
+    async def acompanha(nome, otimizador, melhorias_maximas=None):
+        melhorias = 0
+        async for evento in otimizador:
+            if evento["tipo"] == "melhoria":
+                melhorias += 1
+                print("%s: geração %i, melhor = %s" %
+                      (nome, evento["geracao"],
+                       '{:,.0f}'.format(evento["performance"])))
+                if melhorias_maximas is not None and \
+                        melhorias >= melhorias_maximas:
+                    otimizador.cancela()
+        resultado = await otimizador.resultado()
+        print("%s: final = %s%s" % (nome,
+                                    '{:,.0f}'.format(resultado["performance"]),
+                                    " (cancelado)" if resultado["cancelado"]
+                                    else ""))
+        return resultado
+
+    async with PoolOtimizacao(numero_processos=2) as pool:
+        dados = (df_id_contratos, df_contratos, df_projetos,
+                 projetos_excluidos)
+        otimizadores = [pool.otimizador(*dados, semente=i,
+                                        numero_geracoes=numero_geracoes)
+                        for i in range(2)]
+        return await asyncio.gather(acompanha("A", otimizadores[0]),
+                                    acompanha("B", otimizadores[1], 3))
+
+
+def main():
+    asyncio.run(executa_exemplo(distribuicao.NUMERO_GERACOES))
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Medicao do tempo gasto em cada etapa da geracao do algoritmo genetico.
+
+O Perfil acumula o tempo (time.perf_counter) e o numero de execucoes de
+cada etapa, de duas formas:
+    - marca(nome): atribui a etapa "nome" o tempo decorrido desde a marca
+      anterior. Permite medir etapas sequenciais sem alterar o codigo de
+      cada uma;
+    - instrumenta(toolbox, funcao, prefixo): substitui a funcao registrada no
+      toolbox (ex.: "mate", "mutate", "select") por uma que mede o tempo
+      de cada chamada, por operador.
+
+Opcionalmente, as geracoes de um intervalo sao executadas com o cProfile,
+e as funcoes mais demoradas sao impressas ao final.
+
+"""
+import time
+import functools
+import pstats
+import cProfile
+
+# Definicao de constantes e parametros
+NUMERO_FUNCOES_CPROFILE = 25  # funcoes impressas no resumo do cProfile
+
+
+class Perfil:
+    def __init__(self, ativo=True, geracoes_cprofile=None,
+                 arquivo_cprofile=None):
+        self.ativo = ativo
+        # intervalo (primeira, ultima) das geracoes executadas com o cProfile
+        self.geracoes_cprofile = geracoes_cprofile
+        self.arquivo_cprofile = arquivo_cprofile
+        self.cprofile = None
+        self.tempos = {}  # nome: tempo total
+        self.chamadas = {}  # nome: numero de execucoes
+        self.tempos_geracao = {}  # tempos somente da geracao atual
+        self.ultima_marca = time.perf_counter()
+
+    def inicia(self):
+        # inicia a medicao a partir deste ponto
+        self.ultima_marca = time.perf_counter()
+
+    def marca(self, nome):
+        # atribui a etapa o tempo desde a marca anterior
+        if not self.ativo:
+            return
+        agora = time.perf_counter()
+        self.acumula(nome, agora - self.ultima_marca)
+        self.ultima_marca = agora
+
+    def acumula(self, nome, tempo, chamadas=1):
+        self.tempos[nome] = self.tempos.get(nome, 0.) + tempo
+        self.chamadas[nome] = self.chamadas.get(nome, 0) + chamadas
+        self.tempos_geracao[nome] = self.tempos_geracao.get(nome, 0.) + tempo
+
+    def instrumenta(self, toolbox, funcao, prefixo):
+        # mede o tempo de cada chamada da funcao registrada no toolbox,
+        # identificada pelo nome do operador
+        if not self.ativo:
+            return
+        operador = getattr(toolbox, funcao)
+        original = getattr(operador, "func", operador)
+        nome = prefixo + "." + original.__name__
+
+        # mantem o nome do operador original, usado nas estatisticas dos
+        # operadores (distribuicao.atualiza_estatisticas_operadores)
+        @functools.wraps(original)
+        def operador_medido(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return operador(*args, **kwargs)
+            finally:
+                self.acumula(nome, time.perf_counter() - inicio)
+
+        toolbox.register(funcao, operador_medido)
+
+    def tempos_etapas(self):
+        # tempos das etapas da geracao atual, sem os operadores, que variam
+        # a cada geracao
+        return {nome: t for nome, t in self.tempos_geracao.items()
+                if "." not in nome}
+
+    def nova_geracao(self, g):
+        # reinicia os tempos da geracao, e liga ou desliga o cProfile
+        # conforme o intervalo de geracoes
+        self.tempos_geracao = {}
+        if self.geracoes_cprofile is not None:
+            primeira, ultima = self.geracoes_cprofile
+            if g == primeira and self.cprofile is None:
+                self.cprofile = cProfile.Profile()
+                self.cprofile.enable()
+            elif g == ultima + 1 and self.cprofile is not None:
+                self.cprofile.disable()
+        self.inicia()
+
+    def imprime_resumo(self):
+        # imprime a tabela com o tempo gasto em cada etapa
+        if not self.ativo or len(self.tempos) == 0:
+            return
+        # as etapas medidas com marca() somam o tempo total. O tempo dos
+        # operadores ja esta incluido nas etapas
+        total = sum(t for nome, t in self.tempos.items() if "." not in nome)
+        print("%-40s %10s %7s %10s %12s" %
+              ("Etapa", "Tempo (s)", "%", "Execuções", "Média (ms)"))
+        for nome, tempo in sorted(self.tempos.items(),
+                                  key=lambda item: -item[1]):
+            print("%-40s %10.2f %6.1f%% %10i %12.3f" %
+                  (nome[0:40], tempo, 100 * tempo / max(total, 1e-12),
+                   self.chamadas[nome],
+                   1000 * tempo / max(self.chamadas[nome], 1)))
+
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            estatisticas = pstats.Stats(self.cprofile)
+            if self.arquivo_cprofile is not None:
+                estatisticas.dump_stats(self.arquivo_cprofile)
+            estatisticas.sort_stats("cumulative").print_stats(
+                NUMERO_FUNCOES_CPROFILE)
+        return
+
+
+def main():
+    # definir rotinas de testes para as funcoes do modulo
+    return
+
+
+if __name__ == "__main__":
+    main()
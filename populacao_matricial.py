@@ -0,0 +1,624 @@
+"""
+Populacao do algoritmo genetico armazenada em arrays (estrutura de
+arrays), com os operadores de cruzamento e mutacao aplicados a todos os
+pais de uma vez.
+
+Na populacao do DEAP (lista de individuos), cada etapa da geracao
+percorre a lista individuo por individuo: filtros dos individuos validos,
+clones, eliminacao dos duplicados, estatisticas e concatenacoes. A
+PopulacaoMatricial guarda:
+    - genes: matriz pre-alocada (individuos X projetos) com as alocacoes;
+    - fitness: vetor com a performance de cada individuo;
+    - desvios: tensor (individuos X contratos X 3) com os desvios das
+      regras de negocio, em R$;
+    - valido: mascara dos individuos com o fitness calculado.
+
+Os operadores recebem as matrizes dos genes dos pais (indexadas por
+arrays de indices) e devolvem as matrizes dos filhos:
+    - cruzamento: um ponto, dois pontos, uniforme e por contrato (cada
+      contrato vem do pai com o menor desvio no contrato, como
+      cruzamento.cruzamento_metodo_1);
+    - mutacao: uniforme, embaralhamento e pelos desvios (desaloca
+      projetos dos contratos com excesso e aloca projetos livres nos
+      contratos com deficit, como mutacao.mutacao_metodo_1).
+A avaliacao calcula os totais por contrato de todos os individuos novos
+com um unico np.bincount, em centavos, como
+f_obj.funcao_objetivo_centavos.
+
+Os individuos do DEAP sao criados somente quando necessario
+(para_individuos / de_individuos), ex.: para gravar os resultados.
+
+"""
+import time
+
+import numpy as np
+from deap import creator
+
+import distribuicao
+import funcao_objetivo as f_obj
+import mutacao
+import cruzamento
+import selecao
+import utilidades as util
+
+# Definicao de constantes e parametros
+# pesos do sorteio do operador de cada geracao. Como em cruzamento.tipo e
+# mutacao.tipo, os operadores customizados tem maior probabilidade
+CRUZAMENTOS = {"um_ponto": 1, "dois_pontos": 1, "uniforme": 1,
+               "por_contrato": 3}
+MUTACOES = {"uniforme": 1, "embaralha": 1, "desvios": 2}
+# tentativas de repor os individuos apagados (duplicados)
+TENTATIVAS_REPOSICAO = 3
+
+
+class PopulacaoMatricial:
+    def __init__(self, capacidade, numero_projetos, numero_contratos):
+        self.genes = np.zeros((capacidade, numero_projetos), dtype=np.int32)
+        self.fitness = np.full(capacidade, np.nan)
+        self.desvios = np.zeros((capacidade, numero_contratos, 3))
+        self.valido = np.zeros(capacidade, dtype=bool)
+        self.tamanho = 0
+
+    def acrescenta(self, genes):
+        # inclui os individuos (sem fitness) ao final da populacao, e
+        # devolve os seus indices
+        numero = len(genes)
+        if self.tamanho + numero > len(self.genes):
+            self.aumenta(max(2 * len(self.genes), self.tamanho + numero))
+        indices = np.arange(self.tamanho, self.tamanho + numero)
+        self.genes[indices] = genes
+        self.fitness[indices] = np.nan
+        self.valido[indices] = False
+        self.tamanho += numero
+        return indices
+
+    def aumenta(self, capacidade):
+        # realoca os arrays com a nova capacidade
+        for nome in ["genes", "fitness", "desvios", "valido"]:
+            atual = getattr(self, nome)
+            novo = np.zeros((capacidade,) + atual.shape[1:], dtype=atual.dtype)
+            novo[0:len(atual)] = atual
+            setattr(self, nome, novo)
+        self.fitness[self.tamanho:] = np.nan
+
+    def mantem(self, indices):
+        # mantem somente os individuos informados, nesta ordem
+        numero = len(indices)
+        for nome in ["genes", "fitness", "desvios", "valido"]:
+            atual = getattr(self, nome)
+            atual[0:numero] = atual[indices]
+        self.tamanho = numero
+
+    def validos(self):
+        # indices dos individuos com o fitness calculado
+        return np.flatnonzero(self.valido[0:self.tamanho])
+
+    def invalidos(self):
+        return np.flatnonzero(~self.valido[0:self.tamanho])
+
+    def elimina_duplicados(self):
+        # elimina os individuos repetidos, mantendo de preferencia os que
+        # ja tem o fitness calculado. Devolve o numero de apagados
+        genes = self.genes[0:self.tamanho]
+        ordem = np.argsort(~self.valido[0:self.tamanho], kind="stable")
+        linhas = np.ascontiguousarray(genes[ordem]).view(
+            np.dtype((np.void, genes.dtype.itemsize * genes.shape[1])))
+        _, primeiros = np.unique(linhas.ravel(), return_index=True)
+        manter = np.sort(ordem[primeiros])
+        apagados = self.tamanho - len(manter)
+        if apagados > 0:
+            self.mantem(manter)
+        return apagados
+
+    def estatisticas(self):
+        # estatisticas da performance dos individuos validos
+        fitness = self.fitness[self.validos()]
+        return {"min": fitness.min(), "media": fitness.mean(),
+                "std": fitness.std(), "max": fitness.max()}
+
+    def indicadores_viabilidade(self, indices):
+        # violacao e performance, como f_obj.indicadores_viabilidade
+        violacao = -np.minimum(self.desvios[indices], 0).sum(axis=(1, 2))
+        return violacao, self.fitness[indices]
+
+    def para_individuos(self, indices=None):
+        # individuos do DEAP com os genes e o fitness dos indices
+        if indices is None:
+            indices = np.arange(self.tamanho)
+        individuos = []
+        for i in indices:
+            ind = creator.Individual(self.genes[i].tolist())
+            if self.valido[i]:
+                desvios = self.desvios[i]
+                ind.fitness.values = f_obj.salva_performance(
+                    desvios * desvios, desvios)
+            individuos.append(ind)
+        return individuos
+
+    @classmethod
+    def de_individuos(cls, individuos, numero_contratos, capacidade=None):
+        # cria a populacao a partir de individuos do DEAP
+        genes = np.array([ind[:] for ind in individuos], dtype=np.int32)
+        pop = cls(max(capacidade or 0, len(individuos)), genes.shape[1],
+                  numero_contratos)
+        indices = pop.acrescenta(genes)
+        for i, ind in zip(indices, individuos):
+            if ind.fitness.valid:
+                fit = np.asarray(ind.fitness.values)
+                metade = len(fit) // 2
+                pop.desvios[i] = (fit[metade:] / f_obj.FATOR_MUITO_PEQUENO
+                                  ).reshape(numero_contratos, 3)
+                pop.fitness[i] = fit[0:metade].sum()
+                pop.valido[i] = True
+        return pop
+
+
+"""
+funcao: avalia(pop, indices, dados)
+
+  Objetivo: Calcula o fitness dos individuos informados, todos de uma vez,
+            com os mesmos desvios de f_obj.funcao_objetivo_centavos.
+
+  Parametros:
+             pop: PopulacaoMatricial;
+             indices: indices dos individuos avaliados;
+             dados: valores em centavos (f_obj.prepara_centavos).
+
+  Retorna:
+"""
+def avalia(pop, indices, dados):
+    if len(indices) == 0:
+        return
+    num_contratos = dados["numero_contratos"]
+    num_classif = len(f_obj.CLASSIFICACOES)
+    limites = dados["limites"]
+    numero = len(indices)
+
+    # totais por individuo, contrato e classificacao, com um unico bincount
+    genes = pop.genes[indices][:, dados["posicoes"]].astype(np.int64)
+    chaves = genes * num_classif + dados["classif"] + \
+        np.arange(numero)[:, None] * (num_contratos + 1) * num_classif
+    totais = np.bincount(chaves.ravel(),
+                         weights=np.broadcast_to(dados["valores"],
+                                                 chaves.shape).ravel(),
+                         minlength=numero * (num_contratos + 1) * num_classif)
+    totais = totais.reshape(numero, num_contratos + 1, num_classif)
+    totais = totais[:, 0:num_contratos].astype(np.int64)
+    externo = totais[:, :, 1]
+    interno = totais[:, :, 2]
+
+    desvios = np.empty((numero, num_contratos, 3), dtype=np.int64)
+    desvios[:, :, 0] = totais.sum(axis=2) - limites[:, 0]
+    desvios[:, :, 1] = externo - limites[:, 1]
+    maximo_interno = limites[:, 2] - interno
+    desvios[:, :, 2] = np.minimum(maximo_interno, 0)
+    desvios = np.where(dados["ativas"], desvios, 0)
+
+    # grava os individuos validos em arquivo, como na funcao objetivo
+    if f_obj.GRAVA_INDIVIDUOS_VALIDOS:
+        validos = (desvios >= 0).all(axis=(1, 2)) & \
+            (desvios[:, :, 0].sum(axis=1) >= 0) & \
+            (externo.sum(axis=1) >= limites[:, 1].sum()) & \
+            (maximo_interno.sum(axis=1) >= 0)
+        for i in indices[validos]:
+            util.grava_individuo(f_obj.NOME_ARQUIVO_INDIVIDUOS_VALIDOS,
+                                 pop.genes[i].tolist())
+
+    desvios = desvios / 100.
+    pop.desvios[indices] = desvios
+    pop.fitness[indices] = (desvios * desvios).sum(axis=(1, 2))
+    pop.valido[indices] = True
+    return
+
+
+def cruzamento_um_ponto(genes_1, genes_2, rng):
+    corte = rng.integers(1, genes_1.shape[1], len(genes_1))
+    mascara = np.arange(genes_1.shape[1]) < corte[:, None]
+    return np.where(mascara, genes_1, genes_2), \
+        np.where(mascara, genes_2, genes_1)
+
+
+def cruzamento_dois_pontos(genes_1, genes_2, rng):
+    cortes = np.sort(rng.integers(1, genes_1.shape[1], (len(genes_1), 2)),
+                     axis=1)
+    posicoes = np.arange(genes_1.shape[1])
+    mascara = (posicoes >= cortes[:, 0:1]) & (posicoes < cortes[:, 1:2])
+    return np.where(mascara, genes_2, genes_1), \
+        np.where(mascara, genes_1, genes_2)
+
+
+def cruzamento_uniforme(genes_1, genes_2, rng):
+    indpb = rng.uniform(cruzamento.PROB_CRUZAMENTO_DEAP[0],
+                        cruzamento.PROB_CRUZAMENTO_DEAP[1])
+    mascara = rng.random(genes_1.shape) < indpb
+    return np.where(mascara, genes_2, genes_1), \
+        np.where(mascara, genes_1, genes_2)
+
+
+def cruzamento_por_contrato(genes_1, genes_2, desvios_1, desvios_2, rng):
+    # cada contrato vem do pai com o menor desvio (soma quadratica) no
+    # contrato. Um projeto alocado em contratos diferentes nos dois pais,
+    # ambos escolhidos, fica no contrato de menor desvio (filho 1, como a
+    # ordem de cruzamento_metodo_1) ou em um deles ao acaso (filho 2)
+    numero, num_contratos = desvios_1.shape[0:2]
+    perf_1 = (desvios_1 * desvios_1).sum(axis=2)
+    perf_2 = (desvios_2 * desvios_2).sum(axis=2)
+    # coluna do contrato em branco, que nao e escolhido
+    em_branco = np.zeros((numero, 1), dtype=bool)
+    melhor_1 = np.hstack([perf_1 < perf_2, em_branco])
+    melhor_2 = np.hstack([perf_1 >= perf_2, em_branco])
+    melhor_perf = np.hstack([np.minimum(perf_1, perf_2),
+                             np.full((numero, 1), np.inf)])
+
+    g1 = genes_1.astype(np.intp)
+    g2 = genes_2.astype(np.intp)
+    de_1 = np.take_along_axis(melhor_1, g1, axis=1)
+    de_2 = np.take_along_axis(melhor_2, g2, axis=1)
+    ambos = de_1 & de_2
+    menor_1 = np.take_along_axis(melhor_perf, g1, axis=1) <= \
+        np.take_along_axis(melhor_perf, g2, axis=1)
+    sorteio_1 = rng.random(genes_1.shape) < 0.5
+
+    filho_1 = np.where(de_2, genes_2, genes_1)
+    filho_1 = np.where(ambos & menor_1, genes_1, filho_1)
+    filho_2 = np.where(de_1, genes_1, genes_2)
+    filho_2 = np.where(ambos & ~sorteio_1, genes_2, filho_2)
+    return filho_1, filho_2
+
+
+def mutacao_uniforme(genes, rng, numero_contratos):
+    # como tools.mutUniformInt, entre 0 e o contrato em branco
+    indpb = rng.uniform(mutacao.PROB_MUTACAO_DEAP[0],
+                        mutacao.PROB_MUTACAO_DEAP[1])
+    mascara = rng.random(genes.shape) < indpb
+    sorteados = rng.integers(0, numero_contratos + 1, genes.shape)
+    return np.where(mascara, sorteados, genes).astype(genes.dtype)
+
+
+def mutacao_embaralha(genes, rng):
+    # como tools.mutShuffleIndexes: os genes sorteados de cada individuo
+    # sao permutados entre si
+    indpb = rng.uniform(mutacao.PROB_MUTACAO_DEAP[0],
+                        mutacao.PROB_MUTACAO_DEAP[1])
+    linhas, colunas = np.nonzero(rng.random(genes.shape) < indpb)
+    ordem = np.lexsort((rng.random(len(linhas)), linhas))
+    mutantes = genes.copy()
+    mutantes[linhas, colunas] = genes[linhas, colunas[ordem]]
+    return mutantes
+
+
+def mutacao_desvios(genes, desvios, rng, numero_contratos):
+    # como mutacao_metodo_1: para uma regra de negocio sorteada por
+    # individuo, desaloca uma parcela dos projetos dos contratos com
+    # excesso, e aloca projetos livres nos contratos com deficit
+    numero = len(genes)
+    linhas = np.arange(numero)
+    regra = rng.integers(0, 3, numero)
+    desvio = desvios[linhas, :, regra]
+    # o "Critério Máximo Interno" negativo indica excesso
+    desvio[regra == 2] = -desvio[regra == 2]
+    taxa = rng.uniform(mutacao.TAXA_IMPACTO_MUTACAO[0],
+                       mutacao.TAXA_IMPACTO_MUTACAO[1], numero)
+
+    em_branco = np.zeros((numero, 1), dtype=bool)
+    excesso = np.hstack([desvio > 0, em_branco])
+    deficit = desvio < 0
+    mutantes = genes.copy()
+
+    # desaloca projetos dos contratos com excesso
+    sorteio = rng.random(genes.shape) < taxa[:, None]
+    desaloca = np.take_along_axis(excesso, genes.astype(np.intp), axis=1) & \
+        sorteio
+    mutantes[desaloca] = numero_contratos
+
+    # aloca projetos livres em um dos contratos com deficit, sorteado
+    numero_deficit = deficit.sum(axis=1)
+    livres = (mutantes == numero_contratos) & \
+        (rng.random(genes.shape) < taxa[:, None]) & \
+        (numero_deficit[:, None] > 0)
+    contratos_deficit = np.argsort(~deficit, axis=1, kind="stable")
+    linhas_livres, colunas_livres = np.nonzero(livres)
+    escolhido = (rng.random(len(linhas_livres)) *
+                 numero_deficit[linhas_livres]).astype(np.intp)
+    mutantes[linhas_livres, colunas_livres] = \
+        contratos_deficit[linhas_livres, escolhido]
+    return mutantes
+
+
+def sorteia_operador(pesos, permitidos, rng):
+    # sorteia o operador da geracao, entre os permitidos
+    nomes = [n for n in pesos if permitidos is None or n in permitidos]
+    probabilidades = np.array([pesos[n] for n in nomes], dtype=np.float64)
+    return nomes[rng.choice(len(nomes), p=probabilidades /
+                            probabilidades.sum())]
+
+
+def cria_filhos(pop, pais_1, pais_2, nome, rng):
+    # aplica o cruzamento aos pares de pais (arrays de indices)
+    genes_1 = pop.genes[pais_1]
+    genes_2 = pop.genes[pais_2]
+    if nome == "um_ponto":
+        filhos = cruzamento_um_ponto(genes_1, genes_2, rng)
+    elif nome == "dois_pontos":
+        filhos = cruzamento_dois_pontos(genes_1, genes_2, rng)
+    elif nome == "uniforme":
+        filhos = cruzamento_uniforme(genes_1, genes_2, rng)
+    else:
+        filhos = cruzamento_por_contrato(genes_1, genes_2,
+                                         pop.desvios[pais_1],
+                                         pop.desvios[pais_2], rng)
+    return np.vstack(filhos)
+
+
+def cria_mutantes(pop, pais, nome, rng, numero_contratos):
+    # aplica a mutacao aos pais (array de indices)
+    genes = pop.genes[pais]
+    if nome == "uniforme":
+        return mutacao_uniforme(genes, rng, numero_contratos)
+    if nome == "embaralha":
+        return mutacao_embaralha(genes, rng)
+    return mutacao_desvios(genes, pop.desvios[pais], rng, numero_contratos)
+
+
+"""
+funcao: executa_geracao_matricial(pop, dados, rng, tamanho_populacao,
+                                  projetos_excluidos, operadores,
+                                  viabilidade)
+
+  Objetivo: Executa uma geracao do algoritmo genetico sobre a
+            PopulacaoMatricial, com as mesmas etapas de
+            distribuicao.executa_geracao: cruzamento, mutacao, eliminacao
+            dos duplicados, reposicao, exclusao dos projetos, avaliacao e
+            selecao.
+
+  Parametros:
+             pop: PopulacaoMatricial;
+             dados: valores em centavos (f_obj.prepara_centavos);
+             rng: gerador de numeros aleatorios (np.random.Generator);
+             tamanho_populacao: tamanho da populacao selecionada;
+             projetos_excluidos: posicoes dos projetos nao alocados;
+             operadores: dicionario {"cruzamento": [...], "mutacao": [...]}
+                         com os nomes permitidos (CRUZAMENTOS, MUTACOES).
+                         None permite todos;
+             viabilidade: seleciona pelas regras de Deb (violacao e
+                          performance). Ver
+                          selecao.usa_selecao_viabilidade.
+
+  Retorna:
+          metricas: dicionario com as metricas da geracao.
+"""
+def executa_geracao_matricial(pop, dados, rng, tamanho_populacao,
+                              projetos_excluidos, operadores=None,
+                              viabilidade=False):
+    inicio = time.perf_counter()
+    num_contratos = dados["numero_contratos"]
+    operadores = operadores or {}
+    nome_cruzamento = sorteia_operador(CRUZAMENTOS,
+                                       operadores.get("cruzamento"), rng)
+    nome_mutacao = sorteia_operador(MUTACOES, operadores.get("mutacao"), rng)
+    prob_mate = rng.uniform(distribuicao.PROBABILIDADE_CROSSOVER[0],
+                            distribuicao.PROBABILIDADE_CROSSOVER[1])
+    prob_mut = rng.uniform(distribuicao.PROBABILIDADE_MUTACAO[0],
+                           distribuicao.PROBABILIDADE_MUTACAO[1])
+    excluidos = np.asarray(projetos_excluidos, dtype=np.intp)
+
+    def inclui(novos):
+        indices = pop.acrescenta(novos)
+        if len(excluidos) > 0:
+            pop.genes[indices[:, None], excluidos] = num_contratos
+        return len(indices)
+
+    # 1 e 2 - cruzamento e mutacao dos individuos validos
+    validos = pop.validos()
+    embaralhados = rng.permutation(validos)
+    numero_pares = len(embaralhados) // 2
+    pares = rng.random(numero_pares) < prob_mate
+    pais_1 = embaralhados[0:numero_pares][pares]
+    pais_2 = embaralhados[numero_pares:2 * numero_pares][pares]
+    if len(pais_1) > 0:
+        inclui(cria_filhos(pop, pais_1, pais_2, nome_cruzamento, rng))
+    mutados = validos[rng.random(len(validos)) < prob_mut]
+    if len(mutados) > 0:
+        inclui(cria_mutantes(pop, mutados, nome_mutacao, rng,
+                             num_contratos))
+
+    # 3 e 4 - elimina os duplicados, e repoe os individuos apagados
+    apagados = pop.elimina_duplicados()
+    duplicados = apagados
+    tentativas = 0
+    while pop.tamanho < tamanho_populacao and len(validos) > 1 and \
+            tentativas < TENTATIVAS_REPOSICAO:
+        faltam = tamanho_populacao - pop.tamanho
+        if rng.random() < (2 / 3) * (prob_mut / prob_mate):
+            pais = rng.choice(validos, faltam)
+            inclui(cria_mutantes(pop, pais, nome_mutacao, rng,
+                                 num_contratos))
+        else:
+            pais = rng.choice(validos, (2, (faltam + 1) // 2))
+            inclui(cria_filhos(pop, pais[0], pais[1], nome_cruzamento, rng))
+        duplicados += pop.elimina_duplicados()
+        tentativas += 1
+
+    # 6 - avalia os novos individuos
+    invalidos = pop.invalidos()
+    avalia(pop, invalidos, dados)
+
+    # 8 - seleciona a populacao da proxima geracao: os melhores, pelas
+    # regras de Deb (violacao e performance) ou somente pela performance
+    indices = np.arange(pop.tamanho)
+    violacao, performance = pop.indicadores_viabilidade(indices)
+    if viabilidade:
+        ranking = np.lexsort((performance, violacao))
+    else:
+        ranking = np.argsort(performance, kind="stable")
+    pop.mantem(ranking[0:tamanho_populacao])
+
+    return {"cruzamento": nome_cruzamento, "mutacao": nome_mutacao,
+            "duplicados": duplicados, "avaliacoes": len(invalidos),
+            "tempo_geracao": time.perf_counter() - inicio}
+
+
+"""
+funcao: executa_otimizacao_matricial(df_id_contratos, df_contratos,
+                                     df_projetos, projetos_excluidos,
+                                     tamanho_populacao, numero_geracoes,
+                                     tempo_maximo, semente, operadores,
+                                     pop_inicial, registro, cancelado,
+                                     notifica_melhoria)
+
+  Objetivo: Executa o algoritmo genetico com a PopulacaoMatricial, com os
+            mesmos parametros e retorno de distribuicao.executa_otimizacao.
+            operadores usa os nomes de CRUZAMENTOS e MUTACOES.
+
+  Retorna:
+          pop: populacao final (individuos do DEAP), ordenada pela
+               selecao;
+          historico: lista de tuples (geracao, tempo, performance do
+                     melhor individuo ate a geracao, comparado como na
+                     selecao).
+"""
+def executa_otimizacao_matricial(df_id_contratos, df_contratos, df_projetos,
+                                 projetos_excluidos,
+                                 tamanho_populacao=distribuicao.TAMANHO_POPULACAO,
+                                 numero_geracoes=distribuicao.NUMERO_GERACOES,
+                                 tempo_maximo=None, semente=None,
+                                 operadores=None, pop_inicial=None,
+                                 registro=None, cancelado=None,
+                                 notifica_melhoria=None):
+    inicio = time.perf_counter()
+    rng = np.random.default_rng(semente)
+    distribuicao.cria_tipos_deap(len(df_id_contratos))
+    dados = f_obj.prepara_centavos(df_id_contratos, df_contratos, df_projetos)
+    num_contratos = dados["numero_contratos"]
+    # capacidade para os pais, os filhos e os mutantes de uma geracao
+    capacidade = 4 * tamanho_populacao
+
+    if pop_inicial is not None:
+        pop = PopulacaoMatricial.de_individuos(
+            pop_inicial[0:tamanho_populacao], num_contratos, capacidade)
+    else:
+        pop = PopulacaoMatricial(capacidade, len(df_projetos), num_contratos)
+        pop.acrescenta(rng.integers(0, num_contratos + 1,
+                                    (tamanho_populacao, len(df_projetos))))
+    if len(projetos_excluidos) > 0:
+        invalidos = pop.invalidos()
+        pop.genes[invalidos[:, None],
+                  np.asarray(projetos_excluidos, dtype=np.intp)] = \
+            num_contratos
+    pop.elimina_duplicados()
+    avalia(pop, pop.invalidos(), dados)
+
+    # o melhor individuo e comparado como na selecao: (violacao,
+    # performance) pelas regras de Deb, ou somente a performance
+    viabilidade = selecao.usa_selecao_viabilidade(df_id_contratos,
+                                                  df_contratos, df_projetos)
+    chave_melhor = (np.inf, np.inf)
+    historico = []
+    g = 0
+    while g < numero_geracoes:
+        if tempo_maximo is not None and \
+                time.perf_counter() - inicio > tempo_maximo:
+            break
+        if cancelado is not None and cancelado.is_set():
+            break
+        g = g + 1
+        metricas_geracao = executa_geracao_matricial(
+            pop, dados, rng, tamanho_populacao, projetos_excluidos,
+            operadores, viabilidade)
+        violacao, performance = pop.indicadores_viabilidade([0])
+        chave = (violacao[0] if viabilidade else 0., performance[0])
+        if chave < chave_melhor:
+            chave_melhor = chave
+            if notifica_melhoria is not None:
+                notifica_melhoria(g, pop.para_individuos([0])[0])
+        melhor = chave_melhor[1]
+        historico.append((g, time.perf_counter() - inicio, melhor))
+        if registro is not None:
+            metricas_geracao.update(pop.estatisticas())
+            metricas_geracao.update(
+                ger=g, tempo=time.perf_counter() - inicio, melhor=melhor,
+                valido=bool((pop.desvios[0:pop.tamanho] >= 0)
+                            .all(axis=(1, 2)).any()))
+            registro.append(metricas_geracao)
+
+    return pop.para_individuos(), historico
+
+
+def main():
+    # definir rotinas de testes para as funcoes do modulo
+    import presolve
+
+    # ### TESTE ### avalia x funcao objetivo, e formato dos operadores
+    df_projetos, _, _, df_contratos, df_id_contratos, _ = \
+        presolve.le_dados_otimizacao(
+            distribuicao.PLANILHA_DADOS_ENTRADA,
+            distribuicao.NOME_ABA_ENTRADA_VALORES_A_DISTRIBUIR,
+            distribuicao.NOME_ABA_ENTRADA_CONTRATOS)
+    f_obj.GRAVA_INDIVIDUOS_VALIDOS = False
+    rng = np.random.default_rng(0)
+    dados = f_obj.prepara_centavos(df_id_contratos, df_contratos,
+                                   df_projetos)
+    num_contratos = dados["numero_contratos"]
+    numero = 8
+
+    # todos os contratos com algum projeto, para comparar tambem com o
+    # calculo com dataframes (sem performance NaN)
+    genes = rng.integers(0, num_contratos + 1, (numero, len(df_projetos)))
+    genes[:, 0:num_contratos] = np.arange(num_contratos)
+    pop = PopulacaoMatricial(numero, len(df_projetos), num_contratos)
+    avalia(pop, pop.acrescenta(genes), dados)
+
+    avaliacao_centavos = f_obj.AVALIACAO_CENTAVOS
+    for i in range(numero):
+        for centavos in (True, False):
+            f_obj.AVALIACAO_CENTAVOS = centavos
+            fit = np.asarray(f_obj.funcao_objetivo(
+                pop.genes[i].tolist(), df_id_contratos, df_contratos,
+                df_projetos))
+            metade = len(fit) // 2
+            desvios = (fit[metade:] / f_obj.FATOR_MUITO_PEQUENO
+                       ).reshape(num_contratos, 3)
+            if centavos:
+                # mesmos desvios em centavos inteiros
+                assert np.array_equal(np.round(desvios * 100),
+                                      np.round(pop.desvios[i] * 100))
+                assert np.isclose(fit[0:metade].sum(), pop.fitness[i])
+            else:
+                assert np.abs(desvios - pop.desvios[i]).max() <= \
+                    f_obj.TOLERANCIA_CENTAVOS
+    f_obj.AVALIACAO_CENTAVOS = avaliacao_centavos
+
+    # cruzamento por contrato: filhos com o formato dos pais, e cada gene
+    # vem de um dos pais
+    pais_1 = np.arange(0, numero, 2)
+    pais_2 = np.arange(1, numero, 2)
+    filhos = cruzamento_por_contrato(pop.genes[pais_1], pop.genes[pais_2],
+                                     pop.desvios[pais_1],
+                                     pop.desvios[pais_2], rng)
+    for filho in filhos:
+        assert filho.shape == pop.genes[pais_1].shape
+        assert filho.dtype == pop.genes.dtype
+        assert ((filho == pop.genes[pais_1]) |
+                (filho == pop.genes[pais_2])).all()
+
+    # mutacao pelos desvios: mesmo formato, e os genes alterados vao para
+    # o contrato em branco ou para um contrato com deficit
+    indices = np.arange(numero)
+    mutantes = mutacao_desvios(pop.genes[indices], pop.desvios[indices],
+                               rng, num_contratos)
+    assert mutantes.shape == pop.genes[indices].shape
+    assert mutantes.dtype == pop.genes.dtype
+    assert ((mutantes >= 0) & (mutantes <= num_contratos)).all()
+    assert (mutantes != pop.genes[indices]).any()
+    deficit = (pop.desvios[indices] < 0).any(axis=2)
+    linhas, colunas = np.nonzero((mutantes != pop.genes[indices]) &
+                                 (mutantes != num_contratos))
+    assert deficit[linhas, mutantes[linhas, colunas]].all()
+    print("avalia, cruzamento_por_contrato e mutacao_desvios: ok")
+    # ### TESTE ###
+
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Portfolio de execucoes do algoritmo genetico: executa K otimizacoes
+independentes em paralelo, com sementes e combinacoes de operadores
+diferentes, cada uma limitada por um tempo maximo.
+
+Os individuos finais de todas as execucoes sao consolidados em um unico
+conjunto de melhores individuos, sem duplicados, e somente o melhor
+resultado geral e gravado na planilha de saida (grava_planilha_saida).
+
+Ao final e impresso um resumo da convergencia de cada execucao, para
+ajustar a composicao do portfolio.
+
+"""
+import os
+import math
+import concurrent.futures
+
+from deap import tools
+
+import distribuicao
+import presolve
+import selecao
+import conversao_individuos as conv
+import funcao_objetivo as f_obj
+import utilidades as util
+
+# Definicao de constantes e parametros
+NUMERO_PROCESSOS = os.cpu_count()
+TEMPO_MAXIMO_EXECUCAO = 600  # segundos por execucao
+NUMERO_MELHORES_INDIVIDUOS_GUARDADO = 500
+
+# combinacoes de operadores testadas no portfolio padrao
+# (opcoes de cruzamento.tipo e mutacao.tipo). None permite todas.
+COMBINACOES_OPERADORES = [
+    None,
+    {"cruzamento": [7], "mutacao": [4, 6]},  # somente customizados
+    {"cruzamento": [1, 2, 5], "mutacao": [1, 2, 3]},  # somente DEAP
+]
+
+
+"""
+funcao: cria_portfolio(numero_execucoes, semente_inicial)
+
+  Objetivo: Monta a configuracao padrao do portfolio, alternando as
+            combinacoes de operadores de COMBINACOES_OPERADORES, com uma
+            semente diferente para cada execucao.
+
+  Retorna:
+          lista de dicionarios {"semente", "operadores"}
+"""
+def cria_portfolio(numero_execucoes, semente_inicial=0):
+    return [{"semente": semente_inicial + i,
+             "operadores": COMBINACOES_OPERADORES[
+                 i % len(COMBINACOES_OPERADORES)]}
+            for i in range(numero_execucoes)]
+
+
+def executa_configuracao(configuracao, tamanho_populacao, numero_geracoes,
+                         tempo_maximo):
+    # executa uma otimizacao do portfolio, e devolve a populacao final
+    # compactada (genes e fitness) e o historico de convergencia
+    df_id_contratos, df_contratos, df_projetos, projetos_excluidos = \
+        f_obj.dados_processo()
+    pop, historico = distribuicao.executa_otimizacao(
+        df_id_contratos, df_contratos, df_projetos, projetos_excluidos,
+        tamanho_populacao=tamanho_populacao, numero_geracoes=numero_geracoes,
+        tempo_maximo=tempo_maximo, semente=configuracao["semente"],
+        operadores=configuracao["operadores"])
+    genes, fitness = conv.compacta_individuos(pop)
+    return genes, fitness, historico
+
+
+"""
+funcao: executa_portfolio(df_id_contratos, df_contratos, df_projetos,
+                          projetos_excluidos, configuracoes,
+                          tamanho_populacao, numero_geracoes, tempo_maximo,
+                          numero_processos)
+
+  Objetivo: Executa as otimizacoes do portfolio em paralelo, e consolida os
+            individuos finais de todas elas.
+
+  Parametros:
+             dados lidos da planilha de entrada (le_planilha_entrada);
+             configuracoes: lista de dicionarios {"semente", "operadores"}
+                            (ver cria_portfolio);
+             tamanho_populacao, numero_geracoes: parametros de cada
+                                                 execucao;
+             tempo_maximo: tempo maximo em segundos de cada execucao;
+             numero_processos: numero de execucoes simultaneas.
+
+  Retorna:
+          melhores: lista dos melhores individuos de todas as execucoes,
+                    sem duplicados, ordenada como na selecao;
+          resumo: lista de dicionarios com a convergencia de cada execucao.
+"""
+def executa_portfolio(df_id_contratos, df_contratos, df_projetos,
+                      projetos_excluidos, configuracoes,
+                      tamanho_populacao=distribuicao.TAMANHO_POPULACAO,
+                      numero_geracoes=distribuicao.NUMERO_GERACOES,
+                      tempo_maximo=TEMPO_MAXIMO_EXECUCAO,
+                      numero_processos=NUMERO_PROCESSOS):
+    distribuicao.cria_tipos_deap(len(df_id_contratos))
+
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=numero_processos,
+            initializer=f_obj.inicializa_processo,
+            initargs=(df_id_contratos, df_contratos, df_projetos,
+                      projetos_excluidos)) as executor:
+        futuros = [executor.submit(executa_configuracao, configuracao,
+                                   tamanho_populacao, numero_geracoes,
+                                   tempo_maximo)
+                   for configuracao in configuracoes]
+
+        melhores = []
+        genes_existentes = set()
+        resumo = []
+        for configuracao, futuro in zip(configuracoes, futuros):
+            genes, fitness, historico = futuro.result()
+            individuos = [ind for ind in conv.monta_individuos(genes, fitness)
+                          if not math.isnan(f_obj.performance(ind))]
+
+            # consolida os individuos, descartando os duplicados
+            for ind in individuos:
+                chave = tuple(ind)
+                if chave not in genes_existentes:
+                    genes_existentes.add(chave)
+                    melhores.append(ind)
+
+            resumo.append(resume_execucao(configuracao, individuos,
+                                          historico))
+
+    # ordena como na selecao (pelas regras de Deb nas instancias viaveis)
+    viabilidade = selecao.usa_selecao_viabilidade(df_id_contratos,
+                                                  df_contratos, df_projetos)
+    melhores = selecao.ordena_melhores(melhores, viabilidade)
+    melhores = melhores[0:NUMERO_MELHORES_INDIVIDUOS_GUARDADO]
+
+    return melhores, resumo
+
+
+def resume_execucao(configuracao, individuos, historico):
+    # resumo da convergencia de uma execucao do portfolio
+    melhor = historico[-1][2] if len(historico) > 0 else math.nan
+    # primeira geracao em que o melhor resultado final foi atingido. O
+    # historico nao e monotono pelas regras de Deb, mas so muda quando o
+    # melhor individuo muda
+    geracao_melhor, tempo_melhor = 0, 0.
+    for g, tempo, performance in reversed(historico):
+        if performance != melhor:
+            break
+        geracao_melhor, tempo_melhor = g, tempo
+
+    return {"semente": configuracao["semente"],
+            "operadores": configuracao["operadores"],
+            "geracoes": len(historico),
+            "tempo": historico[-1][1] if len(historico) > 0 else 0.,
+            "melhor": melhor,
+            "geracao_melhor": geracao_melhor,
+            "tempo_melhor": tempo_melhor,
+            "validos": sum(f_obj.individuo_valido(ind) for ind in individuos),
+            "historico": historico}
+
+
+def imprime_resumo(resumo):
+    # imprime na tela a tabela de convergencia das execucoes
+    print("%-8s %-45s %8s %8s %28s %8s %8s" %
+          ("Semente", "Operadores", "Gerações", "Tempo", "Melhor",
+           "Ger.Melh", "Válidos"))
+    for r in sorted(resumo, key=lambda r: r["melhor"]):
+        print("%-8i %-45s %8i %7.0fs %28s %8i %8i" %
+              (r["semente"], str(r["operadores"])[0:45], r["geracoes"],
+               r["tempo"], '{:,.0f}'.format(r["melhor"]),
+               r["geracao_melhor"], r["validos"]))
+    return
+
+
+def main():
+    # executa o portfolio padrao com a planilha de entrada do programa
+    df_projetos, df_detalhes_projetos, projetos_excluidos, df_contratos, \
+        df_id_contratos, _ = presolve.le_dados_otimizacao(
+            distribuicao.PLANILHA_DADOS_ENTRADA,
+            distribuicao.NOME_ABA_ENTRADA_VALORES_A_DISTRIBUIR,
+            distribuicao.NOME_ABA_ENTRADA_CONTRATOS,
+            compilada=distribuicao.USA_INSTANCIA_COMPILADA)
+
+    configuracoes = cria_portfolio(max(NUMERO_PROCESSOS,
+                                       len(COMBINACOES_OPERADORES)))
+    melhores, resumo = executa_portfolio(df_id_contratos, df_contratos,
+                                         df_projetos, projetos_excluidos,
+                                         configuracoes)
+    imprime_resumo(resumo)
+    if len(melhores) == 0:
+        return
+
+    # grava somente o melhor resultado geral
+    melhor_individuo_geral = melhores[0]
+    print("Melhor resultado geral =  ",
+          '{:,.0f}'.format(f_obj.performance(melhor_individuo_geral)))
+    util.grava_planilha_saida(melhor_individuo_geral,
+                              distribuicao.PLANILHA_DADOS_SAIDA,
+                              df_id_contratos, df_contratos,
+                              df_detalhes_projetos)
+
+    # grava os melhores individuos como populacao, para continuar a
+    # otimizacao posteriormente
+    hof_populacao = tools.HallOfFame(len(melhores))
+    for ind in melhores:
+        hof_populacao.insert(ind)
+    util.grava_populacao(distribuicao.NOME_ARQUIVO_POPULACAO_FINAL,
+                         hof_populacao)
+    return
+
+
+if __name__ == "__main__":
+    main()
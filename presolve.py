@@ -0,0 +1,217 @@
+"""
+Pre-processamento (presolve) da instancia lida da planilha de entrada,
+executado antes do algoritmo genetico.
+
+    - viabilidade agregada: compara a capacidade dos projetos com as
+      exigencias somadas dos contratos (obrigacao total, minimo externo e
+      parcela da obrigacao que nao pode ser coberta por projetos
+      "INTERNO"). Uma exigencia maior que a capacidade torna impossivel
+      atender a todas as regras de negocio, com qualquer alocacao;
+    - alocacoes fixas: projetos sem valor pago (0 ou vazio) ou sem
+      classificacao conhecida nao alteram nenhum desvio, e ficam sempre
+      nao alocados. Projetos com valor negativo alteram os totais, e
+      continuam na otimizacao;
+    - contratos sem nenhuma regra de negocio ativa (como em
+      funcao_restricao: obrigacao, minimo externo e maximo interno iguais
+      a 0) nao alteram a performance, e sao retirados da otimizacao;
+    - projetos intercambiaveis: mesma classificacao e mesmo valor em
+      centavos. Trocar dois projetos do mesmo grupo nao altera a
+      performance. Os grupos sao somente informados (imprime_presolve),
+      e nao reduzem o problema otimizado.
+
+"""
+import numpy as np
+
+import utilidades as util
+import instancia
+
+# Definicao de constantes e parametros
+COLUNA_VALOR = "Valor Pago(R$)"
+COLUNA_CLASSIFICACAO = "Classif"
+CLASSIFICACOES = ["EMPRESA", "EXTERNO", "INTERNO"]
+
+
+"""
+funcao: executa_presolve(df_projetos, df_contratos, df_id_contratos)
+
+  Objetivo: Analisa a instancia e monta o problema reduzido.
+
+  Parametros:
+             df_projetos, df_contratos, df_id_contratos: dados lidos da
+             planilha de entrada (le_planilha_entrada).
+
+  Retorna:
+          dicionario com:
+              "viavel": False se alguma exigencia agregada nao pode ser
+                        atendida;
+              "motivos": descricao de cada exigencia nao atendida;
+              "exigencias": (nome, exigido, disponivel) de cada verificacao;
+              "projetos_fixos": posicoes dos projetos sempre nao alocados;
+              "contratos_retirados": nomes dos contratos sem regra ativa;
+              "df_contratos", "df_id_contratos": contratos da otimizacao,
+                  sem os contratos retirados e com os indices renumerados;
+              "grupos": grupo de projetos intercambiaveis de cada projeto;
+              "numero_grupos": numero de grupos dos projetos livres.
+                               Somente informativos.
+"""
+def executa_presolve(df_projetos, df_contratos, df_id_contratos):
+    valores = np.round(np.nan_to_num(
+        df_projetos[COLUNA_VALOR].to_numpy(dtype=np.float64)) * 100)
+    classif = np.full(len(df_projetos), -1, dtype=np.int64)
+    for codigo, nome in enumerate(CLASSIFICACOES):
+        classif[(df_projetos[COLUNA_CLASSIFICACAO] == nome).to_numpy()] = \
+            codigo
+
+    # projetos que nao alteram nenhum desvio: sempre nao alocados. Os
+    # valores vazios (NaN) ja foram convertidos para 0
+    fixos = (valores == 0) | (classif < 0)
+    livres = ~fixos
+
+    # capacidade dos projetos por classificacao, em centavos
+    capacidade = {nome: valores[livres & (classif == codigo)].sum()
+                  for codigo, nome in enumerate(CLASSIFICACOES)}
+    valor_total = sum(capacidade.values())
+
+    # contratos reais (sem o contrato em branco) e regras ativas,
+    # como em funcao_restricao
+    num_contratos = len(df_id_contratos) - 1
+    contratos = df_contratos.sort_values("ID_Contrato")[0:num_contratos]
+    obrigacao = np.round(contratos["Obrigação - PETROBRAS"].to_numpy(
+        dtype=np.float64) * 100)
+    minimo_externo = np.round(contratos["Mínimo Externo"].to_numpy(
+        dtype=np.float64) * 100)
+    maximo_interno = np.round(contratos["Máximo Interno"].to_numpy(
+        dtype=np.float64) * 100)
+    r1_ativo = obrigacao > 0
+    r2_ativo = minimo_externo > 0
+    r3_ativo = maximo_interno > 0
+
+    # parcela de cada contrato que so pode ser coberta por projetos
+    # "EXTERNO" ou "EMPRESA": o minimo externo, ou a obrigacao alem do
+    # maximo interno
+    nao_interno = np.where(r2_ativo, minimo_externo, 0)
+    r13_ativo = r1_ativo & r3_ativo
+    nao_interno[r13_ativo] = np.maximum(
+        nao_interno[r13_ativo], (obrigacao - maximo_interno)[r13_ativo])
+
+    exigencias = [
+        ("Obrigação - PETROBRAS", obrigacao[r1_ativo].sum(), valor_total),
+        ("Mínimo Externo", minimo_externo[r2_ativo].sum(),
+         capacidade["EXTERNO"]),
+        ("Obrigação não coberta pelo Máximo Interno", nao_interno.sum(),
+         capacidade["EXTERNO"] + capacidade["EMPRESA"])]
+    exigencias = [(nome, exigido / 100., disponivel / 100.)
+                  for nome, exigido, disponivel in exigencias]
+    motivos = ["%s: exigido R$ %s, disponível R$ %s" %
+               (nome, '{:,.2f}'.format(exigido),
+                '{:,.2f}'.format(disponivel))
+               for nome, exigido, disponivel in exigencias
+               if exigido > disponivel]
+
+    # retira os contratos sem nenhuma regra ativa, e renumera os indices.
+    # O contrato em branco continua como o ultimo indice
+    ativo = r1_ativo | r2_ativo | r3_ativo
+    retirados = contratos["Campo"][~ativo].tolist()
+    contratos_mantidos = df_contratos.sort_values("ID_Contrato")
+    contratos_mantidos = contratos_mantidos[np.append(ativo, True)].copy()
+    contratos_mantidos["ID_Contrato"] = range(len(contratos_mantidos))
+    contratos_mantidos = contratos_mantidos.reset_index(drop=True)
+    id_contratos = contratos_mantidos[["ID_Contrato", "Campo"]].copy()
+
+    # grupos de projetos intercambiaveis: mesma classificacao e valor
+    chaves = np.stack([classif, valores.astype(np.int64)], axis=1)
+    _, grupos = np.unique(chaves, axis=0, return_inverse=True)
+    grupos = grupos.reshape(-1)
+    grupos[fixos] = -1
+    numero_grupos = len(np.unique(grupos[livres]))
+
+    return {"viavel": len(motivos) == 0,
+            "motivos": motivos,
+            "exigencias": exigencias,
+            "projetos_fixos": np.flatnonzero(fixos).tolist(),
+            "contratos_retirados": retirados,
+            "df_contratos": contratos_mantidos,
+            "df_id_contratos": id_contratos,
+            "grupos": grupos,
+            "numero_grupos": numero_grupos}
+
+
+"""
+funcao: le_dados_otimizacao(planilha, aba_projetos, aba_contratos,
+                            compilada=True)
+
+  Objetivo: Le os dados de entrada e aplica o presolve. Usada por todos os
+            pontos de entrada da otimizacao (distribuicao, servidores de
+            avaliacao, servico, portfolio, cenarios, benchmark), para que
+            os indices dos contratos nos individuos e nos checkpoints
+            sejam sempre os da instancia reduzida.
+
+  Parametros:
+             planilha, aba_projetos, aba_contratos: planilha de entrada;
+             compilada: le a instancia compilada da planilha (ver
+                        instancia.py). False le a planilha com o pandas
+                        (utilidades.le_planilha_entrada).
+
+  Retorna:
+          df_projetos, df_detalhes_projetos, projetos_excluidos,
+          df_contratos, df_id_contratos: como em le_planilha_entrada, com
+              os contratos sem regra ativa retirados e os projetos fixos
+              incluidos nos projetos excluidos;
+          resultado: retornado por executa_presolve.
+"""
+def le_dados_otimizacao(planilha, aba_projetos, aba_contratos,
+                        compilada=True):
+    if compilada:
+        le_entrada = instancia.le_planilha_entrada_compilada
+    else:
+        le_entrada = util.le_planilha_entrada
+    df_projetos, df_detalhes_projetos, projetos_excluidos, df_contratos, \
+        df_id_contratos = le_entrada(planilha, aba_projetos, aba_contratos)
+
+    resultado = executa_presolve(df_projetos, df_contratos, df_id_contratos)
+    projetos_excluidos = sorted(set(projetos_excluidos) |
+                                set(resultado["projetos_fixos"]))
+    return df_projetos, df_detalhes_projetos, projetos_excluidos, \
+        resultado["df_contratos"], resultado["df_id_contratos"], resultado
+
+
+"""
+funcao: imprime_presolve(resultado, numero_projetos)
+
+  Objetivo: Imprime o tamanho do problema reduzido e as exigencias
+            agregadas da instancia.
+
+  Parametros:
+             resultado: retornado por executa_presolve;
+             numero_projetos: numero de projetos da instancia.
+
+  Retorna:
+"""
+def imprime_presolve(resultado, numero_projetos):
+    numero_fixos = len(resultado["projetos_fixos"])
+    print("Presolve: %i projetos (%i livres, %i fixos como não alocados, "
+          "%i grupos intercambiáveis), %i contratos" %
+          (numero_projetos, numero_projetos - numero_fixos, numero_fixos,
+           resultado["numero_grupos"],
+           len(resultado["df_id_contratos"]) - 1))
+    if len(resultado["contratos_retirados"]) > 0:
+        print("Contratos sem regra de negócio ativa, retirados: " +
+              ", ".join(resultado["contratos_retirados"]))
+    for nome, exigido, disponivel in resultado["exigencias"]:
+        print("   %-42s exigido %20s  disponível %20s" %
+              (nome, '{:,.2f}'.format(exigido),
+               '{:,.2f}'.format(disponivel)))
+    if not resultado["viavel"]:
+        print("Nenhuma alocação atende a todas as regras de negócio:")
+        for motivo in resultado["motivos"]:
+            print("   " + motivo)
+    return
+
+
+def main():
+    # definir rotinas de testes para as funcoes do modulo
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -11,11 +11,26 @@ forma eficiente, buscando minimizar o valor excedente desembolsado.
 
 """
 import random
+import numpy as np
 from deap import tools
 
+import funcao_objetivo as f_obj
+import presolve
+
 # Definicao de constantes e parametros
 TOURNSIZE_POP_PERCENT = 0.15
 
+# seleciona pela viabilidade primeiro (regras de Deb, ver
+# selecao_viabilidade). False usa selectthebest, somente pela performance.
+# Mesmo com True, as instancias inviaveis (presolve) sao selecionadas pela
+# performance: nenhum individuo e valido, e a selecao pela viabilidade
+# trocaria a performance pela menor violacao
+SELECAO_VIABILIDADE = True
+
+# decisao da selecao pela viabilidade, calculada uma vez para os
+# dataframes em uso (usa_selecao_viabilidade)
+_viabilidade = {}
+
 """
 funcao: tipo(toolbox, numero_contratos, indice_contratos, contratos, projetos)
 
@@ -26,6 +41,8 @@ funcao: tipo(toolbox, numero_contratos, indice_contratos, contratos, projetos)
                        tools.selStochasticUniversalSampling, 
                        tools.selRoulette
             - selecao_metodo_1 : algoritmo customizado definido neste modulo.           
+            - selecao_viabilidade: regras de Deb, quando
+                                   SELECAO_VIABILIDADE = True.
 
   Parametros:
              toolbox: objeto toolbox do DEAP
@@ -40,6 +57,8 @@ def tipo(toolbox, numero_contratos, indice_contratos, contratos, projetos):
     opcoes = 1  ### ATENCAO ### , Nao chama as opcoes 2, 3, 4, 5, 6, 7
     i = random.randint(1, opcoes)
     i = 1  # ### ATENCAO ###
+    if usa_selecao_viabilidade(indice_contratos, contratos, projetos):
+        i = 8
     if i == 1:
         toolbox.register("select", selectthebest,
                          numero_contratos=numero_contratos,
@@ -69,6 +88,12 @@ def tipo(toolbox, numero_contratos, indice_contratos, contratos, projetos):
                          indice_contratos=indice_contratos,
                          contratos=contratos,
                          projetos=projetos)
+    elif i == 8:
+        toolbox.register("select", selecao_viabilidade,
+                         numero_contratos=numero_contratos,
+                         indice_contratos=indice_contratos,
+                         contratos=contratos,
+                         projetos=projetos)
 
     return toolbox
 
@@ -110,6 +135,87 @@ def selecttournament(individuos, k, numero_contratos, indice_contratos,
 
 
 
+"""
+funcao: selecao_viabilidade(individuos, k, numero_contratos,
+                            indice_contratos, contratos, projetos)
+
+  Objetivo: Seleciona os k melhores individuos pelas regras de Deb:
+            os individuos validos vem antes dos invalidos; os validos sao
+            ordenados pela performance, e os invalidos pela violacao das
+            regras de negocio (f_obj.indicadores_viabilidade), calculada
+            para toda a populacao de uma vez.
+            Como em selectthebest, individuos com a mesma violacao e
+            performance sao selecionados uma unica vez.
+
+  Retorna:
+          lista com ate k individuos, ordenada do melhor para o pior.
+"""
+def selecao_viabilidade(individuos, k, numero_contratos, indice_contratos,
+                        contratos, projetos):
+    violacao, excesso, performance = \
+        f_obj.indicadores_viabilidade(individuos)
+
+    # ordena pela violacao e, em caso de empate (ex.: validos), pela
+    # performance
+    ranking = np.lexsort((performance, violacao))
+    violacao = violacao[ranking]
+    performance = performance[ranking]
+    repetido = np.zeros(len(ranking), dtype=bool)
+    repetido[1:] = (violacao[1:] == violacao[:-1]) & \
+        (performance[1:] == performance[:-1])
+    ranking = ranking[~repetido][0:k]
+
+    return [individuos[i] for i in ranking]
+
+
+"""
+funcao: usa_selecao_viabilidade(indice_contratos, contratos, projetos)
+
+  Objetivo: Decide, para cada instancia, se a selecao e feita pelas
+            regras de Deb: somente com SELECAO_VIABILIDADE = True e quando
+            o presolve nao identifica a instancia como inviavel.
+
+  Retorna:
+          True para selecionar pela viabilidade, False pela performance.
+"""
+def usa_selecao_viabilidade(indice_contratos, contratos, projetos):
+    if not SELECAO_VIABILIDADE:
+        return False
+    if _viabilidade.get("contratos") is not contratos or \
+            _viabilidade.get("projetos") is not projetos:
+        _viabilidade.clear()
+        viavel = presolve.executa_presolve(projetos, contratos,
+                                           indice_contratos)["viavel"]
+        _viabilidade.update(contratos=contratos, projetos=projetos,
+                            viavel=viavel)
+    return _viabilidade["viavel"]
+
+
+def chave_selecao(individuo, viabilidade):
+    # chave de ordenacao do individuo, como na selecao: (violacao,
+    # performance) pelas regras de Deb, ou somente a performance
+    violacao, excesso, performance = \
+        f_obj.indicadores_viabilidade([individuo])
+    return (violacao[0] if viabilidade else 0., performance[0])
+
+
+def supera_melhor(individuo, melhor, viabilidade):
+    # compara dois individuos como na selecao
+    return chave_selecao(individuo, viabilidade) < \
+        chave_selecao(melhor, viabilidade)
+
+
+def ordena_melhores(individuos, viabilidade):
+    # ordena os individuos do melhor para o pior, como na selecao
+    return sorted(individuos,
+                  key=lambda ind: chave_selecao(ind, viabilidade))
+
+
+def melhor_individuo(individuos, viabilidade):
+    # melhor individuo, comparado como na selecao
+    return min(individuos, key=lambda ind: chave_selecao(ind, viabilidade))
+
+
 def selecao_metodo_1(individuos, k, numero_contratos, indice_contratos,
                      contratos, projetos):
     a = 1
@@ -0,0 +1,425 @@
+"""
+Servico local de otimizacao, que mantem as instancias carregadas em
+memoria entre as execucoes.
+
+Cada simulacao ("e se") executada com distribuicao.py le novamente a
+planilha, importa o pandas e o DEAP e inicia a populacao do zero. O
+servico executa um servidor HTTP local (somente 127.0.0.1) que guarda,
+para cada instancia carregada, os dados da planilha de entrada e a
+populacao final do ultimo trabalho executado. Um novo trabalho, por
+exemplo com as obrigacoes de alguns contratos alteradas, inicia a partir
+desta populacao.
+
+Os trabalhos sao executados um de cada vez, na ordem em que foram
+recebidos, por uma thread separada. Um trabalho na fila ou em execucao
+pode ser cancelado; em execucao, e interrompido ao final da geracao atual
+e devolve o melhor resultado ate o momento.
+
+Requisicoes (JSON):
+    GET    /instancias           instancias carregadas;
+    POST   /instancias           {"nome", "planilha", "aba_projetos",
+                                  "aba_contratos"}: carrega uma instancia;
+    POST   /trabalhos            {"instancia", "alteracoes",
+                                  "numero_geracoes", "tempo_maximo",
+                                  "motor"}: inclui um trabalho na fila;
+    GET    /trabalhos            situacao de todos os trabalhos;
+    GET    /trabalhos/<id>       situacao e resultado de um trabalho;
+    DELETE /trabalhos/<id>       cancela um trabalho.
+
+"alteracoes" e um dicionario {Campo: {coluna: valor}}, com as colunas
+"Obrigação - PETROBRAS", "Mínimo Externo", "Mínimo Empresa" e
+"Máximo Interno" dos contratos. As alteracoes valem somente para o
+trabalho. ClienteServico faz as requisicoes a partir de outro programa.
+
+"""
+import json
+import time
+import queue
+import threading
+import traceback
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+import distribuicao
+import funcao_objetivo as f_obj
+import presolve
+import selecao
+import conversao_individuos as conv
+import tabu
+
+# Definicao de constantes e parametros
+ENDERECO_SERVICO = "127.0.0.1"  # somente acesso local
+PORTA_SERVICO = 8766
+NUMERO_GERACOES_TRABALHO = 100
+COLUNAS_ALTERAVEIS = ["Obrigação - PETROBRAS", "Mínimo Externo",
+                      "Mínimo Empresa", "Máximo Interno"]
+MOTORES = ["genetico", "tabu", "genetico_tabu"]
+
+
+class ServicoOtimizacao:
+    def __init__(self, porta=PORTA_SERVICO, endereco=ENDERECO_SERVICO,
+                 tamanho_populacao=distribuicao.TAMANHO_POPULACAO):
+        self.tamanho_populacao = tamanho_populacao
+        self.instancias = {}  # nome: dados da instancia e ultima populacao
+        self.trabalhos = {}  # id: situacao e resultado do trabalho
+        self.fila = queue.Queue()
+        self.trava = threading.Lock()
+        self.proximo_id = 1
+
+        # os processos do servico nao gravam os individuos validos
+        f_obj.GRAVA_INDIVIDUOS_VALIDOS = False
+
+        servico = self
+
+        class Requisicao(BaseHTTPRequestHandler):
+            def do_GET(self):
+                partes = self.path.strip("/").split("/")
+                if partes == ["instancias"]:
+                    self.responde(200, servico.lista_instancias())
+                elif partes == ["trabalhos"]:
+                    self.responde(200, servico.lista_trabalhos())
+                elif len(partes) == 2 and partes[0] == "trabalhos":
+                    self.responde(*servico.consulta(partes[1]))
+                else:
+                    self.responde(404, {"erro": "endereço desconhecido"})
+
+            def do_POST(self):
+                try:
+                    tamanho = int(self.headers.get("Content-Length", 0))
+                    pedido = json.loads(self.rfile.read(tamanho) or b"{}")
+                except ValueError as erro:
+                    self.responde(400, {"erro": str(erro)})
+                    return
+                if not isinstance(pedido, dict):
+                    self.responde(400, {"erro": "esperado um objeto JSON"})
+                    return
+                if self.path.strip("/") == "instancias":
+                    self.responde(*servico.carrega_instancia(pedido))
+                elif self.path.strip("/") == "trabalhos":
+                    self.responde(*servico.submete(pedido))
+                else:
+                    self.responde(404, {"erro": "endereço desconhecido"})
+
+            def do_DELETE(self):
+                partes = self.path.strip("/").split("/")
+                if len(partes) == 2 and partes[0] == "trabalhos":
+                    self.responde(*servico.cancela(partes[1]))
+                else:
+                    self.responde(404, {"erro": "endereço desconhecido"})
+
+            def responde(self, codigo, corpo):
+                dados = json.dumps(corpo, default=float,
+                                   ensure_ascii=False).encode("utf-8")
+                self.send_response(codigo)
+                self.send_header("Content-Type",
+                                 "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(dados)))
+                self.end_headers()
+                self.wfile.write(dados)
+
+            def log_message(self, formato, *args):
+                # nao imprime as requisicoes na tela
+                return
+
+        self.servidor = ThreadingHTTPServer((endereco, porta), Requisicao)
+        self.servidor.daemon_threads = True
+        self.executor = threading.Thread(target=self.executa_trabalhos,
+                                         daemon=True)
+        self.executor.start()
+
+    def carrega_instancia(self, pedido):
+        # le a planilha (ou a instancia compilada) e guarda em memoria
+        try:
+            nome = pedido.get("nome", pedido["planilha"])
+            df_projetos, df_detalhes_projetos, projetos_excluidos, \
+                df_contratos, df_id_contratos, _ = \
+                presolve.le_dados_otimizacao(
+                    pedido["planilha"],
+                    pedido.get("aba_projetos",
+                               distribuicao.NOME_ABA_ENTRADA_VALORES_A_DISTRIBUIR),
+                    pedido.get("aba_contratos",
+                               distribuicao.NOME_ABA_ENTRADA_CONTRATOS))
+        except (KeyError, OSError, TypeError, ValueError) as erro:
+            return 400, {"erro": "instância não carregada: " + str(erro)}
+
+        with self.trava:
+            self.instancias[nome] = {
+                "df_projetos": df_projetos,
+                "df_detalhes_projetos": df_detalhes_projetos,
+                "projetos_excluidos": projetos_excluidos,
+                "df_contratos": df_contratos,
+                "df_id_contratos": df_id_contratos,
+                "populacao": None}  # genes da ultima populacao
+        return 200, {"instancia": nome, "projetos": len(df_projetos),
+                     "contratos": len(df_id_contratos) - 1}
+
+    def lista_instancias(self):
+        with self.trava:
+            return {nome: {"projetos": len(dados["df_projetos"]),
+                           "contratos": len(dados["df_id_contratos"]) - 1,
+                           "populacao": dados["populacao"] is not None}
+                    for nome, dados in self.instancias.items()}
+
+    def submete(self, pedido):
+        # valida o pedido e inclui o trabalho na fila
+        nome = pedido.get("instancia")
+        motor = pedido.get("motor", "genetico")
+        alteracoes = pedido.get("alteracoes", {})
+        if not isinstance(nome, str) or not isinstance(motor, str):
+            return 400, {"erro": "instancia e motor devem ser textos"}
+        if not isinstance(alteracoes, dict) or \
+                not all(isinstance(colunas, dict)
+                        for colunas in alteracoes.values()):
+            return 400, {"erro": "alteracoes deve ser um objeto "
+                                 "{contrato: {coluna: valor}}"}
+        for chave in ("numero_geracoes", "tempo_maximo"):
+            if pedido.get(chave) is not None and \
+                    not numero_valido(pedido[chave]):
+                return 400, {"erro": "valor não numérico: " + chave}
+        with self.trava:
+            if nome not in self.instancias:
+                return 404, {"erro": "instância não carregada: " + nome}
+            if motor not in MOTORES:
+                return 400, {"erro": "motor desconhecido: " + motor}
+            campos = set(self.instancias[nome]["df_contratos"]["Campo"])
+            for campo, colunas in alteracoes.items():
+                if campo not in campos or campo == "":
+                    return 400, {"erro": "contrato desconhecido: " + campo}
+                for coluna, valor in colunas.items():
+                    if coluna not in COLUNAS_ALTERAVEIS:
+                        return 400, {"erro": "coluna não alterável: " +
+                                             coluna}
+                    if not numero_valido(valor):
+                        return 400, {"erro": "valor não numérico: %s, %s"
+                                             % (campo, coluna)}
+
+            id_trabalho = str(self.proximo_id)
+            self.proximo_id += 1
+            self.trabalhos[id_trabalho] = {
+                "id": id_trabalho, "instancia": nome, "motor": motor,
+                "situacao": "na_fila", "pedido": pedido,
+                "cancelado": threading.Event(), "registro": [],
+                "inicio": None, "fim": None, "resultado": None,
+                "erro": None}
+        self.fila.put(id_trabalho)
+        return 202, {"id": id_trabalho, "situacao": "na_fila"}
+
+    def consulta(self, id_trabalho):
+        with self.trava:
+            if id_trabalho not in self.trabalhos:
+                return 404, {"erro": "trabalho desconhecido"}
+            return 200, situacao_trabalho(self.trabalhos[id_trabalho])
+
+    def lista_trabalhos(self):
+        with self.trava:
+            return [situacao_trabalho(t, resultado=False)
+                    for t in self.trabalhos.values()]
+
+    def cancela(self, id_trabalho):
+        with self.trava:
+            if id_trabalho not in self.trabalhos:
+                return 404, {"erro": "trabalho desconhecido"}
+            trabalho = self.trabalhos[id_trabalho]
+            trabalho["cancelado"].set()
+            if trabalho["situacao"] == "na_fila":
+                trabalho["situacao"] = "cancelado"
+            return 200, situacao_trabalho(trabalho, resultado=False)
+
+    def executa_trabalhos(self):
+        # executa os trabalhos da fila, um de cada vez
+        while True:
+            id_trabalho = self.fila.get()
+            if id_trabalho is None:
+                return
+            with self.trava:
+                trabalho = self.trabalhos[id_trabalho]
+                if trabalho["situacao"] == "cancelado":
+                    continue
+                trabalho["situacao"] = "executando"
+                trabalho["inicio"] = time.time()
+                dados = self.instancias[trabalho["instancia"]]
+            try:
+                resultado, genes = self.otimiza(trabalho, dados)
+                situacao = "cancelado" if trabalho["cancelado"].is_set() \
+                    else "concluido"
+                with self.trava:
+                    dados["populacao"] = genes
+                    trabalho["resultado"] = resultado
+                    trabalho["situacao"] = situacao
+            except Exception:
+                with self.trava:
+                    trabalho["erro"] = traceback.format_exc()
+                    trabalho["situacao"] = "erro"
+            trabalho["fim"] = time.time()
+
+    def otimiza(self, trabalho, dados):
+        # executa a otimizacao do trabalho, a partir da ultima populacao
+        # da instancia
+        pedido = trabalho["pedido"]
+        df_projetos = dados["df_projetos"]
+        df_id_contratos = dados["df_id_contratos"]
+        df_contratos = aplica_alteracoes(dados["df_contratos"],
+                                         pedido.get("alteracoes", {}))
+
+        distribuicao.cria_tipos_deap(len(df_id_contratos))
+        pop_inicial = None
+        if dados["populacao"] is not None:
+            # as alteracoes mudam a performance: os individuos sao
+            # avaliados novamente
+            pop_inicial = conv.monta_individuos(dados["populacao"], None)
+
+        # somente com a busca tabu, a populacao e apenas avaliada
+        numero_geracoes = pedido.get("numero_geracoes",
+                                     NUMERO_GERACOES_TRABALHO)
+        if trabalho["motor"] == "tabu":
+            numero_geracoes = 0
+        registro = trabalho["registro"]
+        pop, historico = distribuicao.executa_otimizacao(
+            df_id_contratos, df_contratos, df_projetos,
+            dados["projetos_excluidos"],
+            tamanho_populacao=self.tamanho_populacao,
+            numero_geracoes=numero_geracoes,
+            tempo_maximo=pedido.get("tempo_maximo"),
+            pop_inicial=pop_inicial, registro=registro,
+            cancelado=trabalho["cancelado"])
+        # o melhor individuo e comparado como na selecao
+        viabilidade = selecao.usa_selecao_viabilidade(
+            df_id_contratos, df_contratos, df_projetos)
+        melhor = selecao.melhor_individuo(pop, viabilidade)
+
+        estatisticas_tabu = None
+        if trabalho["motor"] != "genetico" and \
+                not trabalho["cancelado"].is_set():
+            genes, estatisticas_tabu = tabu.busca_tabu(
+                melhor, df_id_contratos, df_contratos, df_projetos,
+                dados["projetos_excluidos"],
+                tempo_maximo=pedido.get("tempo_maximo"), imprime=False)
+            toolbox, _ = distribuicao.configura_toolbox(
+                df_id_contratos, df_contratos, df_projetos)
+            melhor = toolbox.clone(melhor)
+            melhor[:] = genes
+            melhor.fitness.values = toolbox.evaluate(melhor)
+            # o resultado da busca tabu substitui o pior individuo
+            pop = selecao.ordena_melhores(pop, viabilidade)[0:len(pop) - 1] \
+                + [melhor]
+
+        genes_pop, _ = conv.compacta_individuos(pop)
+        return resultado_trabalho(melhor, df_id_contratos, df_projetos,
+                                  registro, estatisticas_tabu), genes_pop
+
+    def executa(self):
+        # atende as requisicoes ate o programa ser interrompido
+        try:
+            self.servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        self.fecha()
+
+    def fecha(self):
+        self.fila.put(None)
+        self.servidor.server_close()
+
+
+def numero_valido(valor):
+    # valores numericos finitos do pedido (true/false do JSON nao sao
+    # aceitos)
+    return isinstance(valor, (int, float)) and \
+        not isinstance(valor, bool) and bool(np.isfinite(valor))
+
+
+def aplica_alteracoes(df_contratos, alteracoes):
+    # copia dos contratos com as alteracoes do trabalho
+    df_contratos = df_contratos.copy()
+    for campo, colunas in alteracoes.items():
+        for coluna, valor in colunas.items():
+            df_contratos.loc[df_contratos["Campo"] == campo, coluna] = \
+                float(valor)
+    return df_contratos
+
+
+def resultado_trabalho(melhor, df_id_contratos, df_projetos, registro,
+                       estatisticas_tabu):
+    # melhor alocacao encontrada, com os desvios de cada contrato
+    campos = df_id_contratos.sort_values("ID_Contrato")["Campo"].tolist()
+    desvios = f_obj.tabela_desvios(melhor).values
+    return {"performance": f_obj.performance(melhor),
+            "valido": f_obj.individuo_valido(melhor),
+            "geracoes": len(registro),
+            "desvios": [{"contrato": campo,
+                         "obrigacao": linha[0], "minimo_externo": linha[1],
+                         "maximo_interno": linha[2]}
+                        for campo, linha in zip(campos, desvios.tolist())],
+            "alocacao": [[numero_anp, campos[contrato]] for numero_anp,
+                         contrato in zip(df_projetos["Número ANP"].tolist(),
+                                         np.asarray(melhor).tolist())],
+            "tabu": estatisticas_tabu}
+
+
+def situacao_trabalho(trabalho, resultado=True):
+    # dados do trabalho que podem ser enviados como JSON
+    situacao = {chave: trabalho[chave] for chave in
+                ("id", "instancia", "motor", "situacao", "inicio", "fim",
+                 "erro")}
+    situacao["geracao"] = len(trabalho["registro"])
+    if resultado:
+        situacao["resultado"] = trabalho["resultado"]
+    return situacao
+
+
+class ClienteServico:
+    def __init__(self, porta=PORTA_SERVICO, endereco=ENDERECO_SERVICO):
+        self.url = "http://%s:%i/" % (endereco, porta)
+
+    def requisicao(self, metodo, caminho, corpo=None):
+        dados = None if corpo is None else \
+            json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+        pedido = urllib.request.Request(
+            self.url + caminho, data=dados, method=metodo,
+            headers={"Content-Type": "application/json; charset=utf-8"})
+        try:
+            with urllib.request.urlopen(pedido) as resposta:
+                return json.loads(resposta.read())
+        except urllib.error.HTTPError as erro:
+            return json.loads(erro.read())
+
+    def carrega_instancia(self, planilha, nome=None, **abas):
+        return self.requisicao("POST", "instancias",
+                               dict(abas, planilha=planilha,
+                                    nome=nome or planilha))
+
+    def submete(self, instancia, alteracoes=None, **parametros):
+        return self.requisicao("POST", "trabalhos",
+                               dict(parametros, instancia=instancia,
+                                    alteracoes=alteracoes or {}))
+
+    def consulta(self, id_trabalho):
+        return self.requisicao("GET", "trabalhos/" + str(id_trabalho))
+
+    def cancela(self, id_trabalho):
+        return self.requisicao("DELETE", "trabalhos/" + str(id_trabalho))
+
+    def aguarda(self, id_trabalho, intervalo=0.5):
+        # consulta o trabalho ate terminar
+        while True:
+            situacao = self.consulta(id_trabalho)
+            if situacao.get("situacao") not in ("na_fila", "executando"):
+                return situacao
+            time.sleep(intervalo)
+
+
+def main():
+    # inicia o servico com a planilha de entrada de distribuicao.py
+    servico = ServicoOtimizacao()
+    codigo, resposta = servico.carrega_instancia(
+        {"nome": "RCA", "planilha": distribuicao.PLANILHA_DADOS_ENTRADA})
+    print(resposta)
+    print("Serviço em http://%s:%i/" % (ENDERECO_SERVICO, PORTA_SERVICO))
+    servico.executa()
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+Busca tabu sobre o mesmo modelo do algoritmo genetico, como alternativa
+para refinar uma solucao quando o algoritmo genetico estagna.
+
+A solucao e a mesma alocacao dos projetos nos contratos (um indice de
+contrato por projeto, com o contrato em branco para os projetos nao
+alocados), e o custo e a performance de funcao_objetivo (soma quadratica
+dos desvios das regras de negocio ativas).
+
+A busca mantem os totais EMPRESA/EXTERNO/INTERNO de cada contrato, em
+centavos (f_obj.prepara_centavos). A variacao do custo de um movimento
+depende apenas dos totais dos dois contratos envolvidos, e e calculada em
+O(1), vetorizada com numpy para todos os movimentos candidatos:
+    - realocacao: um projeto passa para outro contrato (ou para o
+      contrato em branco);
+    - troca: dois projetos em contratos diferentes trocam de contrato.
+
+A cada iteracao e aplicado o melhor movimento permitido, mesmo que piore a
+solucao. O contrato de onde o projeto saiu fica proibido (tabu) para este
+projeto durante algumas iteracoes; um movimento tabu e permitido quando
+produz uma solucao melhor que a melhor ja encontrada (aspiracao).
+
+"""
+import os
+import time
+import pickle
+
+import numpy as np
+
+import funcao_objetivo as f_obj
+
+# Definicao de constantes e parametros
+NUMERO_ITERACOES = 2000
+ITERACOES_SEM_MELHORIA = 500  # encerra a busca sem melhorar a solucao
+DURACAO_TABU = 20  # iteracoes em que o retorno ao contrato e proibido
+NUMERO_CANDIDATOS = 2000  # projetos avaliados para realocacao a cada iteracao
+NUMERO_TROCAS = 2000  # pares de projetos avaliados para troca a cada iteracao
+INTERVALO_IMPRESSAO = 200  # iteracoes entre as impressoes do progresso
+
+
+"""
+funcao: busca_tabu(individuo, indice_contratos, contratos, projetos,
+                   projetos_excluidos, numero_iteracoes, tempo_maximo,
+                   iteracoes_sem_melhoria, duracao_tabu, semente, imprime)
+
+  Objetivo: Executa a busca tabu a partir da alocacao inicial.
+
+  Parametros:
+             individuo: alocacao inicial dos projetos nos contratos;
+             indice_contratos, contratos, projetos: dados lidos da
+                 planilha de entrada, como em funcao_objetivo;
+             projetos_excluidos: posicoes dos projetos que nao sao movidos;
+             numero_iteracoes: numero maximo de iteracoes;
+             tempo_maximo: tempo maximo em segundos. None nao limita;
+             iteracoes_sem_melhoria: encerra apos este numero de iteracoes
+                                     sem melhorar a melhor solucao;
+             duracao_tabu: iteracoes em que um projeto nao pode voltar ao
+                           contrato de onde saiu;
+             semente: semente dos numeros aleatorios;
+             imprime: imprime o progresso da busca.
+
+  Retorna:
+          melhor: lista com a melhor alocacao encontrada;
+          estatisticas: dicionario com o custo inicial e final, as
+                        iteracoes, os movimentos avaliados e os movimentos
+                        avaliados por segundo.
+"""
+def busca_tabu(individuo, indice_contratos, contratos, projetos,
+               projetos_excluidos=(), numero_iteracoes=NUMERO_ITERACOES,
+               tempo_maximo=None,
+               iteracoes_sem_melhoria=ITERACOES_SEM_MELHORIA,
+               duracao_tabu=DURACAO_TABU, semente=None, imprime=True):
+    inicio = time.perf_counter()
+    rng = np.random.default_rng(semente)
+    dados = f_obj.prepara_centavos(indice_contratos, contratos, projetos)
+    num_contratos = dados["numero_contratos"]
+    num_classif = len(f_obj.CLASSIFICACOES)
+    limites, ativas = limites_com_contrato_em_branco(dados)
+
+    def custo(totais, contrato):
+        return custo_contratos(totais, contrato, limites, ativas)
+
+    # projetos com classificacao conhecida; os demais nao alteram o custo
+    genes = np.asarray(individuo, dtype=np.int64).copy()
+    posicoes = dados["posicoes"]
+    valores = dados["valores"].astype(np.int64)
+    classif = dados["classif"]
+    totais = np.zeros((num_contratos + 1, num_classif), dtype=np.int64)
+    np.add.at(totais, (genes[posicoes], classif), valores)
+
+    # projetos que podem ser movidos
+    moveis = ~np.isin(posicoes, np.asarray(projetos_excluidos, dtype=np.int64))
+    posicoes = posicoes[moveis]
+    valores = valores[moveis]
+    classif = classif[moveis]
+    alocacao = genes[posicoes]
+    num_moveis = len(posicoes)
+    # valor de cada projeto na coluna da sua classificacao
+    vetor = np.zeros((num_moveis, num_classif), dtype=np.int64)
+    vetor[np.arange(num_moveis), classif] = valores
+
+    todos_contratos = np.arange(num_contratos + 1)
+    custos = custo(totais, todos_contratos)
+    custo_atual = custos.sum()
+    custo_inicial = custo_atual
+    melhor_custo = custo_atual
+    melhor_alocacao = alocacao.copy()
+    # iteracao ate a qual o projeto nao pode voltar ao contrato
+    tabu_ate = np.zeros((num_moveis, num_contratos + 1), dtype=np.int64)
+
+    avaliados = 0
+    iteracao = 0
+    ultima_melhoria = 0
+    while num_moveis > 0 and iteracao < numero_iteracoes and \
+            iteracao - ultima_melhoria < iteracoes_sem_melhoria:
+        if tempo_maximo is not None and \
+                time.perf_counter() - inicio >= tempo_maximo:
+            break
+        iteracao += 1
+
+        # realocacao de projetos candidatos para todos os contratos
+        if num_moveis > NUMERO_CANDIDATOS:
+            cand = rng.choice(num_moveis, NUMERO_CANDIDATOS, replace=False)
+        else:
+            cand = np.arange(num_moveis)
+        origem = alocacao[cand]
+        delta_saida = custo(totais[origem] - vetor[cand], origem) - \
+            custos[origem]
+        delta_entrada = custo(totais[None, :, :] + vetor[cand][:, None, :],
+                              todos_contratos[None, :]) - custos[None, :]
+        delta = delta_saida[:, None] + delta_entrada
+        delta[np.arange(len(cand)), origem] = np.inf
+        permitido = (tabu_ate[cand] <= iteracao) | \
+            (custo_atual + delta < melhor_custo)
+        delta = np.where(permitido, delta, np.inf)
+        avaliados += delta.size
+        indice = np.argmin(delta)
+        melhor_delta = delta.flat[indice]
+        movimento = ("realocacao", cand[indice // delta.shape[1]],
+                     indice % delta.shape[1])
+
+        # troca de contrato entre pares de projetos
+        i = rng.integers(0, num_moveis, NUMERO_TROCAS)
+        j = rng.integers(0, num_moveis, NUMERO_TROCAS)
+        a = alocacao[i]
+        b = alocacao[j]
+        diferentes = a != b
+        i, j, a, b = i[diferentes], j[diferentes], a[diferentes], b[diferentes]
+        if len(i) > 0:
+            troca = vetor[j] - vetor[i]
+            delta_troca = custo(totais[a] + troca, a) - custos[a] + \
+                custo(totais[b] - troca, b) - custos[b]
+            permitido = ((tabu_ate[i, b] <= iteracao) &
+                         (tabu_ate[j, a] <= iteracao)) | \
+                (custo_atual + delta_troca < melhor_custo)
+            delta_troca = np.where(permitido, delta_troca, np.inf)
+            avaliados += len(i)
+            k = np.argmin(delta_troca)
+            if delta_troca[k] < melhor_delta:
+                melhor_delta = delta_troca[k]
+                movimento = ("troca", i[k], j[k])
+
+        if not np.isfinite(melhor_delta):
+            # todos os movimentos avaliados sao tabu
+            continue
+
+        # aplica o movimento
+        if movimento[0] == "realocacao":
+            _, p, destino = movimento
+            origem = alocacao[p]
+            totais[origem] -= vetor[p]
+            totais[destino] += vetor[p]
+            alocacao[p] = destino
+            tabu_ate[p, origem] = iteracao + duracao_tabu
+            alterados = [origem, destino]
+        else:
+            _, p, q = movimento
+            a, b = alocacao[p], alocacao[q]
+            totais[a] += vetor[q] - vetor[p]
+            totais[b] += vetor[p] - vetor[q]
+            alocacao[p], alocacao[q] = b, a
+            tabu_ate[p, a] = iteracao + duracao_tabu
+            tabu_ate[q, b] = iteracao + duracao_tabu
+            alterados = [a, b]
+        custos[alterados] = custo(totais[alterados],
+                                  np.asarray(alterados))
+        custo_atual = custos.sum()
+
+        if custo_atual < melhor_custo:
+            melhor_custo = custo_atual
+            melhor_alocacao = alocacao.copy()
+            ultima_melhoria = iteracao
+
+        if imprime and iteracao % INTERVALO_IMPRESSAO == 0:
+            print("Tabu %i - atual = %s  melhor = %s" %
+                  (iteracao, '{:,.0f}'.format(custo_atual / 1e4),
+                   '{:,.0f}'.format(melhor_custo / 1e4)))
+
+    tempo = time.perf_counter() - inicio
+    genes[posicoes] = melhor_alocacao
+    # custos em centavos ao quadrado, convertidos para R$ ao quadrado,
+    # como a performance
+    estatisticas = {"custo_inicial": custo_inicial / 1e4,
+                    "custo_final": melhor_custo / 1e4,
+                    "iteracoes": iteracao,
+                    "movimentos_avaliados": avaliados,
+                    "tempo": tempo,
+                    "movimentos_por_segundo":
+                        avaliados / tempo if tempo > 0 else 0.}
+    return genes.tolist(), estatisticas
+
+
+def limites_com_contrato_em_branco(dados):
+    # limites e regras ativas (f_obj.prepara_centavos), com uma linha para
+    # o contrato em branco, que nao tem nenhuma regra ativa (custo 0)
+    limites = np.vstack([dados["limites"], np.zeros((1, 3), dtype=np.int64)])
+    ativas = np.vstack([dados["ativas"], np.zeros((1, 3), dtype=bool)])
+    return limites, ativas
+
+
+def custo_contratos(totais, contrato, limites, ativas):
+    # custo (centavos ao quadrado) dos contratos com os totais informados
+    # (..., classificacao), como em f_obj.funcao_objetivo_centavos
+    d1 = totais.sum(axis=-1) - limites[contrato, 0]
+    d2 = totais[..., 1] - limites[contrato, 1]
+    d3 = np.minimum(limites[contrato, 2] - totais[..., 2], 0)
+    d1 = np.where(ativas[contrato, 0], d1, 0).astype(np.float64)
+    d2 = np.where(ativas[contrato, 1], d2, 0).astype(np.float64)
+    d3 = np.where(ativas[contrato, 2], d3, 0).astype(np.float64)
+    return d1 * d1 + d2 * d2 + d3 * d3
+
+
+"""
+funcao: le_solucao_inicial(nome_arquivo, numero_projetos)
+
+  Objetivo: Le a alocacao gravada em arquivo (ex.: melhor_individuo.rca),
+            para iniciar a busca tabu.
+
+  Retorna:
+          lista com a alocacao, ou None caso o arquivo nao exista ou seja
+          de uma planilha com outro numero de projetos.
+"""
+def le_solucao_inicial(nome_arquivo, numero_projetos):
+    if not os.path.isfile(nome_arquivo):
+        return None
+    with open(nome_arquivo, "rb") as arq:
+        individuo = pickle.load(arq)
+    if len(individuo) != numero_projetos:
+        print("Solução inicial de outra planilha de entrada, ignorada: " +
+              nome_arquivo)
+        return None
+    return list(individuo)
+
+
+def main():
+    # definir rotinas de testes para as funcoes do modulo
+    return
+
+
+if __name__ == "__main__":
+    main()
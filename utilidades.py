@@ -14,6 +14,9 @@ TAMANHO_HISTORICO_MELHORES_INDIVIDUOS = 500
 NOME_ABA_CONTRATOS_PLANILHA_SAIDA = "Contratos"
 NOME_ABA_PROJETOS_PLANILHA_SAIDA = "Projetos Distribuídos"
 NOME_ARQUIVO_MELHOR_INDIVIDUO = "melhor_individuo.rca"
+# respostas da coluna "Irá fazer parte do RCA?" que retiram o projeto da
+# distribuicao. Em branco (ou "Sim") o projeto participa normalmente
+RESPOSTAS_PROJETO_EXCLUIDO = ["não", "nao"]
 
 import os
 import pickle
@@ -47,6 +50,13 @@ def carrega_consolida_individuo(individuo, df_id_contratos,
     # cria uma lista com as informacoes do individuo passado
     individuo_lista = individuo[:]
 
+    # o individuo pode conter somente os projetos elegiveis (ver
+    # le_planilha_entrada): os projetos excluidos sao incluidos como
+    # nao alocados
+    if len(individuo_lista) < len(df_projetos):
+        individuo_lista = expande_individuo(individuo_lista, df_projetos,
+                                            len(df_id_contratos) - 1)
+
     # busca os nomes dos Contratos/Campos para carregar na alocacao
     # dos contratos
     df_individuo = pd.DataFrame(individuo_lista)
@@ -151,11 +161,16 @@ def le_planilha_entrada(planilha, aba_projetos, aba_contratos):
                                         "Irá fazer parte do RCA?", "Classif",
                                         "CONTRATO PRINC"]]
 
-    # ### ATENCAO ### *** DESABILITADO TEMPORARIAMENTE ***
     # retira os projetos que foram marcados para nao entrar na distribuicao
-    # pelo campo "Irá fazer parte do RCA?"
+    # pelo campo "Irá fazer parte do RCA?". O algoritmo genetico trabalha
+    # somente com os projetos elegiveis; na gravacao da planilha de saida
+    # o individuo e expandido para todos os projetos (expande_individuo)
+    excluidos = marca_projetos_excluidos(df_projetos["Irá fazer parte do RCA?"])
+    df_projetos = df_projetos[~excluidos].reset_index(drop=True)
+
+    # posicoes, no individuo, dos projetos que devem ficar sempre nao
+    # alocados (ver presolve). Os projetos marcados ja foram retirados
     projetos_excluidos = []
-    # projetos_excluidos = df_projetos["Irá fazer parte do RCA?"] == False
 
     # monta dataframe apenas com os campos necessários relacionados aos
     # projetos:  "Campo", "Obrigação - PETROBRAS", "Mínimo Externo",
@@ -183,6 +198,55 @@ def le_planilha_entrada(planilha, aba_projetos, aba_contratos):
            df_contratos.copy(), df_id_contratos.copy()
 
 
+"""
+funcao: marca_projetos_excluidos(parte_rca)
+
+  Objetivo: Identifica os projetos marcados para nao entrar na distribuicao.
+
+  Parametros:
+             parte_rca: valores da coluna "Irá fazer parte do RCA?".
+
+  Retorna:
+          array booleano, True para os projetos excluidos.
+"""
+def marca_projetos_excluidos(parte_rca):
+    return np.array([v is False or
+                     (isinstance(v, str) and
+                      v.strip().lower() in RESPOSTAS_PROJETO_EXCLUIDO)
+                     for v in parte_rca], dtype=bool)
+
+
+"""
+funcao: expande_individuo(individuo, df_projetos,
+                          id_contrato_projeto_nao_alocado)
+
+  Objetivo: Converte um individuo com somente os projetos elegiveis em uma
+            alocacao de todos os projetos, com os projetos excluidos no
+            contrato "vazio" (nao alocados).
+
+  Parametros:
+             individuo: alocacao dos projetos elegiveis;
+             df_projetos: dataframe com todos os projetos, incluindo a
+                          coluna "Irá fazer parte do RCA?";
+             id_contrato_projeto_nao_alocado: indice do contrato "vazio".
+
+  Retorna:
+          lista com a alocacao de todos os projetos.
+"""
+def expande_individuo(individuo, df_projetos,
+                      id_contrato_projeto_nao_alocado):
+    excluidos = marca_projetos_excluidos(df_projetos["Irá fazer parte do RCA?"])
+    if len(individuo) != np.count_nonzero(~excluidos):
+        raise ValueError("O individuo tem " + str(len(individuo)) +
+                         " projetos, mas a planilha tem " +
+                         str(np.count_nonzero(~excluidos)) +
+                         " projetos elegiveis")
+    alocacao = np.full(len(df_projetos), id_contrato_projeto_nao_alocado,
+                       dtype=np.int64)
+    alocacao[~excluidos] = individuo
+    return alocacao.tolist()
+
+
 """
 funcao: grava_planilha_saida(individuo, nome_planilha):
 
@@ -201,6 +265,11 @@ Retorna:
 """
 def grava_planilha_saida(individuo, nome_planilha, df_id_contratos,
                          df_contratos, df_projetos):
+    # os detalhes dos projetos podem ter carga tardia
+    # (instancia.DetalhesProjetos), e so sao lidos neste momento
+    if hasattr(df_projetos, "materializa"):
+        df_projetos = df_projetos.materializa()
+
     # carrega o individuo e consolida os valores relevantes
     df = carrega_consolida_individuo(individuo, df_id_contratos,
                                      df_contratos, df_projetos)